@@ -0,0 +1,309 @@
+# ======================================================================
+# Programm: admission
+# Beschreibung: Zugangskontrolle (Admission Control) zum Schutz der Datenbank:
+#               Rate-Limits mit Token-Buckets und Begrenzung gleichzeitiger Anfragen.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Token-Buckets: global, pro Client (angemeldeter Benutzer oder IP-Adresse) und pro Client
+#   und Route. Eine Anfrage wird nur zugelassen, wenn alle betroffenen Buckets ein Token haben;
+#   sonst wird sofort mit 429 und Retry-After geantwortet.
+# * Concurrency-Limits: Pro Endpunkt dürfen nur N Anfragen gleichzeitig laufen. Ist kein Platz
+#   frei, wird sofort mit 503 und Retry-After geantwortet, statt Arbeit aufzustauen.
+# * Backends: 'memory' (pro Prozess) oder 'sqlite' (eine lokale SQLite-Datei, die sich alle
+#   Worker-Prozesse eines Servers teilen).
+# ======================================================================
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import request, session
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+SWEEP_SIZE = 10000
+
+
+# ======================================================================
+# Backend im Speicher des Prozesses. Buckets: Schlüssel -> [Tokens, Zeitpunkt].
+# ======================================================================
+class MemoryBackend:
+    name = 'memory'
+
+    def __init__(self):
+        self._buckets = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    # Nimmt aus allen Buckets ein Token oder aus keinem. limits: Liste von (Schlüssel, Rate/s, Burst).
+    # Rückgabewert: 0, wenn erlaubt, sonst die Wartezeit in Sekunden bis zum nächsten Token.
+    def take(self, limits):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > SWEEP_SIZE:
+                self._sweep(now)
+            levels = []
+            wait = 0.0
+            for key, rate, burst in limits:
+                tokens, updated = self._buckets.get(key, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append((key, tokens))
+            if wait:
+                return wait
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - 1, now)
+            return 0.0
+
+    def _sweep(self, now):
+        # Entfernt Buckets, die seit mindestens einer Minute nicht verwendet wurden (wieder voll)
+        for key in [key for key, (_, updated) in self._buckets.items() if now - updated > 60]:
+            del self._buckets[key]
+
+    def levels(self, keys):
+        with self._lock:
+            return {key: round(self._buckets[key][0], 2) for key in keys if key in self._buckets}
+
+    def acquire(self, key, limit):
+        with self._lock:
+            if self._slots.get(key, 0) >= limit:
+                return False
+            self._slots[key] = self._slots.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._slots[key] -= 1
+
+    def in_use(self):
+        with self._lock:
+            return dict(self._slots)
+
+
+# ======================================================================
+# Backend mit einer lokalen SQLite-Datei (WAL-Modus), das sich alle Worker-Prozesse teilen.
+#
+# - buckets: Schlüssel, Tokens und Zeitpunkt (time.time()) pro Bucket.
+# - slots: Belegte Plätze pro Endpunkt und Prozess (pid). Plätze von beendeten Prozessen
+#   werden beim nächsten vollen Endpunkt freigegeben.
+# Jeder Thread verwendet eine eigene Verbindung.
+# ======================================================================
+class SQLiteBackend:
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._next_sweep = 0.0
+        connection = self._connection()
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+        connection.execute('CREATE TABLE IF NOT EXISTS slots (key TEXT, pid INTEGER, count INTEGER, PRIMARY KEY (key, pid))')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def take(self, limits):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            levels = []
+            wait = 0.0
+            for key, rate, burst in limits:
+                row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+                tokens, updated = row if row else (burst, now)
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append((key, tokens))
+            if not wait:
+                connection.executemany('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                                       [(key, tokens - 1, now) for key, tokens in levels])
+            if now >= self._next_sweep:
+                # Buckets, die seit einer Minute nicht verwendet wurden, sind wieder voll
+                self._next_sweep = now + 60
+                connection.execute('DELETE FROM buckets WHERE updated < ?', (now - 60,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def levels(self, keys):
+        connection = self._connection()
+        rows = connection.execute(f'SELECT key, tokens FROM buckets WHERE key IN ({",".join("?" * len(keys))})',
+                                  list(keys)).fetchall()
+        return {key: round(tokens, 2) for key, tokens in rows}
+
+    def acquire(self, key, limit):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            used = connection.execute('SELECT COALESCE(SUM(count), 0) FROM slots WHERE key = ?', (key,)).fetchone()[0]
+            if used >= limit:
+                used -= self._release_dead(connection, key)
+            allowed = used < limit
+            if allowed:
+                connection.execute('INSERT INTO slots (key, pid, count) VALUES (?, ?, 1) '
+                                   'ON CONFLICT (key, pid) DO UPDATE SET count = count + 1', (key, os.getpid()))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed
+
+    @staticmethod
+    def _release_dead(connection, key):
+        released = 0
+        for pid, count in connection.execute('SELECT pid, count FROM slots WHERE key = ?', (key,)).fetchall():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                connection.execute('DELETE FROM slots WHERE key = ? AND pid = ?', (key, pid))
+                released += count
+            except PermissionError:
+                pass
+        return released
+
+    def release(self, key):
+        self._connection().execute('UPDATE slots SET count = count - 1 WHERE key = ? AND pid = ?', (key, os.getpid()))
+
+    def in_use(self):
+        rows = self._connection().execute('SELECT key, SUM(count) FROM slots GROUP BY key').fetchall()
+        return {key: count for key, count in rows}
+
+
+# ======================================================================
+# Die Zugangskontrolle einer App (app.extensions['admission']).
+#
+# Attribute:
+# - backend: MemoryBackend oder SQLiteBackend.
+# - global_limit / client_limit: (Rate pro Sekunde, Burst) oder None.
+# - route_limits: 'endpoint' oder 'METHODE endpoint' -> (Rate, Burst), pro Client.
+# - concurrency: Endpunkt -> maximale Anzahl gleichzeitiger Anfragen.
+# - rejected: Zähler der abgelehnten Anfragen pro Grund (pro Prozess).
+# ======================================================================
+class Admission:
+    def __init__(self, backend, global_limit=None, client_limit=None, route_limits=None, concurrency=None):
+        self.backend = backend
+        self.global_limit = global_limit
+        self.client_limit = client_limit
+        self.route_limits = dict(route_limits or {})
+        self.concurrency = dict(concurrency or {})
+        self.rejected = {}
+        self._lock = threading.Lock()
+
+    def _reject(self, reason):
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+    def limits_for(self, endpoint, method, client):
+        limits = []
+        if self.global_limit:
+            limits.append(('global', *self.global_limit))
+        if self.client_limit:
+            limits.append((f'client:{client}', *self.client_limit))
+        route = self.route_limits.get(f'{method} {endpoint}') or self.route_limits.get(endpoint)
+        if route:
+            limits.append((f'route:{endpoint}:{client}', *route))
+        return limits
+
+    # Wird vor jeder Anfrage aufgerufen und löst bei leerem Bucket TooManyRequests (429) aus.
+    def check_rate(self):
+        endpoint = request.endpoint
+        if endpoint is None or endpoint == 'static':
+            return
+        limits = self.limits_for(endpoint, request.method, client_id())
+        wait = self.backend.take(limits) if limits else 0
+        if wait:
+            self._reject('rate')
+            raise TooManyRequests(retry_after=max(1, math.ceil(wait)))
+
+    def limit_concurrency(self, endpoint, view):
+        limit = self.concurrency[endpoint]
+        key = f'concurrency:{endpoint}'
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.backend.acquire(key, limit):
+                self._reject('concurrency')
+                raise ServiceUnavailable(retry_after=1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                self.backend.release(key)
+        return wrapper
+
+    def status(self, client):
+        keys = ['global', f'client:{client}'] + [f'route:{endpoint.split(" ")[-1]}:{client}'
+                                                 for endpoint in self.route_limits]
+        with self._lock:
+            rejected = dict(self.rejected)
+        return {
+            "backend": self.backend.name,
+            "client": client,
+            "limits": {
+                "global": self.global_limit,
+                "client": self.client_limit,
+                "routes": self.route_limits,
+                "concurrency": self.concurrency,
+            },
+            "tokens": self.backend.levels(keys),
+            "in_flight": {key.split(':', 1)[1]: count for key, count in self.backend.in_use().items()},
+            "rejected": rejected,
+        }
+
+
+# Client einer Anfrage: angemeldeter Benutzer (aus der Session, ohne Datenbankzugriff) oder IP-Adresse.
+def client_id():
+    user_id = session.get('_user_id')
+    return f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+
+
+# ======================================================================
+# Aktiviert die Zugangskontrolle. Muss nach dem Registrieren der Blueprints und vor
+# init_singleflight() aufgerufen werden, damit wartende (zusammengefasste) Anfragen
+# keine Concurrency-Plätze belegen.
+#
+# Konfiguration:
+# - ADMISSION_ENABLED: Ein/aus.
+# - ADMISSION_BACKEND: 'memory' oder 'sqlite' (Datei ADMISSION_SQLITE_PATH, Default: instance/admission.db).
+# - RATELIMIT_GLOBAL, RATELIMIT_CLIENT: (Rate pro Sekunde, Burst).
+# - RATELIMIT_ROUTES: {'POST auth.login': (0.2, 5), ...}
+# - CONCURRENCY_LIMITS: {'api.get_vms': 8, ...}
+# ======================================================================
+def init_admission(app):
+    if not app.config.get('ADMISSION_ENABLED', True):
+        return None
+    choice = app.config.get('ADMISSION_BACKEND', 'memory')
+    if choice == 'memory':
+        backend = MemoryBackend()
+    elif choice == 'sqlite':
+        path = app.config.get('ADMISSION_SQLITE_PATH') or os.path.join(app.instance_path, 'admission.db')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        backend = SQLiteBackend(path)
+    else:
+        raise ValueError(f'Unknown ADMISSION_BACKEND {choice!r}')
+
+    admission = Admission(backend,
+                          global_limit=app.config.get('RATELIMIT_GLOBAL'),
+                          client_limit=app.config.get('RATELIMIT_CLIENT'),
+                          route_limits=app.config.get('RATELIMIT_ROUTES'),
+                          concurrency=app.config.get('CONCURRENCY_LIMITS'))
+    for endpoint in admission.concurrency:
+        if endpoint not in app.view_functions:
+            raise RuntimeError(f'CONCURRENCY_LIMITS: unknown endpoint {endpoint!r}')
+        app.view_functions[endpoint] = admission.limit_concurrency(endpoint, app.view_functions[endpoint])
+    app.before_request(admission.check_rate)
+    app.extensions['admission'] = admission
+    return admission
@@ -0,0 +1,299 @@
+# ======================================================================
+# Programm: audit
+# Beschreibung: Write-Behind Audit-Log für alle Änderungen an Benutzern und VMs.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Die Änderungen werden über SQLAlchemy-Events (after_flush) auf Feldebene erfasst.
+# * Erst nach einem erfolgreichen COMMIT werden sie in eine begrenzte Queue gelegt,
+#   bei einem ROLLBACK werden sie verworfen.
+# * Ein Hintergrund-Thread schreibt die Einträge gesammelt (Batch-INSERT) in die
+#   Tabelle 'AuditLog'. Der Schreibpfad der Anfrage macht damit keinen zusätzlichen
+#   Datenbankzugriff.
+# ! Ist die Queue voll, werden Einträge verworfen (dropped) statt die Anfrage zu blockieren.
+# ======================================================================
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+
+from flask import current_app, has_app_context, has_request_context, session as flask_session
+from sqlalchemy import event, insert, inspect
+
+logger = logging.getLogger(__name__)
+
+MASKED_FIELDS = frozenset({'password'})
+MASK = '***'
+
+
+# ======================================================================
+# Diese Klasse schreibt Audit-Einträge im Hintergrund in die Datenbank.
+#
+# Attribute:
+# - audited: Die Modelle, deren Änderungen protokolliert werden.
+# - batch_size: Maximale Anzahl Einträge pro INSERT.
+# - interval: Maximale Wartezeit in Sekunden, bis ein unvollständiger Batch geschrieben wird.
+# - maxsize: Grösse der Queue. Ist sie voll, wird der Eintrag verworfen und 'dropped' erhöht.
+#
+# Der Thread wird erst beim ersten Eintrag gestartet (und nach einem fork neu gestartet),
+# damit Worker-Prozesse mit vorgeladener App jeweils einen eigenen Thread haben.
+# ======================================================================
+class AuditWriter:
+    def __init__(self, app, db, table, audited, batch_size=500, interval=1.0, maxsize=10000):
+        self.app = app
+        self.db = db
+        self.table = table
+        self.audited = tuple(audited)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+        self.written = 0
+        self._engine = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def submit(self, entries):
+        self._ensure_started()
+        for entry in entries:
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid is not None:
+                # Nach einem fork: Queue und Engine des Elternprozesses nicht weiterverwenden
+                self.queue = queue.Queue(maxsize=self.queue.maxsize)
+                self._engine = None
+            self._stop.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect(self.interval)
+            if batch:
+                self._write(batch)
+
+    def _collect(self, timeout):
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        try:
+            if self._engine is None:
+                with self.app.app_context():
+                    self._engine = self.db.engine
+            with self._engine.begin() as connection:
+                connection.execute(insert(self.table), batch)
+            self.written += len(batch)
+        except Exception:
+            logger.exception('Failed to write %d audit entries', len(batch))
+
+    # Wird beim Beenden des Prozesses aufgerufen: Thread stoppen und Rest der Queue schreiben.
+    def stop(self, timeout=5.0):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        while True:
+            batch = self._collect(0)
+            if not batch:
+                break
+            self._write(batch)
+
+
+def _json_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _field_value(key, value):
+    return MASK if key in MASKED_FIELDS else _json_value(value)
+
+
+def _current_actor_id():
+    # Flask-Login legt die ID in der Session ab; so muss der Benutzer nicht geladen werden.
+    if has_request_context():
+        user_id = flask_session.get('_user_id')
+        return int(user_id) if user_id is not None else None
+    return None
+
+
+def _snapshot(state):
+    return {attr.key: _field_value(attr.key, state.dict[attr.key])
+            for attr in state.mapper.column_attrs if attr.key in state.dict}
+
+
+def _normalize(column, value):
+    # Gleicht den Typ an die Spalte an (z.B. '10' aus einem Formular für eine INTEGER-Spalte),
+    # damit unveränderte Werte nicht als Änderung protokolliert werden.
+    if value is None:
+        return None
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type not in (int, float, str) or isinstance(value, python_type):
+        return value
+    try:
+        return python_type(value)
+    except (TypeError, ValueError):
+        return value
+
+
+def _diff(state):
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        if not history.has_changes():
+            continue
+        column = attr.columns[0]
+        old = _normalize(column, history.deleted[0] if history.deleted else None)
+        new = _normalize(column, history.added[0] if history.added else None)
+        if old == new:
+            continue
+        changes[attr.key] = [_field_value(attr.key, old), _field_value(attr.key, new)]
+    return changes
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _row_entry(action, table_name, record_id, changes, actor_id, now):
+    return {
+        "created_at": now,
+        "actor_id": actor_id,
+        "action": action,
+        "table_name": table_name,
+        "record_id": record_id,
+        "changes": json.dumps(changes, default=str),
+    }
+
+
+def _entry(action, state, changes, actor_id, now):
+    # Neue Objekte haben im after_flush noch keinen Identity-Key, aber bereits ihre ID
+    return _row_entry(action, state.mapper.persist_selectable.name,
+                      state.mapper.primary_key_from_instance(state.obj())[0], changes, actor_id, now)
+
+
+def _current_writer():
+    return current_app.extensions.get('audit') if has_app_context() else None
+
+
+def enabled():
+    return _current_writer() is not None
+
+
+def collect_changes(session, flush_context):
+    writer = _current_writer()
+    if writer is None:
+        return
+    entries = session.info.setdefault('audit_pending', [])
+    actor_id = _current_actor_id()
+    now = _now()
+    for obj in session.new:
+        if isinstance(obj, writer.audited):
+            state = inspect(obj)
+            entries.append(_entry('insert', state, _snapshot(state), actor_id, now))
+    for obj in session.dirty:
+        if isinstance(obj, writer.audited):
+            state = inspect(obj)
+            changes = _diff(state)
+            if changes:
+                entries.append(_entry('update', state, changes, actor_id, now))
+    for obj in session.deleted:
+        if isinstance(obj, writer.audited):
+            state = inspect(obj)
+            entries.append(_entry('delete', state, _snapshot(state), actor_id, now))
+
+
+def submit_changes(session):
+    entries = session.info.pop('audit_pending', None)
+    writer = _current_writer()
+    if entries and writer is not None:
+        writer.submit(entries)
+
+
+def discard_changes(session):
+    session.info.pop('audit_pending', None)
+
+
+# ======================================================================
+# Protokolliert Zeilen, die ohne ORM per Core-INSERT geschrieben wurden (z.B. der VM-Import).
+# Diese laufen nicht durch after_flush und müssen deshalb nach dem COMMIT hier übergeben werden.
+#
+# Parameter:
+# - table_name: Name der Tabelle (z.B. 'VM').
+# - rows: Die committeten Zeilen als Dictionaries, jeweils inklusive 'id'.
+# ======================================================================
+def record_inserts(table_name, rows):
+    writer = _current_writer()
+    if writer is None or not rows:
+        return
+    actor_id = _current_actor_id()
+    now = _now()
+    writer.submit([_row_entry('insert', table_name, row['id'],
+                              {key: _field_value(key, value) for key, value in row.items()}, actor_id, now)
+                   for row in rows])
+
+
+# ======================================================================
+# Registriert die Audit-Events auf einer Session (bzw. scoped_session oder sessionmaker).
+# Mehrfache Aufrufe für dieselbe Session registrieren die Events nur einmal.
+#
+# Ablauf:
+# - after_flush: Erfasst INSERT/UPDATE/DELETE mit den geänderten Feldern in session.info.
+# - after_commit: Übergibt die gesammelten Einträge an den Writer der aktuellen App.
+# - after_rollback: Verwirft die gesammelten Einträge.
+# ======================================================================
+def install_listeners(session):
+    for name, listener in (('after_flush', collect_changes),
+                           ('after_commit', submit_changes),
+                           ('after_rollback', discard_changes)):
+        if not event.contains(session, name, listener):
+            event.listen(session, name, listener)
+
+
+# ======================================================================
+# Erstellt den Audit-Writer für eine App und registriert die Events auf db.session.
+#
+# Parameter:
+# - app: Flask-Anwendung (Konfiguration AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_SIZE).
+# - db: Flask-SQLAlchemy-Instanz.
+# - model: Das AuditLog-Modell.
+# - audited: Die Modelle, deren Änderungen protokolliert werden.
+# ======================================================================
+def init_audit(app, db, model, audited):
+    writer = AuditWriter(app, db, model.__table__, audited,
+                         batch_size=app.config.get('AUDIT_BATCH_SIZE', 500),
+                         interval=app.config.get('AUDIT_FLUSH_INTERVAL', 1.0),
+                         maxsize=app.config.get('AUDIT_QUEUE_SIZE', 10000))
+    install_listeners(db.session)
+    atexit.register(writer.stop)
+    app.extensions['audit'] = writer
+    return writer
@@ -0,0 +1,100 @@
+# ======================================================================
+# Programm: benchmarks.api_serialization
+# Beschreibung: Misst die CPU-Zeit pro Zeile für /api/vms und /api/users:
+#               - ORM: Modelle laden, in Dictionaries kopieren, json der Standardbibliothek
+#                 (so wie die Routen früher gearbeitet haben).
+#               - Core + stdlib: Spalten-SELECT ohne ORM-Objekte, Standard-JSON-Provider.
+#               - Core + orjson: Spalten-SELECT ohne ORM-Objekte, orjson-Provider.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# Aufruf (im Projektverzeichnis):
+# - python benchmarks/api_serialization.py --vms 20000 --users 2000
+# ======================================================================
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import jsonify  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from app import create_app  # noqa: E402
+from extensions import db  # noqa: E402
+from models import User, VM  # noqa: E402
+
+
+def populate(app, vms, users):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {"id": i + 1, "firstname": f'first-{i}', "lastname": f'last-{i}', "birthday": f'b-{i}',
+             "username": f'user-{i}', "email": f'user-{i}@example.com', "password": 'x'}
+            for i in range(users)])
+        db.session.execute(insert(VM), [
+            {"name": f'vm-{i}', "description": 'Lorem ipsum dolor sit amet ' * 8, "cpu": 2, "ram": 4, "hdd": 40,
+             "ipv4_num": 0x0A000000 + i, "mac_num": 0x020000000000 + i, "user_id": i % users + 1}
+            for i in range(vms)])
+        db.session.commit()
+
+
+def orm_vms():
+    vms = VM.query.all()
+    return jsonify([{"1_id": vm.id, "2_name": vm.name, "3_cpu": vm.cpu, "4_ram": vm.ram, "5_hdd": vm.hdd,
+                     "6_ipv4": vm.ipv4, "7_description": vm.description, "8_author": vm.author.username}
+                    for vm in vms])
+
+
+def orm_users():
+    users = User.query.all()
+    return jsonify([{"id": user.id, "Username": user.username, "Firstname": user.firstname,
+                     "Lastname": user.lastname, "E-Mail": user.email, "Birthday": user.birthday}
+                    for user in users])
+
+
+# Gibt die kleinste CPU-Zeit (Sekunden) über mehrere Durchläufe zurück
+def measure(app, call, repeat):
+    times = []
+    for _ in range(repeat):
+        with app.test_request_context():
+            start = time.process_time()
+            response = call()
+            response.get_data()
+            times.append(time.process_time() - start)
+            db.session.remove()
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vms', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        uri = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        apps = {name: create_app({'SQLALCHEMY_DATABASE_URI': uri, 'JSON_PROVIDER': provider})
+                for name, provider in (('stdlib', 'stdlib'), ('orjson', 'auto'))}
+        populate(apps['stdlib'], args.vms, args.users)
+        views = apps['stdlib'].view_functions
+        if type(apps['orjson'].json).__name__ != 'OrjsonProvider':
+            print('orjson is not installed, the last column uses the standard provider')
+
+        for label, rows, orm_call, endpoint in (('/api/vms', args.vms, orm_vms, 'api.get_vms'),
+                                                ('/api/users', args.users, orm_users, 'api.get_users')):
+            orm = measure(apps['stdlib'], orm_call, args.repeat)
+            core = measure(apps['stdlib'], views[endpoint], args.repeat)
+            fast = measure(apps['orjson'], views[endpoint], args.repeat)
+            print(f'{label} ({rows} rows), CPU time per row')
+            print(f'  ORM + stdlib json   {orm / rows * 1e6:8.2f} us')
+            print(f'  Core + stdlib json  {core / rows * 1e6:8.2f} us   ({orm / core:.1f}x)')
+            print(f'  Core + orjson       {fast / rows * 1e6:8.2f} us   ({orm / fast:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# ======================================================================
+# Programm: benchmarks.import_time
+# Beschreibung: Misst die Startzeit der Anwendung (Import von app.py und create_app())
+#               in frischen Python-Prozessen, so wie sie ein Web-Worker oder ein
+#               CLI-Aufruf erlebt.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# Aufruf (im Projektverzeichnis):
+# - python benchmarks/import_time.py            (10 Durchläufe)
+# - python benchmarks/import_time.py -n 20 --top 15
+# ======================================================================
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Misst im Kindprozess die Zeit für den Import von app.py und für create_app()
+MEASURE = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(imported - start, created - start)
+"""
+
+
+def run_once(env):
+    output = subprocess.run([sys.executable, '-c', MEASURE], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    import_time, startup_time = output.split()
+    return float(import_time), float(startup_time)
+
+
+# Liest die Ausgabe von "python -X importtime" und gibt die langsamsten Top-Level-Importe zurück
+def slowest_imports(env, top):
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app; app.create_app()'],
+                            cwd=ROOT, env=env, check=True, capture_output=True, text=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Verschachtelte Importe sind eingerückt; gezählt werden nur die direkten Importe
+        if not name[1:].startswith(' '):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help='Anzahl der langsamsten Importe')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    results = [run_once(env) for _ in range(args.runs)]
+    imports = [r[0] * 1000 for r in results]
+    startups = [r[1] * 1000 for r in results]
+    print(f'{args.runs} runs')
+    print(f'import app      min {min(imports):7.1f} ms   median {statistics.median(imports):7.1f} ms')
+    print(f'create_app()    min {min(startups):7.1f} ms   median {statistics.median(startups):7.1f} ms')
+    print('\nslowest top-level imports (cumulative):')
+    for cumulative, name in slowest_imports(env, args.top):
+        print(f'{cumulative / 1000:9.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    main()
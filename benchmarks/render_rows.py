@@ -0,0 +1,63 @@
+# ======================================================================
+# Programm: benchmarks.render_rows
+# Beschreibung: Misst die Renderzeit von view_vms.html für viele Zeilen, einmal mit
+#               leerem und einmal mit gefülltem Fragment-Cache.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# Aufruf (im Projektverzeichnis):
+# - python benchmarks/render_rows.py --rows 10000
+# ======================================================================
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import render_template  # noqa: E402
+
+from app import create_app  # noqa: E402
+
+
+def fake_vms(count):
+    author = SimpleNamespace(id=1, username='admin', version=1)
+    return [SimpleNamespace(id=i, version=1, user_id=author.id, name=f'vm-{i}', cpu=2, ram=4, hdd=40,
+                            ipv4=f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}',
+                            mac=f'02:00:00:{i >> 16 & 255:02x}:{i >> 8 & 255:02x}:{i & 255:02x}',
+                            author=author)
+            for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'FRAGMENT_CACHE_SIZE': args.rows})
+    vms = fake_vms(args.rows)
+    with app.test_request_context('/view_vms'):
+        render_template('view_vms.html', vms=vms[:1])  # Template kompilieren bzw. aus dem Bytecode-Cache laden
+        cache = app.jinja_env.fragment_cache
+        cold = []
+        for _ in range(args.repeat):
+            cache.clear()
+            start = time.perf_counter()
+            render_template('view_vms.html', vms=vms)
+            cold.append(time.perf_counter() - start)
+        warm = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            html = render_template('view_vms.html', vms=vms)
+            warm.append(time.perf_counter() - start)
+
+    print(f'{args.rows} rows, {len(html) / 1024:.0f} KiB HTML')
+    print(f'empty fragment cache   {min(cold) * 1000:8.1f} ms')
+    print(f'filled fragment cache  {min(warm) * 1000:8.1f} ms   ({min(cold) / min(warm):.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+# ======================================================================
+# Programm: blueprints
+# Beschreibung: Die Routen der Anwendung, aufgeteilt in Blueprints. Registriert
+#               werden sie in create_app() (app.py).
+#
+# - main: Startseite und Test-Mail.
+# - auth: Registrierung, Login und Logout.
+# - vms: VMs erstellen, anzeigen, bearbeiten und löschen.
+# - users: Benutzer anzeigen, bearbeiten und löschen.
+# - api: JSON-API.
+# - errors: Fehlerseiten.
+# ======================================================================
@@ -0,0 +1,443 @@
+# ======================================================================
+# Programm: blueprints.api
+# Beschreibung: JSON-API für VMs, Benutzer, Audit-Log und den VM-Import.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import io
+import json
+import os
+import uuid
+from operator import itemgetter
+
+from flask import Blueprint, abort, current_app, request, jsonify, send_file, url_for
+from flask_login import current_user, login_required
+from sqlalchemy import select
+
+import inet
+import jobs
+import microcache
+import profiling
+import vm_import
+from admission import client_id
+from extensions import db
+from models import User, VM, AuditLog, Job
+from sharding import chunked, current_shards
+
+bp = Blueprint('api', __name__)
+
+MAX_LIST_LIMIT = 500  # Obergrenze für ?limit= der Listen-Endpunkte
+
+# =======================================================================================
+# Felder der JSON-API für ?fields=.
+#
+# Jeder Eintrag: Feldname -> (Schlüssel in der JSON-Antwort, Spalte, Umwandlung oder None).
+# Die Reihenfolge entspricht der Standardausgabe ohne ?fields=. Die Schlüssel bleiben dieselben
+# wie bisher, damit bestehende Clients nicht angepasst werden müssen.
+# =======================================================================================
+VM_FIELDS = {
+    "id": ("1_id", VM.id, None),
+    "name": ("2_name", VM.name, None),
+    "cpu": ("3_cpu", VM.cpu, None),
+    "ram": ("4_ram", VM.ram, None),
+    "hdd": ("5_hdd", VM.hdd, None),
+    "ipv4": ("6_ipv4", VM.ipv4_num, inet.int_to_ipv4),
+    "description": ("7_description", VM.description, None),
+    "author": ("8_author", User.username, None),
+}
+
+USER_FIELDS = {
+    "id": ("id", User.id, None),
+    "username": ("Username", User.username, None),
+    "firstname": ("Firstname", User.firstname, None),
+    "lastname": ("Lastname", User.lastname, None),
+    "email": ("E-Mail", User.email, None),
+    "birthday": ("Birthday", User.birthday, None),
+}
+
+
+# Liest ?fields=a,b,c und gibt die ausgewählten Einträge zurück (ohne Parameter: alle Felder).
+# Unbekannte Felder lösen einen ValueError aus.
+def _selected_fields(registry):
+    raw = request.args.get('fields')
+    if not raw:
+        return list(registry.values())
+    names = list(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    if not names:
+        raise ValueError('No fields requested')
+    unknown = [name for name in names if name not in registry]
+    if unknown:
+        raise ValueError(f"Unknown fields {', '.join(unknown)}; allowed: {', '.join(registry)}")
+    return [registry[name] for name in names]
+
+
+# Liest ?limit= (Default: default) und begrenzt den Wert auf 1..MAX_LIST_LIMIT.
+def _list_limit(default=50):
+    return min(max(request.args.get('limit', default, type=int), 1), MAX_LIST_LIMIT)
+
+
+# Liest ?ids=1,2,3 und gibt die IDs in der angefragten Reihenfolge zurück (None ohne Parameter).
+# Ungültige IDs oder mehr als API_MAX_IDS IDs lösen einen ValueError aus.
+def _requested_ids():
+    raw = request.args.get('ids')
+    if raw is None:
+        return None
+    try:
+        ids = [int(part) for part in raw.split(',') if part.strip()]
+    except ValueError:
+        raise ValueError('ids must be a comma-separated list of integers')
+    if not ids:
+        raise ValueError('No ids requested')
+    limit = current_app.config['API_MAX_IDS']
+    if len(ids) > limit:
+        raise ValueError(f'At most {limit} ids per request')
+    return ids
+
+
+# Baut aus den Zeilen eines Spalten-SELECT die JSON-Objekte. Die Zeilen sind reine Tupel aus
+# einer Core-Abfrage (keine ORM-Objekte). Die Kodierung übernimmt app.json (orjson).
+# overrides: Index -> Umwandlung, ersetzt die Umwandlung aus der Feldliste.
+def _rows_to_dicts(fields, rows, overrides=None):
+    keys = [key for key, _, _ in fields]
+    converters = {index: convert for index, (_, _, convert) in enumerate(fields) if convert is not None}
+    converters = list({**converters, **(overrides or {})}.items())
+    items = []
+    for row in rows:
+        values = list(row)
+        for index, convert in converters:
+            if values[index] is not None:
+                values[index] = convert(values[index])
+        items.append(dict(zip(keys, values)))
+    return items
+
+
+# =======================================================================================
+# Diese API-Route gibt eine Liste aller virtuellen Maschinen (VMs) mit detaillierten Informationen in JSON-Format zurück.
+#
+# Ablauf:
+# - @bp.route("/api/vms", methods=['GET']): Diese Route akzeptiert GET-Anfragen und gibt eine JSON-Liste 
+#   der virtuellen Maschinen mit detaillierten Informationen zurück.
+#
+# Ablauf der Funktion:
+# - Optional ?fields=id,name,ipv4: Nur diese Felder werden ausgegeben und auch nur diese Spalten gelesen
+#   (erlaubt: id, name, cpu, ram, hdd, ipv4, description, author). Unbekannte Felder ergeben 400.
+# - Der JOIN auf die Tabelle 'User' wird nur gemacht, wenn 'author' angefordert wird.
+# - Mit Shards läuft die Abfrage parallel auf allen Shards, die Ergebnisse werden nach ID zusammengeführt.
+#   Die Benutzernamen werden danach mit einer IN-Abfrage aus der Hauptdatenbank gelesen.
+# - Optional ?cidr=10.4.0.0/22: Nur VMs aus diesem Subnetz (BETWEEN über den Index auf ipv4_num).
+#   Ein ungültiges Netz ergibt 400 mit einer Fehlermeldung.
+# - Optional ?ids=7,3,12: Nur diese VMs, in der angefragten Reihenfolge. Gelesen wird mit IN-Listen
+#   (je höchstens 500 IDs, mit Shards auf allen Shards parallel). Für nicht gefundene IDs steht
+#   {"1_id": <id>, "not_found": true} an ihrer Stelle. Höchstens API_MAX_IDS IDs pro Anfrage.
+# - return jsonify(vms_list): Konvertiert die Liste der VMs in JSON und gibt sie als API-Antwort zurück.
+#
+# Rückgabewert:
+# - Gibt eine JSON-Liste zurück, die alle VMs mit ihrer ID, ihrem Namen, CPU, RAM, Festplattenspeicher (HDD),
+#   IPv4-Adresse, Beschreibung und dem Benutzernamen des Erstellers enthält (bzw. nur die gewählten Felder).
+# =======================================================================================
+@bp.route("/api/vms", methods=['GET'])
+def get_vms():
+    try:
+        fields = _selected_fields(VM_FIELDS)
+        ids = _requested_ids()
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    shards = current_shards()
+    columns = [column for _, column, _ in fields]
+    author = next((index for index, column in enumerate(columns) if column is User.username), None)
+    if shards.sharded and author is not None:
+        # 'User' liegt nicht auf den Shards: user_id lesen und die Namen danach nachschlagen.
+        columns[author] = VM.user_id
+    # Die ID steht vorne (für den Merge bzw. die Zuordnung zu ?ids=) und wird nicht ausgegeben.
+    columns.insert(0, VM.id)
+    statement = select(*columns).select_from(VM).order_by(VM.id)
+    if author is not None and not shards.sharded:
+        statement = statement.join(User, VM.user_id == User.id)
+    cidr = request.args.get('cidr')
+    if cidr:
+        try:
+            first, last = inet.cidr_range(cidr)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+        statement = statement.where(VM.ipv4_num.between(first, last))
+
+    if ids is None:
+        rows = shards.select(statement, key=itemgetter(0))
+    else:
+        rows = []
+        for part in chunked(dict.fromkeys(ids)):
+            rows.extend(shards.select(statement.where(VM.id.in_(part)), key=itemgetter(0)))
+    overrides = None
+    if shards.sharded and author is not None:
+        overrides = {author: shards.usernames(row[author + 1] for row in rows).get}
+    vms_list = _rows_to_dicts(fields, [row[1:] for row in rows], overrides)
+    if ids is not None:
+        found = {row[0]: item for row, item in zip(rows, vms_list)}
+        id_key = VM_FIELDS['id'][0]
+        vms_list = [found.get(vm_id) or {id_key: vm_id, "not_found": True} for vm_id in ids]
+    return jsonify(vms_list)
+
+# =======================================================================================
+# Diese API-Route gibt eine Liste aller Benutzer in JSON-Format zurück.
+#
+# Ablauf:
+# - @bp.route("/api/users", methods=['GET']): Diese Route akzeptiert GET-Anfragen und gibt eine JSON-Liste 
+#   der Benutzer zurück.
+#
+# Ablauf der Funktion:
+# - Optional ?fields=id,username: Nur diese Felder bzw. Spalten werden gelesen und ausgegeben
+#   (erlaubt: id, username, firstname, lastname, email, birthday). Unbekannte Felder ergeben 400.
+# - Das Passwort wird nie gelesen.
+# - return jsonify(user_list): Konvertiert die Liste der Benutzer in JSON und gibt sie als API-Antwort zurück.
+#
+# Rückgabewert:
+# - Gibt eine JSON-Liste zurück, die alle Benutzer mit ID, Benutzername, Vorname, Nachname, E-Mail und
+#   Geburtsdatum enthält (bzw. nur die gewählten Felder).
+# =======================================================================================
+@bp.route("/api/users", methods=['GET'])
+def get_users():
+    try:
+        fields = _selected_fields(USER_FIELDS)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    statement = select(*(column for _, column, _ in fields)).select_from(User)
+    user_list = _rows_to_dicts(fields, db.session.connection().execute(statement))
+    return jsonify(user_list)
+
+# =======================================================================================
+# Diese API-Route gibt die VMs eines Benutzers zurück, ohne die Beziehung User.vms zu laden.
+#
+# Ablauf:
+# - Der Benutzer wird in der Hauptdatenbank gesucht (404, falls es ihn nicht gibt).
+# - Die VMs werden mit einer Abfrage über den Index auf VM.user_id gelesen, nur auf dem Shard des Besitzers.
+# - Optional ?fields= wie bei /api/vms. 'author' ist für alle VMs der Benutzername (ohne JOIN).
+# - Optional ?with_count=1: Zusätzlich 'vm_count'.
+# - Optional ?count_only=1: Nur 'vm_count' (COUNT über den Index), die VMs werden nicht gelesen.
+#
+# Rückgabewert:
+# - JSON: {"user_id": ..., "username": ..., "vms": [...], "vm_count": ...}
+# =======================================================================================
+@bp.route("/api/users/<int:user_id>/vms", methods=['GET'])
+def get_user_vms(user_id):
+    username = db.session.execute(select(User.username).where(User.id == user_id)).scalar()
+    if username is None:
+        return jsonify(error=f'User {user_id} not found'), 404
+    shards = current_shards()
+    result = {"user_id": user_id, "username": username}
+    if request.args.get('count_only') in ('1', 'true'):
+        result["vm_count"] = shards.count_for_owner(user_id)
+        return jsonify(result)
+    try:
+        fields = _selected_fields(VM_FIELDS)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    columns = [VM.user_id if column is User.username else column for _, column, _ in fields]
+    author = next((index for index, (_, column, _) in enumerate(fields) if column is User.username), None)
+    statement = select(*columns).where(VM.user_id == user_id).order_by(VM.id)
+    rows = shards.session(shards.shard_for(user_id)).connection().execute(statement).all()
+    overrides = {author: lambda _: username} if author is not None else None
+    result["vms"] = _rows_to_dicts(fields, rows, overrides)
+    if request.args.get('with_count') in ('1', 'true'):
+        result["vm_count"] = len(rows)
+    return jsonify(result)
+
+# =======================================================================================
+# Diese API-Route gibt das Audit-Log seitenweise in JSON-Format zurück (neueste Einträge zuerst).
+#
+# Ablauf:
+# - @login_required: Nur angemeldete Benutzer dürfen das Audit-Log lesen.
+# - Query-Parameter: page, per_page (maximal 500), optional table (z.B. 'VM') und record_id.
+# - AuditLog.query.paginate(): Lädt nur die angeforderte Seite aus der Datenbank.
+#
+# Rückgabewert:
+# - JSON mit den Einträgen der Seite sowie page, pages und total.
+# =======================================================================================
+@bp.route("/api/audit", methods=['GET'])
+@login_required
+def get_audit():
+    query = AuditLog.query.order_by(AuditLog.id.desc())
+    table = request.args.get('table')
+    record_id = request.args.get('record_id', type=int)
+    if table:
+        query = query.filter_by(table_name=table)
+    if record_id is not None:
+        query = query.filter_by(record_id=record_id)
+    page = query.paginate(per_page=request.args.get('per_page', 50, type=int), max_per_page=500)
+    items = [{"id": entry.id, "created_at": entry.created_at.isoformat(), "actor_id": entry.actor_id,
+              "action": entry.action, "table": entry.table_name, "record_id": entry.record_id,
+              "changes": json.loads(entry.changes)} for entry in page.items]
+    return jsonify(items=items, page=page.page, pages=page.pages, total=page.total)
+
+# =======================================================================================
+# Diese API-Route importiert VMs aus einer hochgeladenen CSV- oder NDJSON-Datei.
+#
+# Ablauf:
+# - @bp.route("/api/vms/import", methods=['POST']): Erwartet die Datei im Formularfeld 'file'.
+# - @login_required: Nur angemeldete Benutzer dürfen importieren. Zeilen ohne 'owner' gehören dem aktuellen Benutzer.
+# - Query-Parameter: format (csv/ndjson, sonst anhand des Dateinamens), batch_size, dry_run=1.
+# - Der Upload wird als Text-Stream gelesen; grosse Uploads legt Werkzeug in einer temporären Datei ab.
+# - Mit JOBS_OFFLOAD wird die Datei in JOBS_FILES_DIR gespeichert und als Job importiert (nicht bei dry_run).
+#
+# Rückgabewert:
+# - JSON mit der Anzahl gelesener, eingefügter und abgelehnter Zeilen sowie den ersten Fehlern.
+# - Mit JOBS_OFFLOAD: 202 mit der Job-ID (siehe /api/jobs/<id>).
+# =======================================================================================
+@bp.route("/api/vms/import", methods=['POST'])
+@login_required
+def import_vms_upload():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify(error="No file uploaded in field 'file'"), 400
+    try:
+        fmt = request.args.get('format') or vm_import.detect_format(upload.filename)
+        batch_size = request.args.get('batch_size', 1000, type=int)
+        dry_run = request.args.get('dry_run') in ('1', 'true')
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1')
+        if current_app.config['JOBS_OFFLOAD'] and not dry_run:
+            directory = current_app.config['JOBS_FILES_DIR'] or os.path.join(current_app.instance_path, 'job_files')
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{uuid.uuid4().hex}.{fmt}')
+            upload.save(path)
+            job = jobs.submit('import_vms', {"path": path, "fmt": fmt, "batch_size": batch_size,
+                                             "default_owner_id": current_user.id}, created_by=current_user.id)
+            return _job_accepted(job)
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8', newline='')
+        result = vm_import.import_vms(db.session, VM.__table__, stream, fmt,
+                                      vm_import.load_owner_map(db.session, User),
+                                      batch_size=batch_size, dry_run=dry_run,
+                                      default_owner_id=current_user.id,
+                                      partition=current_shards().partition)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify(error=str(e)), 400
+    if result.inserted and not dry_run:
+        microcache.purge()
+    return jsonify(result.to_dict())
+
+# =======================================================================================
+# Diese API-Routen reihen Hintergrund-Jobs ein und geben deren Fortschritt zurück (siehe jobs.py).
+#
+# Ablauf:
+# - POST /api/jobs: JSON {"kind": "recompute_inventory", "payload": {...}}. Erlaubt sind die Jobs in
+#   jobs.API_JOBS (delete_user, send_welcome_mails, recompute_inventory).
+# - GET /api/jobs/<id>: Status, Fortschritt (done/total/message), Ergebnis bzw. Fehler und Versuche.
+# - GET /api/jobs: Die neuesten Jobs (?status=, ?limit=, Default 50, höchstens MAX_LIST_LIMIT).
+# - @login_required: Nur angemeldete Benutzer.
+#
+# Rückgabewert:
+# - POST: 202 mit der Job-ID und der URL zum Abfragen; 400 bei unbekanntem Job oder Parametern, die
+#   nicht zum Job passen.
+# =======================================================================================
+def _job_accepted(job):
+    url = url_for('api.get_job', job_id=job.id)
+    return jsonify({"id": job.id, "status": job.status, "url": url}), 202, {'Location': url}
+
+@bp.route("/api/jobs", methods=['POST'])
+@login_required
+def submit_job():
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    payload = data.get('payload') or {}
+    if kind not in jobs.API_JOBS:
+        return jsonify(error=f'Unknown job {kind!r}, available: {", ".join(sorted(jobs.API_JOBS))}'), 400
+    if not isinstance(payload, dict):
+        return jsonify(error='payload must be an object'), 400
+    try:
+        job = jobs.submit(kind, payload, created_by=current_user.id)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    return _job_accepted(job)
+
+@bp.route("/api/jobs", methods=['GET'])
+@login_required
+def list_jobs():
+    query = Job.query.order_by(Job.id.desc())
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    return jsonify([jobs.to_dict(job) for job in query.limit(_list_limit())])
+
+@bp.route("/api/jobs/<int:job_id>", methods=['GET'])
+@login_required
+def get_job(job_id):
+    return jsonify(jobs.to_dict(db.get_or_404(Job, job_id)))
+
+# =======================================================================================
+# Diese API-Route gibt die Zähler des Single-Flight-Layers pro Endpunkt zurück (siehe singleflight.py).
+#
+# Rückgabewert:
+# - JSON: Endpunkt -> executed (Route ausgeführt), coalesced (Antwort einer laufenden Anfrage geteilt),
+#   grace_hits (fertige Antwort weiterverwendet), timeouts und bypassed (nicht zusammengefasst).
+# =======================================================================================
+@bp.route("/api/singleflight", methods=['GET'])
+@login_required
+def singleflight_stats():
+    return jsonify(current_app.extensions['singleflight'].stats())
+
+# =======================================================================================
+# Diese API-Route gibt den Zustand der Zugangskontrolle zurück (siehe admission.py).
+#
+# Rückgabewert:
+# - JSON: backend, client (eigener Client-Schlüssel), limits (konfigurierte Limits), tokens (verbleibende
+#   Tokens der eigenen Buckets), in_flight (laufende Anfragen pro Endpunkt) und rejected (abgelehnte
+#   Anfragen dieses Prozesses: rate = 429, concurrency = 503).
+# - 404, wenn die Zugangskontrolle ausgeschaltet ist.
+# =======================================================================================
+@bp.route("/api/admission", methods=['GET'])
+@login_required
+def admission_status():
+    admission = current_app.extensions.get('admission')
+    if admission is None:
+        abort(404)
+    return jsonify(admission.status(client_id()))
+
+# =======================================================================================
+# Diese API-Routen listen die aufgezeichneten Profile auf bzw. geben eine Profil-Datei zurück
+# (siehe profiling.py). Statt einer Anmeldung ist ein gültiges Profiling-Token nötig
+# ('flask profiling token', im Header X-Profile oder als ?_profile=).
+#
+# Rückgabewert:
+# - /api/profiles: JSON-Liste der neuesten Profile (?limit=, Default 50, höchstens MAX_LIST_LIMIT), neueste zuerst.
+# - /api/profiles/<name>: Zusammenfassung mit SQL- und Template-Zeitachse. Mit ?format=collapsed
+#   die Collapsed Stacks, mit ?format=speedscope die Datei für https://www.speedscope.app.
+# - 404, wenn das Profiling ausgeschaltet ist oder das Profil nicht existiert; 403 ohne gültiges Token.
+# =======================================================================================
+def _profiler():
+    profiler = current_app.extensions.get('profiling')
+    if profiler is None:
+        abort(404)
+    if profiling.verify_token(profiling.request_token()) is None:
+        abort(403)
+    return profiler
+
+@bp.route("/api/profiles", methods=['GET'])
+def list_profiles():
+    return jsonify(_profiler().recent(limit=_list_limit()))
+
+@bp.route("/api/profiles/<name>", methods=['GET'])
+def get_profile(name):
+    kind = {'json': 'json', 'collapsed': 'collapsed.txt', 'speedscope': 'speedscope.json'}.get(
+        request.args.get('format', 'json'))
+    path = _profiler().path_for(name, kind) if kind else None
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype='text/plain' if kind == 'collapsed.txt' else 'application/json')
+
+# ======================================================================
+# Diese Route behandelt den Endpunkt '/url_map'.
+#  Wenn darauf zugegriffen wird, gibt sie die URL-Map der Flask-Anwendung aus und liefert sie als JSON zurück.
+# ======================================================================
+@bp.route('/api/url_map')
+def work():
+    print(current_app.url_map)
+    # Return the url_map as JSON
+    urls = {}
+    for rule in current_app.url_map.iter_rules():
+        urls[str(rule)] = {
+            "endpoint": rule.endpoint,
+            "methods": list(rule.methods),
+            "defaults": rule.defaults,
+            "subdomain": rule.subdomain,
+        }   
+    # Die URL Map wird mittels eines JSON zurückgegeben und im Browser oder zum Beispiel Postman angezeigt
+    return jsonify(url_map=urls)
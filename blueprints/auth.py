@@ -0,0 +1,164 @@
+# ======================================================================
+# Programm: blueprints.auth
+# Beschreibung: Registrierung, Login und Logout.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+from flask import Blueprint, render_template, redirect, url_for, flash, make_response
+from flask_login import login_user, current_user, logout_user
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from flask_mail import Message
+
+import microcache
+from extensions import db, mail
+from forms import RegistrationForm, LoginForm
+from models import User
+
+bp = Blueprint('auth', __name__)
+
+# ======================================================================
+# Diese Funktion versendet eine Willkommens-E-Mail an den neuen Benutzer nach der Registrierung.
+#
+# Ablauf:
+# - msg = Message: Erstellt eine E-Mail-Nachricht mit einem Betreff, Absender und Empfänger.
+# - Der E-Mail-Text enthält eine persönliche Begrüßung, den Benutzernamen und einen Link zur Login-Seite.
+# - mail.send(msg): Sendet die E-Mail über den konfigurierten E-Mail-Server.
+#
+# Parameter:
+# - user: Das User-Objekt des neu registrierten Benutzers. Es enthält den Benutzernamen und die E-Mail-Adresse.
+# 
+# E-Mail-Inhalt:
+# - Eine Begrüßung mit dem Benutzernamen.
+# - Ein Link zur Login-Seite, über den der Benutzer auf sein Konto zugreifen kann.
+# - Informationen darüber, wie der Benutzer den Support kontaktieren kann.
+# ======================================================================
+def send_welcome_email(user):
+    msg = Message('Welcome to Our Service', 
+                  sender="sendermail", 
+                  recipients=[user.email])
+    msg.body = f'''Hi {user.username},
+
+Welcome to our platform! We are thrilled to have you join our community. 
+
+To get started, you can log in to your account using the link below:
+http://mkuvcid.ddns.net/login
+
+If you have any questions or need assistance, feel free to reach out to our support team.
+
+Thank you for choosing us, and we look forward to supporting you on your journey!
+
+Best regards,
+Martin Jeremias Künzler
+'''
+
+    mail.send(msg)
+
+# =======================================================================================
+# Diese Route ermöglicht es einem neuen Benutzer, ein Konto zu erstellen (Registrierung).
+# Die Route unterstützt sowohl GET- als auch POST-Anfragen.
+#
+# Ablauf:
+# - @bp.route("/register", methods=['GET', 'POST']): Diese Route akzeptiert GET-Anfragen, um das Registrierungsformular 
+#   anzuzeigen, und POST-Anfragen, um die übermittelten Registrierungsdaten zu verarbeiten.
+#
+# Ablauf der Funktion:
+# - form = RegistrationForm(): Initialisiert das Registrierungsformular.
+# - form.validate_on_submit(): Überprüft, ob das Formular korrekt ausgefüllt wurde und eine POST-Anfrage vorliegt.
+# - generate_password_hash(form.password.data, method='pbkdf2:sha256'): Hashes das eingegebene Passwort, bevor es in der 
+#   Datenbank gespeichert wird.
+# - user = User(...): Erstellt ein neues Benutzerobjekt mit den Formulardaten (Benutzername, E-Mail, Passwort, Vorname, Nachname, Geburtstag).
+# - db.session.add(user): Fügt den neuen Benutzer zur Datenbank hinzu.
+# - db.session.commit(): Speichert den neuen Benutzer in der Datenbank.
+# - send_welcome_email(user): Versendet eine Begrüßungs-E-Mail an den neuen Benutzer.
+# - flash('Your account has been created! You are now able to log in', 'success'): Zeigt eine Erfolgsmeldung nach erfolgreicher Registrierung an.
+# - return redirect(url_for('auth.login')): Leitet den Benutzer nach erfolgreicher Registrierung zur Login-Seite weiter.
+#
+# Rückgabewert:
+# - Bei einer GET-Anfrage: Gibt die HTML-Seite mit dem Registrierungsformular zurück.
+# - Bei einer erfolgreichen POST-Anfrage: Leitet den Benutzer nach erfolgreicher Registrierung zur Login-Seite weiter.
+# =======================================================================================
+@bp.route("/register", methods=['GET', 'POST'])
+def register():
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        hashed_password = generate_password_hash(form.password.data, method='pbkdf2:sha256')
+        print(hashed_password)
+        user = User(username=form.username.data, email=form.email.data, password=hashed_password, firstname=form.firstname.data, lastname=form.lastname.data, birthday=form.birthday.data)
+        db.session.add(user)
+        db.session.commit()
+        microcache.purge()
+        send_welcome_email(user)
+        flash('Your account has been created! You are now able to log in', 'success')
+        return redirect(url_for('auth.login'))
+    return render_template('register.html', form=form)
+
+# =======================================================================================
+# Diese Route ermöglicht es einem Benutzer, sich in der Anwendung anzumelden.
+# Die Route unterstützt sowohl GET- als auch POST-Anfragen.
+#
+# Ablauf:
+# - @bp.route("/login", methods=['GET', 'POST']): Diese Route akzeptiert GET-Anfragen zum Anzeigen 
+#   des Login-Formulars und POST-Anfragen zur Verarbeitung der Login-Daten.
+#
+# Ablauf der Funktion:
+# - current_user.is_authenticated: Wenn der Benutzer bereits eingeloggt ist, wird er zur Startseite umgeleitet.
+# - form = LoginForm(): Initialisiert das Login-Formular.
+# - form.validate_on_submit(): Überprüft, ob das Formular korrekt ausgefüllt wurde und eine POST-Anfrage vorliegt.
+# - user = User.query.filter_by(email=form.email.data).first(): Sucht den Benutzer anhand der E-Mail-Adresse.
+# - check_password_hash(user.password, form.password.data): Überprüft, ob das eingegebene Passwort mit dem in der Datenbank
+#   gespeicherten Passwort übereinstimmt.
+# - login_user(user): Loggt den Benutzer ein, wenn die E-Mail und das Passwort korrekt sind.
+# - flash('Login Unsuccessful. Please check email and password', 'danger'): Zeigt eine Fehlermeldung an, wenn die E-Mail 
+#   oder das Passwort falsch sind.
+# - return render_template('login.html', form=form): Zeigt bei einer GET-Anfrage oder einem fehlgeschlagenen Login-Versuch das 
+#   Login-Formular an.
+#
+# Rückgabewert:
+# - Bei einem erfolgreichen Login: Leitet den Benutzer zur Startseite um.
+# - Bei einer GET-Anfrage oder einem fehlgeschlagenen Login: Zeigt das Login-Formular mit einer möglichen Fehlermeldung an.
+# =======================================================================================
+@bp.route("/login", methods=['GET', 'POST'])
+def login():
+    if current_user.is_authenticated:
+        return redirect(url_for('main.home'))
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(email=form.email.data).first()
+        if user:
+            print("User found:", user.email)
+            if check_password_hash(user.password, form.password.data):
+                print("Password matches")
+                login_user(user)
+                return redirect(url_for('main.home'))
+            else:
+                print("Password does not match",user.password ,form.password.data)
+        else:
+            print("User not found")
+        flash('Login Unsuccessful. Please check email and password', 'danger')
+    return render_template('login.html', form=form)
+
+
+# =======================================================================================
+# Diese Route ermöglicht es einem Benutzer, sich abzumelden (Logout).
+#
+# Ablauf:
+# - @bp.route("/logout"): Diese Route akzeptiert GET-Anfragen, um den Benutzer abzumelden.
+#
+# Ablauf der Funktion:
+# - logout_user(): Flask-Login-Funktion, die die aktuelle Benutzersitzung beendet.
+# - response = make_response(redirect(url_for('main.home'))): Erstellt eine Antwort, die den Benutzer zur Startseite umleitet.
+# - response.set_cookie('username', '', expires=0): Löscht das 'username'-Cookie, indem es dessen Wert leert und es sofort ablaufen lässt.
+# - response.set_cookie('auth', '', expires=0): Löscht das 'auth'-Cookie, indem es dessen Wert leert und es sofort ablaufen lässt.
+#
+# Rückgabewert:
+# - Gibt eine Antwort zurück, die den Benutzer zur Startseite umleitet und gleichzeitig die Cookies 'username' und 'auth' löscht.
+# =======================================================================================
+@bp.route("/logout")
+def logout():
+    logout_user()
+    response = make_response(redirect(url_for('main.home')))
+    response.set_cookie('username', '', expires=0)
+    response.set_cookie('auth', '', expires=0)
+    return response
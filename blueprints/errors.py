@@ -0,0 +1,113 @@
+# ======================================================================
+# Programm: blueprints.errors
+# Beschreibung: Benutzerdefinierte Fehlerseiten für die ganze Anwendung.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+from flask import Blueprint, jsonify, render_template, request
+
+bp = Blueprint('errors', __name__)
+
+# =======================================================================================
+# Diese Funktion hilft dabei,
+# benutzerdefinierte Fehlermeldungen für den HTTP Error Code 400 (Bad Request)
+# anzuzeigen. Der Fehler 400 bedeutet, dass der Server die Anfrage aufgrund eines
+# fehlerhaften oder ungültigen Syntaxverständnisses nicht verarbeiten konnte. 
+# Dies kann passieren, wenn die Anfrage fehlerhafte Daten enthält oder 
+# das Anforderungsformat nicht den erwarteten Spezifikationen entspricht.
+#
+# Mit dieser Funktion wird dem Benutzer eine benutzerfreundliche Fehlermeldungsseite 
+# angezeigt, anstatt eine generische oder leere Fehlerseite. Diese Seite informiert 
+# den Benutzer darüber, dass die Anfrage nicht korrekt war und erklärt möglicherweise,
+# welche Schritte unternommen werden sollten, um die Anfrage zu korrigieren.
+# =======================================================================================
+
+@bp.app_errorhandler(400)
+def bad_request(e):
+    return render_template("error_400.html"), 400
+
+# =======================================================================================
+# Diese Funktion hilft dabei,
+# benutzerdefinierte Fehlermeldungen für den HTTP Error Code 404 (Not Found)
+# anzuzeigen. Der Fehler 404 bedeutet, dass die angeforderte Ressource 
+# auf dem Server nicht gefunden wurde. Dies kann passieren, wenn die URL falsch ist 
+# oder die Ressource entfernt wurde.
+#
+# Mit dieser Funktion wird dem Benutzer eine benutzerfreundliche Fehlermeldungsseite 
+# angezeigt, anstatt eine generische oder leere Fehlerseite. Die Seite informiert 
+# den Benutzer darüber, dass die angeforderte Seite oder Ressource nicht existiert 
+# und bietet möglicherweise eine Rückkehr zur Startseite oder andere Navigationsoptionen an.
+# =======================================================================================
+
+@bp.app_errorhandler(404)
+def page_not_found(e):
+    return render_template("error_404.html"), 404
+
+# =======================================================================================
+# Diese Funktion hilft dabei, 
+# benutzerdefinierte Fehlermeldungen für den HTTP Error Code 403 (Forbidden)
+# anzuzeigen. Der Fehler 403 bedeutet, dass der Server die Anfrage des Benutzers 
+# verstanden hat, aber die Berechtigung fehlt, um auf die angeforderte Ressource zuzugreifen.
+# Dies kann passieren, wenn der Benutzer keine ausreichenden Rechte hat 
+# oder wenn bestimmte Inhalte nur für bestimmte Benutzergruppen zugänglich sind.
+#
+# Mit dieser Funktion wird dem Benutzer eine benutzerfreundliche Fehlermeldungsseite 
+# angezeigt, anstatt eine generische oder leere Fehlerseite. Diese Seite informiert 
+# den Benutzer darüber, dass der Zugriff verweigert wurde, und bietet möglicherweise 
+# weitere Informationen oder Anweisungen.
+# =======================================================================================
+@bp.app_errorhandler(403)
+def forbidden(e):
+    return render_template("error_403.html"), 403
+
+# =======================================================================================
+# Diese Funktion hilft dabei, 
+# benutzerdefinierte Fehlermeldungen für den HTTP Error Code 405 (Method Not Allowed)
+# "Anfrage darf nur mit anderen HTTP-Methoden (zum Beispiel GET statt POST)
+# gestellt werden. Gültige Methoden für die betreffende Ressource werden 
+# im „Allow“-Header-Feld der Antwort übermittelt.)"
+# anzuzeigen und dem Benutzer 
+# eine benutzerfreundliche Fehlermeldungsseite zu präsentieren, 
+# anstatt eine generische oder leere Fehlerseite.
+# =======================================================================================
+@bp.app_errorhandler(405)
+def method_not_allowed(e):
+    return render_template("error_405.html"), 405
+
+# =======================================================================================
+# Diese Funktion hilft dabei, 
+# benutzerdefinierte Fehlermeldungen für den HTTPS Error Code 500 (Internal Server Error)
+# "Dies ist ein „Sammel-Statuscode“ für unerwartete Serverfehler."
+# anzuzeigen und dem Benutzer 
+# eine benutzerfreundliche Fehlermeldungsseite zu präsentieren, 
+# anstatt eine generische oder leere Fehlerseite.
+# =======================================================================================
+@bp.app_errorhandler(500)  # Dekorator, der Flask anweist, diese Funktion bei einem HTTP 500 Fehler aufzurufen
+def internal_server_error(e):  # Definiert eine Funktion, die bei einem 500 Fehler ausgeführt wird
+    return render_template("error_500.html"), 500  # Rendert die HTML-Vorlage 'error_500.html' und gibt den HTTP-Statuscode 500 zurück
+
+# =======================================================================================
+# Diese Funktionen zeigen die Fehler 429 (Too Many Requests) und 503 (Service Unavailable)
+# an, die von der Zugangskontrolle (admission.py) ausgelöst werden, wenn ein Rate-Limit
+# erreicht oder ein Endpunkt ausgelastet ist. Der Header Retry-After gibt an, nach wie
+# vielen Sekunden die Anfrage wiederholt werden kann.
+#
+# Die Antwort muss billig bleiben: Die Seiten erweitern base.html nicht (kein Laden des
+# angemeldeten Benutzers aus der Datenbank), und unter /api/ wird JSON zurückgegeben.
+# =======================================================================================
+def _overload(e, template):
+    retry_after = e.retry_after or 1
+    if request.path.startswith('/api/'):
+        response = jsonify({"error": e.name, "retry_after": retry_after})
+    else:
+        response = render_template(template, retry_after=retry_after)
+    return response, e.code, {'Retry-After': str(retry_after)}
+
+@bp.app_errorhandler(429)
+def too_many_requests(e):
+    return _overload(e, "error_429.html")
+
+@bp.app_errorhandler(503)
+def service_unavailable(e):
+    return _overload(e, "error_503.html")
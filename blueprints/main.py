@@ -0,0 +1,62 @@
+# ======================================================================
+# Programm: blueprints.main
+# Beschreibung: Startseite und Test-Mail.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+from flask import Blueprint, render_template, redirect, url_for, flash
+
+from flask_mail import Message
+
+from extensions import mail
+
+bp = Blueprint('main', __name__)
+
+# ======================================================================
+# Diese Funktion definiert die Route für die Startseite der Anwendung.
+# Sie wird sowohl für die Haupt-URL ("/") als auch für die URL "/home" verwendet.
+#
+# Ablauf:
+# - @bp.route("/"): Definiert die Route für die Startseite (Haupt-URL).
+# - @bp.route("/home"): Definiert eine alternative Route, die ebenfalls zur Startseite führt.
+# 
+# Rückgabewert:
+# - Die Funktion rendert das Template "index.html", das die Startseite der Anwendung darstellt.
+# ======================================================================
+@bp.route("/")
+@bp.route("/home")
+def home():
+    return render_template('index.html')
+
+# ======================================================================
+# Diese Route versendet eine Test-E-Mail über Flask-Mail.
+# 
+# Ablauf:
+# - Es wird eine Nachricht erstellt, die einen Absender, Empfänger und den Nachrichteninhalt enthält.
+# - Die Nachricht wird mit Flask-Mail über den SMTP-Server gesendet.
+# - Bei erfolgreichem Versand wird eine Erfolgsmeldung ausgegeben.
+# - Falls ein Fehler auftritt (z.B. Verbindungsfehler oder falsche SMTP-Daten), wird eine Fehlermeldung angezeigt.
+#
+# Ablauf der Funktionsweise:
+# - msg = Message: Erstellt die E-Mail-Nachricht mit Betreff, Absender und Empfänger.
+# - mail.send(msg): Sendet die Nachricht über den konfigurierten E-Mail-Server.
+# - flash('Email sent successfully!'): Informiert den Benutzer über den erfolgreichen Versand.
+# - flash(f'Failed to send email: {str(e)}'): Informiert den Benutzer, falls ein Fehler auftritt.
+# - redirect(url_for('main.home')): Leitet den Benutzer nach dem E-Mail-Versand zu einer anderen Route um.
+# ======================================================================
+@bp.route("/sendmail")
+def sendmail():
+    try:
+        # Erstelle die Nachricht
+        msg = Message('Hello from Flask', 
+                    sender='sender mail',  # Absender explizit angeben
+                    recipients=['recipiant'])  # Empfängeradresse einfügen
+        msg.body = 'This is a test email sent from a Flask app!'
+        mail.send(msg)  # E-Mail versenden
+
+        flash('Email sent successfully!', 'success')
+        return redirect(url_for('main.home'))  # Weiterleitung nach dem Senden der Mail
+    except Exception as e:
+        flash(f'Failed to send email: {str(e)}', 'danger')
+        return redirect(url_for('main.home'))  # Falls etwas schiefgeht
@@ -0,0 +1,151 @@
+# ======================================================================
+# Programm: blueprints.users
+# Beschreibung: Routen zum Anzeigen, Bearbeiten und Löschen von Benutzern.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request
+from flask_login import current_user, login_required
+
+import jobs
+import microcache
+from extensions import db
+from models import User
+from sharding import current_shards
+from templating import evict_fragments
+
+bp = Blueprint('users', __name__)
+
+# =======================================================================================
+# Diese Route zeigt eine Liste aller Benutzer aus der Datenbank an.
+#
+# Ablauf:
+# - @bp.route("/user"): Diese Route akzeptiert GET-Anfragen, um die Liste der Benutzer anzuzeigen.
+#
+# Ablauf der Funktion:
+# - users_data = User.query.all(): Diese Abfrage ruft alle in der Datenbank gespeicherten Benutzer ab.
+# - return render_template("user.html", users_data=users_data): Rendert das HTML-Template 'user.html'
+#   und übergibt die Liste der Benutzer als Variable 'users_data', damit diese in der Ansicht angezeigt 
+#   werden kann.
+#
+# Rückgabewert:
+# - Gibt die gerenderte HTML-Seite mit der Liste aller Benutzer zurück.
+# =======================================================================================
+@bp.route("/user")
+def user():
+    users_data = User.query.all()
+    return render_template("user.html", users_data=users_data)
+
+# =======================================================================================
+# Diese Route zeigt die Details eines einzelnen Benutzers basierend auf der übergebenen Benutzer-ID.
+#
+# Ablauf:
+# - @bp.route("/showUser/<int:user>"): Diese Route akzeptiert GET-Anfragen und erwartet eine Benutzer-ID 
+#   als Parameter, um den spezifischen Benutzer abzurufen und seine Details anzuzeigen.
+#
+# Ablauf der Funktion:
+# - cuser = User.query.filter_by(id=user): Sucht nach dem Benutzer mit der angegebenen ID in der Datenbank.
+#   - Wichtig: Hier fehlt das `.first()`, um das erste Ergebnis der Abfrage zurückzugeben. Andernfalls wird 
+#     eine Abfrage (Query) zurückgegeben und nicht der tatsächliche Benutzer.
+# - vm_count: Anzahl VMs des Benutzers (COUNT über den Index auf VM.user_id, ohne die VMs zu laden).
+#   Die Liste der VMs verlinkt auf /view_vms?owner=<id>.
+# - return render_template('showUser.html', showUser=cuser): Rendert das HTML-Template 'showUser.html' und 
+#   übergibt die Benutzerdaten als Variable 'showUser', damit die Details des Benutzers auf der Seite angezeigt 
+#   werden können.
+#
+# Rückgabewert:
+# - Gibt die gerenderte HTML-Seite mit den Details des gefundenen Benutzers zurück.
+# =======================================================================================
+@bp.route("/showUser/<int:user>")
+def userShow(user):
+    cuser = User.query.filter_by(id=user)
+    vm_count = current_shards().count_for_owner(user)
+    return render_template('showUser.html',showUser=cuser, vm_count=vm_count)
+
+# =======================================================================================
+# Diese Route ermöglicht es einem Benutzer, die Details eines vorhandenen Benutzers zu bearbeiten.
+# Die Route unterstützt sowohl GET- als auch POST-Anfragen, um Benutzerdaten zu laden und zu aktualisieren.
+#
+# Ablauf:
+# - @bp.route('/edit_user/<int:id>', methods=['GET', 'POST']): Diese Route akzeptiert GET- und POST-Anfragen.
+#   - GET: Lädt die Benutzerdaten zur Bearbeitung.
+#   - POST: Nimmt die vom Benutzer geänderten Daten entgegen und speichert sie in der Datenbank.
+#
+# Ablauf der Funktion:
+# - cuser = User.query.filter_by(id=id).first(): Sucht den Benutzer mit der angegebenen ID in der Datenbank.
+#   Falls kein Benutzer gefunden wird, gibt die Funktion eine 404-Fehlerseite zurück.
+# - Wenn die Anfrage eine POST-Anfrage ist, werden die im Formular übermittelten Daten verwendet, um die
+#   Benutzerdaten zu aktualisieren (E-Mail, Vorname, Nachname und Geburtstag).
+# - Der Benutzername wird nicht aktualisiert, da dieses Feld im Formular deaktiviert ist.
+# - db.session.commit(): Speichert die Änderungen in der Datenbank.
+# - Falls ein Fehler auftritt, wird die Datenbankoperation zurückgesetzt (Rollback) und eine Fehlermeldung ausgegeben.
+# - flash(f'User {cuser.username} updated successfully!'): Zeigt eine Erfolgsmeldung an, wenn der Benutzer erfolgreich aktualisiert wurde.
+# - redirect(url_for('users.user')): Leitet den Benutzer nach erfolgreicher Bearbeitung zur Benutzerübersicht weiter.
+#
+# Parameter:
+# - id: Die ID des zu bearbeitenden Benutzers. Diese wird als URL-Parameter übergeben.
+# =======================================================================================
+
+@bp.route('/edit_user/<int:id>', methods=['GET', 'POST'])
+def edit_user(id):
+    cuser = User.query.filter_by(id=id).first()  # Get the user from the database by ID
+    if not cuser:
+        return "User not found", 404
+
+    if request.method == 'POST':
+        # Update user details with form data, but don't update the username as it is disabled
+        cuser.email = request.form['email']
+        cuser.firstname = request.form['firstname']
+        cuser.lastname = request.form['lastname']
+        cuser.birthday = request.form['birthday']
+
+        try:
+            db.session.commit()  # Commit the changes to the database
+            microcache.purge()
+            flash(f'User {cuser.username} updated successfully!', 'success')
+            return redirect(url_for('users.user'))  # Redirect to the user list page
+        except Exception as e:
+            db.session.rollback()  # Rollback in case of an error
+            flash(f'Error updating user: {str(e)}', 'danger')
+
+    return render_template('edit_user.html', showUser=cuser)
+
+# =======================================================================================
+# Diese Route ermöglicht es einem autorisierten Benutzer (erfordert Anmeldung),
+# einen Benutzer aus der Datenbank zu löschen.
+#
+# Ablauf:
+# - @bp.route('/delete_user/<int:user_id>', methods=['POST']): Diese Route wird über eine POST-Anfrage
+#   aufgerufen, um einen Benutzer basierend auf der übergebenen Benutzer-ID zu löschen.
+# - @login_required: Stellt sicher, dass nur authentifizierte Benutzer diese Aktion ausführen können.
+#
+# Ablauf der Funktion:
+# - user_to_delete = User.query.get_or_404(user_id): Sucht nach dem Benutzer mit der angegebenen ID.
+#   Falls kein Benutzer mit dieser ID gefunden wird, wird eine 404-Fehlerseite angezeigt.
+# - Besitzt der Benutzer noch VMs (auch auf einem Shard) und ist JOBS_OFFLOAD gesetzt, werden der Benutzer
+#   und seine VMs von einem Hintergrund-Job gelöscht (jobs.py).
+# - jobs.delete_user_with_vms(user_to_delete): Sonst werden die VMs in Batches und danach der Benutzer
+#   direkt in der Anfrage gelöscht und die Änderungen gespeichert.
+# - evict_fragments('user_row', user_id): Entfernt die gecachte Tabellenzeile des Benutzers.
+# - microcache.purge(): Lädt die gecachten API-Listen in nginx im Hintergrund neu.
+# - flash('User has been deleted!'): Zeigt eine Erfolgsmeldung an, dass der Benutzer erfolgreich gelöscht wurde.
+# - redirect(url_for('users.user')): Leitet den Benutzer nach dem Löschen auf die Seite mit der Benutzerübersicht weiter.
+#
+# Parameter:
+# - user_id: Die ID des Benutzers, der gelöscht werden soll. Diese wird als URL-Parameter übergeben.
+# =======================================================================================
+@bp.route('/delete_user/<int:user_id>', methods=['POST'])
+@login_required
+def delete_user(user_id):
+    user_to_delete = User.query.get_or_404(user_id)
+    owned = current_shards().count_for_owner(user_id)
+    if owned and current_app.config['JOBS_OFFLOAD']:
+        job = jobs.submit('delete_user', {"user_id": user_id}, created_by=current_user.id)
+        flash(f'Deleting user {user_to_delete.username} and {owned} VMs in the background (job {job.id}).', 'info')
+        return redirect(url_for('users.user'))
+    jobs.delete_user_with_vms(user_to_delete)
+    evict_fragments('user_row', user_id)
+    microcache.purge()
+    flash('User has been deleted!', 'success')
+    return redirect(url_for('users.user'))
@@ -0,0 +1,206 @@
+# ======================================================================
+# Programm: blueprints.vms
+# Beschreibung: Routen zum Erstellen, Anzeigen, Bearbeiten und Löschen von VMs.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+from flask import Blueprint, render_template, redirect, url_for, flash, request, abort
+from flask_login import current_user, login_required
+from sqlalchemy.orm import object_session
+
+import inet
+import microcache
+from models import VM
+from sharding import current_shards
+from templating import evict_fragments
+
+bp = Blueprint('vms', __name__)
+
+# =======================================================================================
+# Diese Route ermöglicht es einem angemeldeten Benutzer, eine neue virtuelle Maschine (VM) zu erstellen.
+# Die Route unterstützt sowohl GET- als auch POST-Anfragen, um das Formular anzuzeigen und die eingegebenen Daten zu verarbeiten.
+#
+# Ablauf:
+# - @bp.route("/vm/new", methods=['GET', 'POST']): Diese Route akzeptiert GET-Anfragen, um das Formular für die VM-Erstellung
+#   anzuzeigen und POST-Anfragen, um die übermittelten Daten zu verarbeiten und die VM in der Datenbank zu speichern.
+# - @login_required: Stellt sicher, dass nur angemeldete Benutzer diese Route aufrufen können.
+#
+# Ablauf der Funktion:
+# - GET-Anfrage: Zeigt das Formular zur Erstellung einer neuen VM an.
+# - POST-Anfrage: 
+#     - Liest die vom Benutzer eingegebenen Daten (Name, CPU, Beschreibung, RAM, MAC-Adresse, IPv4-Adresse, Festplattenspeicher).
+#     - Erstellt ein neues VM-Objekt mit den eingegebenen Daten und dem aktuell angemeldeten Benutzer als Autor (current_user).
+#     - Ist die IPv4- oder MAC-Adresse ungültig, wird eine Fehlermeldung angezeigt und das Formular erneut gerendert.
+#     - Fügt die neue VM zur Datenbank (bzw. zum Shard des Benutzers, siehe sharding.py) hinzu und speichert die Änderungen.
+#     - Leitet den Benutzer nach erfolgreicher Erstellung zur VM-Übersicht weiter.
+# - return render_template('vms.html'): Zeigt das Formular zur Erstellung einer VM an, wenn es sich um eine GET-Anfrage handelt.
+#
+# Rückgabewert:
+# - Bei GET: Gibt die HTML-Seite mit dem Formular zur Erstellung einer neuen VM zurück.
+# - Bei POST: Leitet den Benutzer nach erfolgreicher VM-Erstellung zur VM-Übersicht weiter.
+# =======================================================================================
+
+@bp.route("/vm/new", methods=['GET', 'POST'])
+@login_required
+def new_vm():
+    if request.method == 'POST':
+        name = request.form['name']
+        cpu = request.form['cpu']
+        description = request.form['description']
+        ram = request.form['ram']
+        mac = request.form['mac']
+        ipv4 = request.form['ipv4']
+        hdd = request.form['hdd']
+        try:
+            vm = VM(name=name, description=description, user_id=current_user.id, cpu=cpu, ram=ram, mac=mac, ipv4=ipv4, hdd=hdd)
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return render_template('vms.html')
+        session = current_shards().add(vm)
+        session.commit()
+        microcache.purge()
+        return redirect(url_for('vms.view_vms'))  # Redirect to the VM list page or desired page
+    return render_template('vms.html')
+
+# =======================================================================================
+# Diese Route ermöglicht es dem Benutzer, eine Liste aller virtuellen Maschinen (VMs) anzuzeigen.
+#
+# Ablauf:
+# - @bp.route("/view_vms"): Diese Route akzeptiert GET-Anfragen, um die Liste der VMs anzuzeigen.
+#
+# Ablauf der Funktion:
+# - vms = current_shards().load_vms(): Ruft alle VMs ab (mit Shards parallel von allen Shards, nach ID sortiert).
+# - Optional ?cidr=10.4.0.0/22: Zeigt nur VMs aus diesem Subnetz an (BETWEEN über ipv4_num).
+#   Ein ungültiges Netz ergibt einen 400-Fehler.
+# - Optional ?owner=<user_id>: Zeigt nur die VMs dieses Benutzers an (Index auf VM.user_id).
+# - render_template("view_vms.html", vms=vms): Rendert das HTML-Template 'view_vms.html' und übergibt
+#   die Liste der VMs als Variable 'vms' an das Template, damit diese in der Ansicht angezeigt werden kann.
+#
+# Rückgabewert:
+# - Gibt die gerenderte HTML-Seite mit allen VMs zurück.
+# =======================================================================================
+
+@bp.route("/view_vms")
+def view_vms():
+    criteria = []
+    cidr = request.args.get('cidr')
+    if cidr:
+        try:
+            first, last = inet.cidr_range(cidr)
+        except ValueError:
+            abort(400)
+        criteria.append(VM.ipv4_num.between(first, last))
+    owner = request.args.get('owner', type=int)
+    if owner is not None:
+        criteria.append(VM.user_id == owner)
+    vms = current_shards().load_vms(*criteria)
+    return render_template("view_vms.html",vms=vms)
+
+# =======================================================================================
+# Diese Route zeigt die Details einer einzelnen virtuellen Maschine (VM) basierend auf der übergebenen ID.
+#
+# Ablauf:
+# - @bp.route("/showVM/<int:id>"): Diese Route akzeptiert GET-Anfragen und erwartet eine VM-ID als Parameter,
+#   um die spezifische VM abzurufen und anzuzeigen.
+#
+# Ablauf der Funktion:
+# - vm = current_shards().get(id): Sucht nach der VM mit der angegebenen ID (auf allen Shards).
+#   Das Template erwartet eine Liste, deshalb wird die VM (oder keine) als Liste übergeben.
+# - return render_template('showVM.html', showVM=cuser): Rendert das HTML-Template 'showVM.html' und übergibt
+#   die VM-Daten als Variable 'showVM', damit die Details der VM auf der Seite angezeigt werden können.
+#
+# Rückgabewert:
+# - Gibt die gerenderte HTML-Seite mit den Details der gefundenen VM zurück.
+# =======================================================================================
+@bp.route("/showVM/<int:id>")
+def showVM(id):
+    vm = current_shards().get(id)
+    return render_template('showVM.html',showVM=[vm] if vm else [])
+
+# =======================================================================================
+# Diese Route ermöglicht es einem Benutzer, eine bestehende virtuelle Maschine (VM) zu bearbeiten.
+# Die Route unterstützt sowohl GET- als auch POST-Anfragen, um die VM-Daten abzurufen und zu aktualisieren.
+#
+# Ablauf:
+# - @bp.route('/edit_vm/<int:id>', methods=['GET', 'POST']): Diese Route akzeptiert GET- und POST-Anfragen.
+#   - GET: Lädt die VM-Daten für die Bearbeitung.
+#   - POST: Nimmt die vom Benutzer geänderten Daten entgegen und speichert sie in der Datenbank.
+#
+# Ablauf der Funktion:
+# - cuser = current_shards().get(id): Sucht die VM mit der angegebenen ID (auf allen Shards).
+#   Falls keine VM gefunden wird, wird eine 404-Fehlermeldung zurückgegeben.
+# - Wenn die Anfrage eine POST-Anfrage ist, werden die im Formular übermittelten Daten verwendet, um die
+#   VM-Daten zu aktualisieren (z.B. Name, CPU, RAM, Festplattenspeicher, MAC-Adresse, IPv4-Adresse und Beschreibung).
+# - session.commit(): Speichert die Änderungen in der Datenbank bzw. auf dem Shard der VM (object_session).
+# - Falls ein Fehler auftritt, wird die Datenbankoperation zurückgesetzt (Rollback) und eine Fehlermeldung ausgegeben.
+# - flash('VM updated successfully!'): Zeigt eine Erfolgsmeldung an, wenn die VM erfolgreich aktualisiert wurde.
+# - redirect(url_for('vms.view_vms')): Leitet den Benutzer nach erfolgreicher Bearbeitung zur VM-Übersicht oder einer anderen Seite weiter.
+#
+# Parameter:
+# - id: Die ID der zu bearbeitenden virtuellen Maschine. Diese wird als URL-Parameter übergeben.
+# =======================================================================================
+@bp.route('/edit_vm/<int:id>', methods=['GET', 'POST'])
+def edit_vm(id):
+    cuser = current_shards().get(id)
+    if not cuser:
+        return "VM not found", 404
+    session = object_session(cuser)
+
+    if request.method == 'POST':
+        # Update the existing VM object with form data
+        cuser.name = request.form['name']
+        cuser.cpu = request.form['cpu']
+        cuser.description = request.form['description']
+        cuser.ram = request.form['ram']
+        cuser.hdd = request.form['hdd']
+
+        try:
+            cuser.mac = request.form['mac']
+            cuser.ipv4 = request.form['ipv4']
+            session.commit()  # Commit the changes to the database
+            microcache.purge()
+            flash('VM updated successfully!', 'success')
+            return redirect(url_for('vms.view_vms'))  # Redirect to the VM list page or desired page
+        except Exception as e:
+            session.rollback()  # Rollback the session in case of an error
+            flash(f'Error updating VM: {str(e)}', 'danger')
+
+    return render_template('edit_vm.html', showVM=cuser)
+
+# =======================================================================================
+# Diese Route ermöglicht es einem autorisierten Benutzer (erfordert Anmeldung),
+# eine virtuelle Maschine (VM) aus der Datenbank zu löschen.
+#
+# Ablauf:
+# - @bp.route('/delete_vm/<int:vm_id>', methods=['POST']): Diese Route wird über eine POST-Anfrage
+#   aufgerufen, um eine VM basierend auf der übergebenen VM-ID zu löschen.
+# - @login_required: Stellt sicher, dass nur authentifizierte Benutzer diese Aktion ausführen können.
+#
+# Ablauf der Funktion:
+# - vm_to_delete = current_shards().get(vm_id): Sucht nach der VM mit der angegebenen ID (auf allen Shards).
+#   Falls keine VM mit dieser ID gefunden wird, wird eine 404-Fehlerseite angezeigt.
+# - session.delete(vm_to_delete): Löscht die gefundene VM aus der Datenbank bzw. von ihrem Shard.
+# - session.commit(): Speichert die Änderungen (Löschung) in der Datenbank.
+# - evict_fragments('vm_row', vm_id): Entfernt die gecachte Tabellenzeile der VM.
+# - microcache.purge(): Lädt die gecachten API-Listen in nginx im Hintergrund neu.
+# - flash('VM has been deleted!'): Zeigt eine Erfolgsmeldung an, dass die VM erfolgreich gelöscht wurde.
+# - redirect(url_for('vms.view_vms')): Leitet den Benutzer nach dem Löschen zur Seite mit der VM-Übersicht weiter.
+#
+# Parameter:
+# - vm_id: Die ID der zu löschenden virtuellen Maschine. Diese wird als URL-Parameter übergeben.
+# =======================================================================================
+
+@bp.route('/delete_vm/<int:vm_id>', methods=['POST'])
+@login_required
+def delete_vm(vm_id):
+    vm_to_delete = current_shards().get(vm_id)
+    if vm_to_delete is None:
+        abort(404)
+    session = object_session(vm_to_delete)
+    session.delete(vm_to_delete)
+    session.commit()
+    evict_fragments('vm_row', vm_id)
+    microcache.purge()
+    flash('VM has been deleted!', 'success')
+    return redirect(url_for('vms.view_vms'))
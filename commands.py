@@ -0,0 +1,176 @@
+# ======================================================================
+# Programm: commands
+# Beschreibung: CLI-Befehle der Anwendung (flask <befehl>).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import os
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+import jobs
+import microcache
+import profiling
+import sharding
+import vm_import
+from extensions import db
+from models import User, VM
+
+# =======================================================================================
+# Dieser CLI-Befehl importiert VMs aus einer CSV- oder NDJSON-Datei.
+#
+# Aufruf:
+# - flask import-vms inventory.csv --batch-size 5000 --checkpoint inventory.ckpt
+#
+# Ablauf:
+# - Die Datei wird zeilenweise gelesen und jede Zeile validiert (siehe vm_import.validate_record).
+# - Die Besitzer (Spalte 'owner' = Benutzername) werden über eine einmal geladene Map aufgelöst.
+# - Gültige Zeilen werden in Batches eingefügt, nach jedem Batch wird committet.
+# - --dry-run: Validiert nur und schreibt nichts in die Datenbank.
+# - --checkpoint: Speichert nach jedem Batch die Position. Ein abgebrochener Import
+#   kann mit derselben Checkpoint-Datei fortgesetzt werden, solange die Datei unverändert ist.
+# - --owner: Benutzername für Zeilen ohne 'owner'-Spalte.
+# =======================================================================================
+@click.command('import-vms', help='Importiert VMs aus einer CSV- oder NDJSON-Datei.')
+@with_appcontext
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(vm_import.FORMATS), help='Default: anhand der Dateiendung.')
+@click.option('--batch-size', default=1000, show_default=True, type=click.IntRange(min=1))
+@click.option('--dry-run', is_flag=True, help='Nur validieren, nichts speichern.')
+@click.option('--checkpoint', type=click.Path(dir_okay=False), help='Checkpoint-Datei zum Fortsetzen.')
+@click.option('--owner', help='Benutzername für Zeilen ohne owner.')
+def import_vms_command(path, fmt, batch_size, dry_run, checkpoint, owner):
+    fmt = fmt or vm_import.detect_format(path)
+    owners = vm_import.load_owner_map(db.session, User)
+    default_owner_id = None
+    if owner:
+        if owner not in owners:
+            raise click.BadParameter(f'Unknown user {owner!r}', param_hint='--owner')
+        default_owner_id = owners[owner]
+
+    def report(result):
+        click.echo(f'{result.read} rows read, {result.inserted} inserted, {result.invalid + result.failed} rejected')
+
+    try:
+        with open(path, encoding='utf-8', newline='') as stream:
+            result = vm_import.import_vms(db.session, VM.__table__, stream, fmt, owners,
+                                          batch_size=batch_size, dry_run=dry_run,
+                                          checkpoint=vm_import.Checkpoint(checkpoint, path) if checkpoint else None,
+                                          default_owner_id=default_owner_id, on_batch=report,
+                                          partition=sharding.current_shards().partition)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for line, message in result.errors:
+        click.echo(f'line {line}: {message}', err=True)
+    if result.inserted and not dry_run:
+        microcache.purge(wait=True)
+
+
+# =======================================================================================
+# CLI-Befehle für die VM-Shards (siehe sharding.py).
+#
+# Aufruf:
+# - flask shards init: Legt die VM-Tabellen auf allen Shards an und initialisiert den ID-Zähler.
+# - flask shards status: Zeigt die Anzahl VMs und Besitzer pro Shard.
+# - flask shards move-owner <username> <shard>: Verschiebt alle VMs eines Besitzers auf einen anderen Shard.
+# =======================================================================================
+@click.group('shards', help='Verwaltet die VM-Shards.')
+def shards_command():
+    pass
+
+
+def _configured_shards():
+    shards = sharding.current_shards()
+    if not shards.sharded:
+        raise click.ClickException('No shards configured (VM_SHARDS is empty)')
+    return shards
+
+
+@shards_command.command('init', help='Legt die VM-Tabellen auf allen Shards an.')
+@with_appcontext
+def shards_init_command():
+    shards = _configured_shards()
+    sharding.init_shards(shards)
+    click.echo(f'Initialized {len(shards)} shards: {", ".join(shards.keys)}')
+
+
+@shards_command.command('status', help='Zeigt die Anzahl VMs und Besitzer pro Shard.')
+@with_appcontext
+def shards_status_command():
+    shards = _configured_shards()
+    statement = db.select(db.func.count(), db.func.count(db.distinct(VM.user_id))).select_from(VM)
+
+    def count(engine):
+        with engine.connect() as connection:
+            return connection.execute(statement).one()
+
+    for key, (vms, owners) in zip(shards.keys, shards.scatter(count)):
+        click.echo(f'{key}: {vms} VMs, {owners} owners')
+
+
+@shards_command.command('move-owner', help='Verschiebt alle VMs eines Besitzers auf einen anderen Shard.')
+@with_appcontext
+@click.argument('username')
+@click.argument('shard')
+@click.option('--batch-size', default=1000, show_default=True, type=click.IntRange(min=1))
+def shards_move_owner_command(username, shard, batch_size):
+    shards = _configured_shards()
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.BadParameter(f'Unknown user {username!r}', param_hint='USERNAME')
+    if shard not in shards.keys:
+        raise click.BadParameter(f'Unknown shard {shard!r}, configured: {", ".join(shards.keys)}', param_hint='SHARD')
+    try:
+        moved = sharding.move_owner(shards, user.id, shard, batch_size=batch_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Moved {moved} VMs of {username} to {shard}')
+
+
+# =======================================================================================
+# CLI-Befehle für das Profiling einzelner Anfragen (siehe profiling.py).
+#
+# Aufruf:
+# - flask profiling token --by mku: Erstellt ein signiertes Token. Anfragen mit dem Header
+#   'X-Profile: <token>' (oder ?_profile=<token>) werden profiliert; das Token berechtigt auch
+#   zum Lesen von /api/profiles. Gültig für PROFILING_TOKEN_MAX_AGE Sekunden.
+# =======================================================================================
+@click.group('profiling', help='Profiling einzelner Anfragen.')
+def profiling_command():
+    pass
+
+
+@profiling_command.command('token', help='Erstellt ein Token zum Profilieren von Anfragen.')
+@with_appcontext
+@click.option('--by', 'issued_to', default='cli', show_default=True, help='Name, der im Profil vermerkt wird.')
+def profiling_token_command(issued_to):
+    if not current_app.config.get('PROFILING_ENABLED'):
+        click.echo('Warning: PROFILING_ENABLED is off, the token has no effect until it is enabled.', err=True)
+    click.echo(profiling.create_token(current_app, issued_to))
+
+
+# =======================================================================================
+# Dieser CLI-Befehl startet die Worker für die Hintergrund-Jobs (siehe jobs.py).
+#
+# Aufruf:
+# - flask worker --concurrency 4
+#
+# Ablauf:
+# - Startet N Worker-Prozesse, jeder mit einer eigenen App, die die Jobs aus der Tabelle 'Job' abarbeiten.
+# - Läuft, bis der Prozess mit Ctrl+C oder SIGTERM beendet wird. Laufende Jobs werden noch fertig ausgeführt.
+# =======================================================================================
+@click.command('worker', help='Startet die Worker-Prozesse für die Hintergrund-Jobs.')
+@with_appcontext
+@click.option('--concurrency', type=click.IntRange(min=1), help='Anzahl Worker-Prozesse (Default: JOBS_CONCURRENCY oder Anzahl CPU-Kerne).')
+def worker_command(concurrency):
+    concurrency = concurrency or current_app.config['JOBS_CONCURRENCY'] or os.cpu_count() or 1
+    app = current_app._get_current_object()
+
+    def started(processes):
+        click.echo(f'Started {len(processes)} workers: {", ".join(str(process.pid) for process in processes)}')
+
+    jobs.run_worker(app, concurrency, on_start=started)
+    click.echo('Workers stopped')
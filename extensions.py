@@ -0,0 +1,67 @@
+# ======================================================================
+# Programm: extensions
+# Beschreibung: Flask-Erweiterungen, die ohne App erstellt und erst in create_app()
+#               mit init_app() an die Anwendung gebunden werden.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import click
+from flask_login import LoginManager
+from flask_mail import Mail
+from flask_sqlalchemy import SQLAlchemy
+
+# =======================================================================================
+# Erweiterungen, die in der Anwendung verwendet werden:
+#
+# 1. db = SQLAlchemy():
+#    - SQLAlchemy vereinfacht das Arbeiten mit relationalen Datenbanken und ermöglicht die Verwendung
+#      von Python-Klassen (Modelle), um Datenbanktabellen zu definieren und Abfragen auszuführen.
+#
+# 2. login_manager = LoginManager():
+#    - Flask-Login kümmert sich um das Verwalten von Benutzersitzungen, das Ein- und Ausloggen sowie den Schutz
+#      von Routen, die nur für angemeldete Benutzer zugänglich sind.
+#    - login_manager.login_view = 'auth.login': Standard-Login-Seite, zu der nicht-authentifizierte Benutzer
+#      umgeleitet werden, wenn sie versuchen, geschützte Bereiche zu betreten.
+#
+# 3. mail = Mail():
+#    - Flask-Mail ermöglicht das Senden von E-Mails (z.B. Willkommensnachrichten).
+#
+# 4. Flask-Migrate (siehe init_migrate):
+#    - Verwaltet die Datenbankmigrationen. Flask-Migrate lädt Alembic, was den Start deutlich verlangsamt.
+#      Es wird deshalb erst initialisiert, wenn ein Migrationsbefehl (flask db ...) ausgeführt wird.
+# =======================================================================================
+db = SQLAlchemy()
+login_manager = LoginManager()
+login_manager.login_view = 'auth.login'
+mail = Mail()
+
+
+# =======================================================================================
+# Platzhalter für die Befehlsgruppe "flask db" von Flask-Migrate.
+#
+# Erst wenn ein Unterbefehl (z.B. flask db upgrade) aufgelöst wird, wird Flask-Migrate importiert,
+# an die Anwendung gebunden und die echte Befehlsgruppe verwendet. Web-Worker und andere
+# CLI-Befehle importieren Alembic dadurch gar nicht.
+# =======================================================================================
+class LazyMigrateGroup(click.Group):
+    def __init__(self, app):
+        super().__init__('db', help='Perform database migrations.')
+        self.app = app
+        self._group = None
+
+    def _load(self):
+        if self._group is None:
+            from flask_migrate import Migrate
+            from flask_migrate.cli import db as db_group
+            Migrate(self.app, db)
+            self._group = db_group
+        return self._group
+
+    # Der Kontext wird von der echten Befehlsgruppe erstellt, damit deren Optionen (z.B. --directory) gelten
+    def make_context(self, info_name, args, parent=None, **extra):
+        return self._load().make_context(info_name, args, parent=parent, **extra)
+
+
+def init_migrate(app):
+    app.cli.add_command(LazyMigrateGroup(app))
@@ -1,16 +1,46 @@
+# ======================================================================
+# Programm: forms
+# Beschreibung: Formulare für Registrierung und Login (Flask-WTF).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
-from app import User
 
+from models import User
+
+# ======================================================================
+# Diese Klasse definiert das Registrierungsformular für neue Benutzer in der Anwendung.
+# Es nutzt Flask-WTF, um Formularfelder und Validierungen zu erstellen, die für die
+# Benutzerregistrierung erforderlich sind.
+#
+# Felder:
+# - firstname: Textfeld für den Vornamen des Benutzers (Pflichtfeld).
+# - lastname: Textfeld für den Nachnamen des Benutzers (Pflichtfeld).
+# - birthday: Textfeld für das Geburtsdatum des Benutzers (Pflichtfeld).
+# - username: Textfeld für den Benutzernamen des Benutzers (Pflichtfeld). Dieses Feld muss einzigartig sein.
+# - email: Textfeld für die E-Mail-Adresse des Benutzers (Pflichtfeld). Die E-Mail-Adresse muss gültig und einzigartig sein.
+# - password: Passwortfeld für das Passwort des Benutzers (Pflichtfeld).
+# - confirm_password: Passwortfeld zur Bestätigung des Passworts (Pflichtfeld). Muss mit dem ersten Passwort übereinstimmen.
+# - submit: Schaltfläche zum Absenden des Formulars.
+#
+# Validierungsmethoden:
+# - validate_username: Prüft, ob der eingegebene Benutzername bereits existiert. Falls ja, wird eine Fehlermeldung ausgegeben.
+# - validate_email: Prüft, ob die eingegebene E-Mail-Adresse bereits existiert. Falls ja, wird eine Fehlermeldung ausgegeben.
+# ======================================================================
 class RegistrationForm(FlaskForm):
+    firstname = StringField('First Name', validators=[DataRequired()])
+    lastname = StringField('Last Name', validators=[DataRequired()])
+    birthday = StringField('Birthday', validators=[DataRequired()])
     username = StringField('Username', validators=[DataRequired()])
-    firstname = StringField('firstname', validators=[DataRequired()])
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired()])
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
     submit = SubmitField('Sign Up')
 
+
     def validate_username(self, username):
         user = User.query.filter_by(username=username.data).first()
         print(user)
@@ -23,6 +53,16 @@ class RegistrationForm(FlaskForm):
         if user:
             raise ValidationError('That email is taken. Please choose a different one.')
 
+# ======================================================================
+# Diese Klasse definiert das Login-Formular für die Benutzeranmeldung in der Anwendung.
+# Es nutzt Flask-WTF, um Formularfelder und Validierungen zu erstellen, die für die 
+# Benutzeranmeldung erforderlich sind.
+#
+# Felder:
+# - email: Textfeld für die E-Mail-Adresse des Benutzers (Pflichtfeld). Die E-Mail muss gültig sein.
+# - password: Passwortfeld für das Passwort des Benutzers (Pflichtfeld).
+# - submit: Schaltfläche zum Absenden des Formulars.
+# ======================================================================
 class LoginForm(FlaskForm):
     email = StringField('Email', validators=[DataRequired(), Email()])
     password = PasswordField('Password', validators=[DataRequired()])
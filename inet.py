@@ -0,0 +1,58 @@
+# ======================================================================
+# Programm: inet
+# Beschreibung: Umwandlung von IPv4- und MAC-Adressen zwischen der Textform
+#               (API, Formulare, Templates) und der Zahlform (Datenbank).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * IPv4-Adressen werden als 32-Bit-Zahl gespeichert (MySQL: INT UNSIGNED),
+#   MAC-Adressen als 48-Bit-Zahl (BIGINT). Dadurch werden Subnetz-Abfragen
+#   wie 10.4.0.0/22 zu einem BETWEEN über einen Index.
+# ======================================================================
+import ipaddress
+import re
+import socket
+
+IPV4_MAX = 2 ** 32 - 1
+MAC_RE = re.compile(r'^[0-9A-Fa-f]{2}([:-])(?:[0-9A-Fa-f]{2}\1){4}[0-9A-Fa-f]{2}$')
+
+
+def ipv4_to_int(value):
+    try:
+        return int(ipaddress.IPv4Address(str(value).strip()))
+    except ValueError:
+        raise ValueError(f'Invalid IPv4 address {value!r}')
+
+
+# socket.inet_ntoa ist deutlich schneller als ipaddress (wird für jede Zeile der API aufgerufen).
+# Zahlen ausserhalb von 0..2^32-1 lösen wie bei ipaddress einen AddressValueError aus.
+def int_to_ipv4(value):
+    if not 0 <= value <= IPV4_MAX:
+        raise ipaddress.AddressValueError(f'{value} is not permitted as an IPv4 address')
+    return socket.inet_ntoa(value.to_bytes(4, 'big'))
+
+
+# Akzeptiert aa:bb:cc:dd:ee:ff und aa-bb-cc-dd-ee-ff (Gross- oder Kleinschreibung)
+def mac_to_int(value):
+    value = str(value).strip()
+    if not MAC_RE.match(value):
+        raise ValueError(f'Invalid MAC address {value!r}')
+    return int(value[0:2] + value[3:5] + value[6:8] + value[9:11] + value[12:14] + value[15:17], 16)
+
+
+def int_to_mac(value):
+    digits = f'{value:012x}'
+    return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+
+
+# ======================================================================
+# Gibt die kleinste und grösste Adresse (als Zahl) eines IPv4-Netzes zurück.
+# Host-Bits werden ignoriert, d.h. 10.4.1.7/22 entspricht 10.4.0.0/22.
+# ======================================================================
+def cidr_range(cidr):
+    try:
+        network = ipaddress.IPv4Network(str(cidr).strip(), strict=False)
+    except ValueError:
+        raise ValueError(f'Invalid IPv4 network {cidr!r}')
+    return int(network.network_address), int(network.broadcast_address)
@@ -0,0 +1,420 @@
+# ======================================================================
+# Programm: jobs
+# Beschreibung: Hintergrund-Jobs für lange Operationen (Benutzer mit vielen VMs löschen,
+#               Willkommens-Mails erneut senden, Inventar neu berechnen, VM-Import).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Die Routen reihen einen Job in die Tabelle 'Job' ein (submit) und antworten sofort mit
+#   der Job-ID. Fortschritt und Ergebnis liefert /api/jobs/<id>.
+# * 'flask worker --concurrency N' startet N Worker-Prozesse mit je einer eigenen App.
+#   Ein Job wird mit UPDATE ... WHERE status = 'queued' übernommen; nur ein Worker erhält
+#   rowcount 1. Damit können auch mehrere Server gleichzeitig Worker betreiben.
+# * Schlägt ein Job fehl, wird er mit wachsender Wartezeit erneut eingereiht
+#   (JOBS_RETRY_BACKOFF * 2^(Versuch - 1)), bis max_attempts erreicht ist.
+# * Während ein Job läuft, aktualisiert ein Thread alle JOBS_STALE_AFTER / 3 Sekunden heartbeat_at.
+#   Jobs, deren Worker abgestürzt ist (kein Lebenszeichen seit JOBS_STALE_AFTER Sekunden),
+#   werden vom Hauptprozess des Workers wieder eingereiht.
+# ! Jobs sollten idempotent sein: Nach einem Absturz kann ein Job ein zweites Mal laufen.
+# ======================================================================
+import datetime
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import traceback
+
+from flask import current_app
+from sqlalchemy import func, select, update
+
+from extensions import db
+from models import Job, User, VM
+
+logger = logging.getLogger(__name__)
+
+# Name -> Funktion(context, **payload)
+REGISTRY = {}
+# Jobs, die über POST /api/jobs eingereiht werden dürfen (import_vms nur über den Upload)
+API_JOBS = frozenset({'delete_user', 'send_welcome_mails', 'recompute_inventory'})
+
+
+# Fehler, bei dem ein erneuter Versuch nichts bringt (z.B. ungültige Parameter)
+class PermanentError(Exception):
+    pass
+
+
+def job(name):
+    def register(fn):
+        REGISTRY[name] = fn
+        return fn
+    return register
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _isoformat(value):
+    return value.isoformat() + 'Z' if value is not None else None
+
+
+# ======================================================================
+# Wird jeder Job-Funktion übergeben.
+#
+# - progress(done, total=None, message=None): Meldet den Fortschritt. Wird sofort in einer
+#   eigenen Transaktion gespeichert (unabhängig von der Session des Jobs) und dient als Lebenszeichen.
+# - job_id / attempt: ID des Jobs und Nummer des aktuellen Versuchs.
+# ======================================================================
+class JobContext:
+    def __init__(self, job_id, attempt, created_by):
+        self.job_id = job_id
+        self.attempt = attempt
+        self.created_by = created_by
+
+    def progress(self, done, total=None, message=None):
+        values = {"progress_done": done, "heartbeat_at": _now()}
+        if total is not None:
+            values["progress_total"] = total
+        if message is not None:
+            values["message"] = message[:200]
+        with db.engine.begin() as connection:
+            connection.execute(update(Job.__table__).where(Job.__table__.c.id == self.job_id).values(values))
+
+
+# Prüft die Parameter gegen die Signatur der Job-Funktion (fehlende oder unbekannte Schlüssel).
+def check_payload(kind, payload):
+    try:
+        inspect.signature(REGISTRY[kind]).bind(None, **payload)
+    except TypeError as e:
+        raise ValueError(f'Invalid payload for job {kind!r}: {e}')
+
+
+# ======================================================================
+# Reiht einen Job ein und gibt ihn zurück (job.id ist danach gesetzt).
+#
+# Parameter:
+# - kind: Name in der Registry.
+# - payload: JSON-serialisierbares Dictionary mit den Parametern.
+# - created_by: ID des Benutzers, der den Job auslöst.
+#
+# Unbekannte Jobs und Parameter, die nicht zur Job-Funktion passen, lösen einen ValueError aus.
+# ======================================================================
+def submit(kind, payload=None, created_by=None, max_attempts=None):
+    if kind not in REGISTRY:
+        raise ValueError(f'Unknown job {kind!r}, available: {", ".join(sorted(REGISTRY))}')
+    check_payload(kind, payload or {})
+    now = _now()
+    job_row = Job(kind=kind, payload=json.dumps(payload or {}), status='queued', created_by=created_by,
+                  max_attempts=max_attempts or current_app.config['JOBS_MAX_ATTEMPTS'],
+                  run_after=now, created_at=now)
+    db.session.add(job_row)
+    db.session.commit()
+    return job_row
+
+
+def to_dict(job_row):
+    return {
+        "id": job_row.id,
+        "kind": job_row.kind,
+        "status": job_row.status,
+        "progress": {"done": job_row.progress_done, "total": job_row.progress_total, "message": job_row.message},
+        "result": json.loads(job_row.result) if job_row.result else None,
+        "error": job_row.error,
+        "attempts": job_row.attempts,
+        "max_attempts": job_row.max_attempts,
+        "created_by": job_row.created_by,
+        "created_at": _isoformat(job_row.created_at),
+        "started_at": _isoformat(job_row.started_at),
+        "finished_at": _isoformat(job_row.finished_at),
+        "run_after": _isoformat(job_row.run_after) if job_row.status == 'queued' else None,
+    }
+
+
+# ======================================================================
+# Ausführung
+# ======================================================================
+def claim(worker_name, limit=10):
+    table = Job.__table__
+    now = _now()
+    with db.engine.connect() as connection:
+        candidates = connection.execute(
+            select(table.c.id).where(table.c.status == 'queued', table.c.run_after <= now)
+            .order_by(table.c.run_after, table.c.id).limit(limit)).scalars().all()
+    for job_id in candidates:
+        with db.engine.begin() as connection:
+            claimed = connection.execute(
+                update(table).where(table.c.id == job_id, table.c.status == 'queued')
+                .values(status='running', worker=worker_name, attempts=table.c.attempts + 1,
+                        started_at=now, heartbeat_at=now, error=None)).rowcount
+        if claimed == 1:
+            return job_id
+    return None
+
+
+# Aktualisiert heartbeat_at alle interval Sekunden, bis done gesetzt wird. Läuft in einem eigenen
+# Thread, damit auch lange Schritte ohne Fortschrittsmeldung nicht als verwaist gelten.
+def _heartbeat(engine, job_id, worker_name, interval, done):
+    table = Job.__table__
+    while not done.wait(interval):
+        try:
+            with engine.begin() as connection:
+                connection.execute(update(table).where(table.c.id == job_id, table.c.status == 'running',
+                                                       table.c.worker == worker_name)
+                                   .values(heartbeat_at=_now()))
+        except Exception:
+            logger.exception('Heartbeat of job %s failed', job_id)
+
+
+# Führt einen mit claim() übernommenen Job aus und speichert das Ergebnis. Wurde der Job in der
+# Zwischenzeit als verwaist wieder eingereiht (und evtl. von einem anderen Worker übernommen),
+# wird das Ergebnis verworfen und None zurückgegeben.
+def run(job_id, worker_name):
+    table = Job.__table__
+    with db.engine.connect() as connection:
+        row = connection.execute(select(table).where(table.c.id == job_id)).mappings().one()
+    context = JobContext(job_id, row['attempts'], row['created_by'])
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, name=f'job-{job_id}-heartbeat', daemon=True,
+                                 args=(db.engine, job_id, worker_name,
+                                       current_app.config['JOBS_STALE_AFTER'] / 3, done))
+    heartbeat.start()
+    try:
+        fn = REGISTRY[row['kind']]
+        payload = json.loads(row['payload'])
+        try:
+            check_payload(row['kind'], payload)
+        except ValueError as e:
+            raise PermanentError(str(e))
+        result = fn(context, **payload)
+    except Exception as e:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job_id, row['kind'])
+        error = ''.join(traceback.format_exception_only(e)).strip()
+        if row['attempts'] < row['max_attempts'] and not isinstance(e, PermanentError):
+            delay = current_app.config['JOBS_RETRY_BACKOFF'] * 2 ** (row['attempts'] - 1)
+            values = {"status": 'queued', "run_after": _now() + datetime.timedelta(seconds=delay), "worker": None}
+        else:
+            values = {"status": 'failed', "finished_at": _now()}
+        values["error"] = error
+    else:
+        values = {"status": 'succeeded', "finished_at": _now(), "result": json.dumps(result),
+                  "message": None}
+    finally:
+        done.set()
+        heartbeat.join()
+        db.session.remove()
+    with db.engine.begin() as connection:
+        updated = connection.execute(
+            update(table).where(table.c.id == job_id, table.c.status == 'running', table.c.worker == worker_name)
+            .values(values)).rowcount
+    if updated != 1:
+        logger.warning('Job %s is no longer owned by %s, discarding status %r', job_id, worker_name, values['status'])
+        return None
+    return values['status']
+
+
+# Reiht Jobs wieder ein, deren Worker seit stale_after Sekunden kein Lebenszeichen gegeben hat.
+def requeue_stale(stale_after):
+    table = Job.__table__
+    limit = _now() - datetime.timedelta(seconds=stale_after)
+    with db.engine.begin() as connection:
+        return connection.execute(
+            update(table).where(table.c.status == 'running', table.c.heartbeat_at < limit)
+            .values(status='queued', run_after=_now(), worker=None, error='Worker lost')).rowcount
+
+
+# ======================================================================
+# Worker-Prozesse
+#
+# Jeder Prozess erstellt seine eigene App (eigene Verbindungen, eigene Hintergrund-Threads)
+# und arbeitet die Jobs nacheinander ab. Der Hauptprozess startet abgestürzte Prozesse neu,
+# reiht verwaiste Jobs wieder ein und beendet bei SIGTERM/SIGINT alle Prozesse, nachdem
+# deren laufender Job fertig ist.
+# ======================================================================
+def _work(config, stop, poll_interval):
+    # Ctrl+C/SIGTERM beendet nur den Hauptprozess; dieser setzt 'stop' für alle Worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from app import create_app
+    app = create_app(config)
+    worker_name = f'{socket.gethostname()}:{os.getpid()}'
+    with app.app_context():
+        while not stop.is_set():
+            job_id = claim(worker_name)
+            if job_id is None:
+                stop.wait(poll_interval)
+                continue
+            with app.app_context():
+                run(job_id, worker_name)
+
+
+def run_worker(app, concurrency, config=None, poll_interval=None, on_start=None):
+    poll_interval = poll_interval or app.config['JOBS_POLL_INTERVAL']
+    stale_after = app.config['JOBS_STALE_AFTER']
+    ctx = multiprocessing.get_context('spawn')
+    stop = ctx.Event()
+    # Der Signal-Handler darf 'stop' nicht selbst setzen (Deadlock, falls der Hauptprozess
+    # gerade in stop.wait() steckt), deshalb ein eigenes Event für den Hauptprozess
+    stopping = threading.Event()
+    processes = []
+
+    def start():
+        process = ctx.Process(target=_work, args=(config, stop, poll_interval), name='job-worker', daemon=True)
+        process.start()
+        return process
+
+    def shutdown(signum, frame):
+        stopping.set()
+
+    previous = {sig: signal.signal(sig, shutdown) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        processes = [start() for _ in range(concurrency)]
+        if on_start:
+            on_start(processes)
+        while not stopping.is_set():
+            with app.app_context():
+                requeued = requeue_stale(stale_after)
+            if requeued:
+                logger.warning('Requeued %d jobs of lost workers', requeued)
+            for index, process in enumerate(processes):
+                if not process.is_alive() and not stopping.is_set():
+                    logger.warning('Worker %s exited with %s, restarting', process.pid, process.exitcode)
+                    processes[index] = start()
+            stopping.wait(min(stale_after, 5.0))
+    finally:
+        stop.set()
+        for process in processes:
+            process.join()
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
+
+# ======================================================================
+# Jobs
+# ======================================================================
+# Löscht einen Benutzer mitsamt seinen VMs. Die VMs werden in Batches über die Session ihres
+# Shards gelöscht (Audit-Log pro VM), nach jedem Batch wird committet und on_batch mit der Anzahl
+# bisher gelöschter VMs aufgerufen. Wird auch ohne Worker direkt von der Route verwendet.
+def delete_user_with_vms(user, batch_size=500, on_batch=None):
+    from sharding import current_shards
+    shards = current_shards()
+    session = shards.session(shards.shard_for(user.id))
+    deleted = 0
+    while True:
+        vms = session.scalars(select(VM).where(VM.user_id == user.id).order_by(VM.id).limit(batch_size)).all()
+        if not vms:
+            break
+        for vm in vms:
+            session.delete(vm)
+        session.commit()
+        deleted += len(vms)
+        if on_batch:
+            on_batch(deleted)
+    db.session.delete(user)
+    db.session.commit()
+    return deleted
+
+
+@job('delete_user')
+def delete_user_job(context, user_id, batch_size=500):
+    from sharding import current_shards
+    import microcache
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise PermanentError(f'User {user_id} not found')
+    username = user.username
+    total = current_shards().count_for_owner(user_id)
+    context.progress(0, total, f'Deleting {total} VMs of {username}')
+    deleted = delete_user_with_vms(user, batch_size, on_batch=lambda done: context.progress(done, total))
+    microcache.purge(wait=True)
+    return {"user_id": user_id, "username": username, "deleted_vms": deleted}
+
+
+# Sendet die Willkommens-Mail erneut, an alle Benutzer oder an die angegebenen IDs.
+@job('send_welcome_mails')
+def send_welcome_mails_job(context, user_ids=None):
+    from blueprints.auth import send_welcome_email
+    statement = select(User).order_by(User.id)
+    if user_ids is not None:
+        statement = statement.where(User.id.in_(user_ids))
+    users = db.session.scalars(statement).all()
+    # Bereits versendete Mails beim nächsten Versuch überspringen
+    start = _resume_position(context)
+    failed = []
+    for position, user in enumerate(users[start:], start=start):
+        try:
+            send_welcome_email(user)
+        except Exception as e:
+            failed.append({"user_id": user.id, "error": str(e)})
+        context.progress(position + 1, len(users))
+    return {"sent": len(users) - start - len(failed), "failed": failed}
+
+
+def _resume_position(context):
+    if context.attempt <= 1:
+        return 0
+    with db.engine.connect() as connection:
+        return connection.execute(select(Job.progress_done).where(Job.id == context.job_id)).scalar() or 0
+
+
+# Berechnet das Inventar neu: Anzahl VMs und Summen von CPU, RAM und HDD pro Besitzer und gesamt.
+@job('recompute_inventory')
+def recompute_inventory_job(context):
+    from sharding import current_shards
+    shards = current_shards()
+    statement = (select(VM.user_id, func.count(), func.sum(VM.cpu), func.sum(VM.ram), func.sum(VM.hdd))
+                 .group_by(VM.user_id))
+
+    def aggregate(engine):
+        with engine.connect() as connection:
+            return connection.execute(statement).tuples().all()
+
+    context.progress(0, len(shards), 'Aggregating shards')
+    owners = {}
+    for rows in shards.scatter(aggregate):
+        for user_id, vms, cpu, ram, hdd in rows:
+            totals = owners.setdefault(user_id, [0, 0, 0, 0])
+            for index, value in enumerate((vms, cpu, ram, hdd)):
+                totals[index] += value or 0
+    context.progress(len(shards), len(shards))
+    names = shards.usernames(owners)
+    keys = ('vms', 'cpu', 'ram', 'hdd')
+    return {
+        "total": {key: sum(totals[index] for totals in owners.values()) for index, key in enumerate(keys)},
+        "owners": [{"user_id": user_id, "username": names.get(user_id), **dict(zip(keys, totals))}
+                   for user_id, totals in sorted(owners.items())],
+    }
+
+
+# Importiert eine hochgeladene Datei (siehe vm_import.py). Die Datei liegt in JOBS_FILES_DIR und
+# wird nach dem Import gelöscht. Ein erneuter Versuch setzt nach dem letzten Batch fort.
+@job('import_vms')
+def import_vms_job(context, path, fmt, batch_size=1000, default_owner_id=None):
+    from sharding import current_shards
+    import microcache
+    import vm_import
+    if not os.path.exists(path):
+        raise PermanentError(f'Upload {os.path.basename(path)} no longer exists')
+
+    def report(result):
+        context.progress(result.read, message=f'{result.inserted} inserted, {result.invalid + result.failed} rejected')
+
+    try:
+        with open(path, encoding='utf-8', newline='') as stream:
+            result = vm_import.import_vms(db.session, VM.__table__, stream, fmt,
+                                          vm_import.load_owner_map(db.session, User),
+                                          batch_size=batch_size, default_owner_id=default_owner_id,
+                                          checkpoint=vm_import.Checkpoint(path + '.ckpt', path), on_batch=report,
+                                          partition=current_shards().partition)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise PermanentError(str(e))
+    for leftover in (path, path + '.ckpt'):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    if result.inserted:
+        microcache.purge(wait=True)
+    return result.to_dict()
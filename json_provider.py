@@ -0,0 +1,77 @@
+# ======================================================================
+# Programm: json_provider
+# Beschreibung: Schneller JSON-Provider für Flask (orjson), mit Rückfall auf den
+#               Standard-Provider (json aus der Standardbibliothek).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * orjson ist optional. Ist es nicht installiert, bleibt der Standard-Provider aktiv.
+# * Die Ausgabe entspricht der des Standard-Providers: sortierte Schlüssel, Einrückung im
+#   Debug-Modus, Datumswerte als HTTP-Datum (über default()). Einziger Unterschied:
+#   Umlaute werden als UTF-8 statt als \u-Escape ausgegeben.
+# ======================================================================
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - abhängig von der Installation
+    orjson = None
+
+
+# ======================================================================
+# JSON-Provider auf Basis von orjson.
+#
+# - dumps(): Wie beim Standard-Provider, gibt einen String zurück.
+# - response(): Schreibt die Bytes von orjson direkt in die Antwort (kein Umweg über str).
+# - loads(): orjson.loads, akzeptiert str und bytes.
+# Typen, die orjson nicht selbst kennt (date, Decimal, Markup, ...), werden über
+# DefaultJSONProvider.default umgewandelt.
+# ======================================================================
+class OrjsonProvider(DefaultJSONProvider):
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _dumpb(self, obj, indent=False):
+        return orjson.dumps(obj, default=self.default, option=self._options(indent))
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Sonderfälle (z.B. eigene Einrückung) übernimmt der Standard-Provider
+            return super().dumps(obj, **kwargs)
+        return self._dumpb(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        return self._app.response_class(self._dumpb(obj, indent) + b'\n', mimetype=self.mimetype)
+
+
+# ======================================================================
+# Setzt den JSON-Provider der App (app.json).
+#
+# Konfiguration JSON_PROVIDER:
+# - 'auto' (Default): orjson, falls installiert, sonst Standard-Provider.
+# - 'orjson': orjson erzwingen (Fehler, falls nicht installiert).
+# - 'stdlib': Standard-Provider.
+# ======================================================================
+def init_json(app):
+    choice = app.config.get('JSON_PROVIDER', 'auto')
+    if choice not in ('auto', 'orjson', 'stdlib'):
+        raise ValueError(f'Unknown JSON_PROVIDER {choice!r}')
+    if choice == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_PROVIDER is orjson, but orjson is not installed')
+    if choice != 'stdlib' and orjson is not None:
+        app.json_provider_class = OrjsonProvider
+        app.json = OrjsonProvider(app)
+    return app.json
@@ -0,0 +1,125 @@
+# ======================================================================
+# Programm: microcache
+# Beschreibung: Micro-Caching der GET-API im nginx davor (siehe nginx/nginx.conf).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Erfolgreiche Antworten der Endpunkte in MICROCACHE_ENDPOINTS erhalten die Header
+#   X-Accel-Expires (Cache-Dauer für nginx) und Cache-Control (s-maxage für geteilte Caches,
+#   Browser fragen jedes Mal neu an). Anfragen angemeldeter Benutzer werden nie gecacht.
+# * Nach jeder Änderung an Benutzern oder VMs ruft die Route purge() auf. Ein Hintergrund-Thread
+#   lädt dann die Pfade in MICROCACHE_PURGE_PATHS über den internen Purge-Server von nginx neu
+#   (proxy_cache_bypass ersetzt den Eintrag im Cache). Mehrere Änderungen kurz hintereinander
+#   führen zu einem einzigen Neuladen.
+# ! Varianten mit Query-Parametern (?fields=, ?cidr=) werden nicht neu geladen. Sie sind höchstens
+#   MICROCACHE_TTL Sekunden veraltet.
+# ======================================================================
+import logging
+import os
+import threading
+import urllib.request
+
+from flask import current_app, has_app_context, request, session
+
+logger = logging.getLogger(__name__)
+
+
+# ======================================================================
+# Diese Klasse lädt die gecachten Pfade im Hintergrund neu.
+#
+# Attribute:
+# - base_url: Adresse des Purge-Servers von nginx (z.B. 'http://nginx:8080').
+# - paths: Pfade, die nach einer Änderung neu geladen werden.
+# - timeout: Timeout pro Anfrage in Sekunden.
+# - refreshed / failed: Anzahl neu geladener bzw. fehlgeschlagener Pfade.
+#
+# Der Thread wird wie beim Audit-Writer erst beim ersten Aufruf gestartet (und nach einem fork neu).
+# ======================================================================
+class Purger:
+    def __init__(self, base_url, paths, timeout=2.0):
+        self.base_url = base_url.rstrip('/')
+        self.paths = list(paths)
+        self.timeout = timeout
+        self.refreshed = 0
+        self.failed = 0
+        self._pending = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def purge(self):
+        self._ensure_started()
+        self._pending.set()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pending = threading.Event()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='microcache-purger', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            self._pending.clear()
+            self.refresh()
+
+    # Lädt alle Pfade sofort neu (ohne Hintergrund-Thread, z.B. für CLI-Befehle).
+    def refresh(self):
+        for path in self.paths:
+            try:
+                with urllib.request.urlopen(self.base_url + path, timeout=self.timeout) as response:
+                    response.read()
+                self.refreshed += 1
+            except OSError as e:
+                self.failed += 1
+                logger.warning('Failed to refresh cached %s: %s', path, e)
+
+
+# Die Benutzer-ID wird wie bei singleflight.request_key aus der Session gelesen, ohne den Benutzer zu laden.
+def set_cache_headers(response):
+    ttl = current_app.config['MICROCACHE_TTL']
+    if (request.method in ('GET', 'HEAD') and response.status_code == 200
+            and request.endpoint in current_app.config['MICROCACHE_ENDPOINTS']
+            and session.get('_user_id') is None):
+        response.headers['X-Accel-Expires'] = str(ttl)
+        response.headers['Cache-Control'] = f'public, max-age=0, s-maxage={ttl}'
+    return response
+
+
+# Wird von den Routen nach einem erfolgreichen COMMIT aufgerufen. Ohne konfigurierten
+# Purge-Server passiert nichts. wait=True lädt sofort neu (für CLI-Befehle).
+def purge(wait=False):
+    purger = current_app.extensions.get('microcache') if has_app_context() else None
+    if purger is None:
+        return
+    if wait:
+        purger.refresh()
+    else:
+        purger.purge()
+
+
+# ======================================================================
+# Aktiviert das Micro-Caching.
+#
+# Konfiguration:
+# - MICROCACHE_TTL: Cache-Dauer in Sekunden (0 = aus, keine Header).
+# - MICROCACHE_ENDPOINTS: Endpunkte, deren Antworten gecacht werden dürfen. Die Antworten dürfen
+#   nicht vom angemeldeten Benutzer abhängen.
+# - MICROCACHE_PURGE_URL: Adresse des Purge-Servers von nginx (leer = nur TTL).
+# - MICROCACHE_PURGE_PATHS: Pfade, die nach einer Änderung neu geladen werden.
+# ======================================================================
+def init_microcache(app):
+    if not app.config.get('MICROCACHE_TTL'):
+        return None
+    app.after_request(set_cache_headers)
+    if not app.config.get('MICROCACHE_PURGE_URL'):
+        return None
+    purger = Purger(app.config['MICROCACHE_PURGE_URL'], app.config.get('MICROCACHE_PURGE_PATHS') or ())
+    app.extensions['microcache'] = purger
+    return purger
@@ -0,0 +1,87 @@
+"""store ipv4 and mac as integers
+
+IPv4 addresses are stored as 32-bit numbers (INT UNSIGNED on MySQL) and MAC
+addresses as 48-bit numbers (BIGINT). Existing rows are converted in batches;
+rows with an address that cannot be parsed abort the upgrade.
+
+Revision ID: 7b2e4d6f8a02
+Revises: 5a7f3c9e2d29
+Create Date: 2026-10-19 14:38:17.650389
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+import inet
+
+# revision identifiers, used by Alembic.
+revision = '7b2e4d6f8a02'
+down_revision = '5a7f3c9e2d29'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+vm = sa.table(
+    'VM',
+    sa.column('id', sa.Integer),
+    sa.column('ipv4', sa.String),
+    sa.column('mac', sa.String),
+    sa.column('ipv4_num', sa.BigInteger),
+    sa.column('mac_num', sa.BigInteger),
+)
+
+
+def _convert(source, target, convert):
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(vm.c.id, *source).where(vm.c.id > last_id).order_by(vm.c.id).limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            vm.update().where(vm.c.id == sa.bindparam('_id')).values({
+                name: sa.bindparam(name) for name in target
+            }),
+            [{'_id': row[0], **dict(zip(target, convert(*row[1:])))} for row in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    with op.batch_alter_table('VM', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ipv4_num', sa.BigInteger().with_variant(mysql.INTEGER(unsigned=True), 'mysql'), nullable=True))
+        batch_op.add_column(sa.Column('mac_num', sa.BigInteger(), nullable=True))
+
+    _convert((vm.c.ipv4, vm.c.mac), ('ipv4_num', 'mac_num'),
+             lambda ipv4, mac: (inet.ipv4_to_int(ipv4), inet.mac_to_int(mac)))
+
+    with op.batch_alter_table('VM', schema=None) as batch_op:
+        batch_op.alter_column('ipv4_num', existing_type=sa.BigInteger().with_variant(mysql.INTEGER(unsigned=True), 'mysql'), nullable=False)
+        batch_op.alter_column('mac_num', existing_type=sa.BigInteger(), nullable=False)
+        batch_op.create_unique_constraint('uq_VM_ipv4_num', ['ipv4_num'])
+        batch_op.create_unique_constraint('uq_VM_mac_num', ['mac_num'])
+        batch_op.drop_column('ipv4')
+        batch_op.drop_column('mac')
+
+
+def downgrade():
+    with op.batch_alter_table('VM', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ipv4', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('mac', sa.String(length=20), nullable=True))
+
+    _convert((vm.c.ipv4_num, vm.c.mac_num), ('ipv4', 'mac'),
+             lambda ipv4_num, mac_num: (inet.int_to_ipv4(ipv4_num), inet.int_to_mac(mac_num)))
+
+    with op.batch_alter_table('VM', schema=None) as batch_op:
+        batch_op.alter_column('ipv4', existing_type=sa.String(length=16), nullable=False)
+        batch_op.alter_column('mac', existing_type=sa.String(length=20), nullable=False)
+        batch_op.create_unique_constraint('uq_VM_ipv4', ['ipv4'])
+        batch_op.create_unique_constraint('uq_VM_mac', ['mac'])
+        batch_op.drop_constraint('uq_VM_ipv4_num', type_='unique')
+        batch_op.drop_constraint('uq_VM_mac_num', type_='unique')
+        batch_op.drop_column('ipv4_num')
+        batch_op.drop_column('mac_num')
@@ -1,6 +1,36 @@
-from app import db
+# ======================================================================
+# Programm: models
+# Beschreibung: Datenbankmodelle (User, VM, AuditLog, Job, ...) und der User-Loader für Flask-Login.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
 from flask_login import UserMixin
+from sqlalchemy.dialects import mysql
 
+import inet
+from extensions import db, login_manager
+
+# ======================================================================
+# Diese Klasse definiert das User-Datenbankmodell für die Anwendung. 
+# Es nutzt SQLAlchemy, um die Struktur einer 'User'-Tabelle in der Datenbank zu erstellen.
+# Die Klasse erweitert UserMixin, um Methoden wie is_authenticated, is_active usw. bereitzustellen, 
+# die für die Benutzerverwaltung und Authentifizierung benötigt werden.
+# 
+# Attribute:
+# - id: Eindeutiger Primärschlüssel für jeden Benutzer.
+# - firstname: Vorname des Benutzers (muss eindeutig sein).
+# - lastname: Nachname des Benutzers (muss eindeutig sein).
+# - birthday: Geburtstag des Benutzers (muss eindeutig sein).
+# - username: Benutzername des Benutzers (muss eindeutig sein).
+# - email: E-Mail-Adresse des Benutzers (muss eindeutig sein).
+# - password: Gehashter Passwort-String (mindestens 60 Zeichen).
+# - version: Wird bei jeder Änderung hochgezählt (SQLAlchemy version_id_col). Dient als Schlüssel
+#            für den Fragment-Cache der Benutzerliste und verhindert, dass gleichzeitige Änderungen
+#            sich unbemerkt überschreiben.
+# - vms: Beziehung zu den 'VM'-Datensätzen, die dieser Benutzer erstellt hat. 'lazy=True' bedeutet, 
+#        dass die VM-Daten nur dann geladen werden, wenn darauf zugegriffen wird.
+# ======================================================================
 class User(db.Model, UserMixin):
     __tablename__ = 'User'
     id = db.Column(db.Integer, primary_key=True)
@@ -10,8 +40,31 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     vms = db.relationship('VM', backref='author', lazy=True)
+    __mapper_args__ = {'version_id_col': version}
 
+# ======================================================================
+# Diese Klasse definiert das VM-Datenbankmodell (Virtual Machine) für die Anwendung.
+# Es nutzt SQLAlchemy, um die Struktur einer 'VM'-Tabelle in der Datenbank zu erstellen.
+#
+# Attribute:
+# - id: Eindeutiger Primärschlüssel für jede VM.
+# - name: Der Name der VM (muss angegeben sein und darf nicht leer sein).
+# - description: Beschreibung der VM (muss angegeben sein und darf nicht leer sein).
+# - cpu: Anzahl der CPU-Kerne, die der VM zugewiesen sind (muss angegeben sein).
+# - ram: Arbeitsspeicher (RAM) der VM in Megabyte (muss angegeben sein).
+# - hdd: Festplattenspeicher der VM in Gigabyte (muss angegeben sein).
+# - ipv4_num: Eindeutige IPv4-Adresse der VM als 32-Bit-Zahl (MySQL: INT UNSIGNED). Der Index erlaubt
+#             Subnetz-Abfragen als BETWEEN (siehe inet.cidr_range).
+# - mac_num: Eindeutige MAC-Adresse der VM als 48-Bit-Zahl (BIGINT).
+# - ipv4 / mac: Textform der Adressen ('10.0.0.1', 'aa:bb:cc:dd:ee:ff') für Formulare, Templates und die API.
+#               Beim Setzen wird die Eingabe geprüft; ungültige Adressen lösen einen ValueError aus.
+# - user_id: Fremdschlüssel, der auf die ID eines Benutzers verweist, der die VM erstellt hat (darf nicht leer sein).
+#            Dieser Fremdschlüssel stellt die Beziehung zwischen der VM und dem Benutzer ('User') her.
+#            Der Index beschleunigt Abfragen pro Besitzer (Zählen, Umzug auf einen anderen Shard).
+# - version: Wird bei jeder Änderung hochgezählt (Schlüssel für den Fragment-Cache der VM-Liste).
+# ======================================================================
 class VM(db.Model):
     __tablename__ = 'VM'
     id = db.Column(db.Integer, primary_key=True)
@@ -20,6 +73,136 @@ class VM(db.Model):
     cpu = db.Column(db.Integer, nullable=False)
     ram = db.Column(db.Integer, nullable=False)
     hdd = db.Column(db.Integer, nullable=False)
-    ipv4 = db.Column(db.String(16), unique=True, nullable=False)  # String length adjusted to match varchar(16)
-    mac = db.Column(db.String(20), unique=True, nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('User.id'), nullable=False)
\ No newline at end of file
+    ipv4_num = db.Column(db.BigInteger().with_variant(mysql.INTEGER(unsigned=True), 'mysql'), unique=True, nullable=False)
+    mac_num = db.Column(db.BigInteger, unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('User.id'), nullable=False, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
+
+    @property
+    def ipv4(self):
+        return inet.int_to_ipv4(self.ipv4_num) if self.ipv4_num is not None else None
+
+    @ipv4.setter
+    def ipv4(self, value):
+        self.ipv4_num = inet.ipv4_to_int(value)
+
+    @property
+    def mac(self):
+        return inet.int_to_mac(self.mac_num) if self.mac_num is not None else None
+
+    @mac.setter
+    def mac(self, value):
+        self.mac_num = inet.mac_to_int(value)
+
+# ======================================================================
+# Diese Klasse definiert das AuditLog-Datenbankmodell. Jeder Eintrag beschreibt eine
+# Änderung an einem Benutzer oder einer VM. Die Einträge werden nicht direkt über die
+# Session geschrieben, sondern gesammelt vom Audit-Writer (siehe audit.py).
+#
+# Attribute:
+# - id: Eindeutiger Primärschlüssel.
+# - created_at: Zeitpunkt der Änderung (UTC).
+# - actor_id: ID des angemeldeten Benutzers, der die Änderung ausgelöst hat (leer z.B. bei der Registrierung).
+# - action: 'insert', 'update' oder 'delete'.
+# - table_name / record_id: Tabelle und Primärschlüssel des geänderten Datensatzes.
+# - changes: JSON mit den geänderten Feldern ([alt, neu]) bzw. dem neuen oder gelöschten Datensatz. Passwörter werden maskiert.
+# ======================================================================
+class AuditLog(db.Model):
+    __tablename__ = 'AuditLog'
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    actor_id = db.Column(db.Integer, nullable=True)
+    action = db.Column(db.String(10), nullable=False)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=True)
+    changes = db.Column(db.Text, nullable=False)
+    __table_args__ = (db.Index('ix_AuditLog_record', 'table_name', 'record_id'),)
+
+# ======================================================================
+# Diese Klasse definiert die Zuordnung eines Benutzers (Besitzer) zu einem VM-Shard (siehe sharding.py).
+# Die Zuordnung wird beim ersten Schreiben einer VM des Benutzers festgelegt und nur durch
+# 'flask shards move-owner' geändert. Die Tabelle liegt immer in der Hauptdatenbank.
+#
+# Attribute:
+# - user_id: ID des Besitzers.
+# - shard: Bind-Key des Shards (Eintrag in VM_SHARDS).
+# - moving_from: Während eines Umzugs der Bind-Key des alten Shards, sonst leer. Solange der Wert
+#                gesetzt ist, sind Schreibzugriffe auf die VMs des Besitzers gesperrt.
+# ======================================================================
+class ShardAssignment(db.Model):
+    __tablename__ = 'ShardAssignment'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    shard = db.Column(db.String(50), nullable=False)
+    moving_from = db.Column(db.String(50), nullable=True)
+
+# ======================================================================
+# Diese Klasse definiert einen Zähler für global eindeutige IDs (Hi-Lo-Verfahren).
+# Jeder Prozess reserviert mit einem UPDATE einen ganzen Block von IDs und vergibt diese
+# danach ohne weiteren Datenbankzugriff. Wird für die IDs der VMs auf den Shards verwendet.
+#
+# Attribute:
+# - name: Name des Zählers (z.B. 'VM').
+# - next_value: Erste noch nicht reservierte ID.
+# ======================================================================
+class IdSequence(db.Model):
+    __tablename__ = 'IdSequence'
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+# ======================================================================
+# Diese Klasse definiert einen Hintergrund-Job (siehe jobs.py). Jobs werden von den Routen
+# oder über /api/jobs eingereiht und von 'flask worker' in eigenen Prozessen ausgeführt.
+#
+# Attribute:
+# - id: Eindeutiger Primärschlüssel (wird als Job-ID zurückgegeben).
+# - kind: Name des Jobs in der Registry (z.B. 'delete_user').
+# - payload: JSON mit den Parametern des Jobs.
+# - status: 'queued', 'running', 'succeeded' oder 'failed'.
+# - progress_done / progress_total / message: Fortschritt, den der Job während der Ausführung meldet.
+# - result: JSON mit dem Ergebnis (bei 'succeeded'), error: Letzte Fehlermeldung.
+# - attempts / max_attempts: Anzahl bisheriger und maximaler Versuche.
+# - run_after: Frühester Start (nach einem Fehler mit wachsender Wartezeit).
+# - created_by: ID des Benutzers, der den Job eingereiht hat.
+# - worker: Prozess, der den Job ausführt ('host:pid').
+# - created_at / started_at / heartbeat_at / finished_at: Zeitpunkte (UTC). heartbeat_at wird während der
+#   Ausführung regelmässig und bei jeder Fortschrittsmeldung aktualisiert; Jobs ohne Lebenszeichen
+#   werden erneut eingereiht.
+# ======================================================================
+class Job(db.Model):
+    __tablename__ = 'Job'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    progress_done = db.Column(db.Integer, nullable=False, default=0)
+    progress_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(200), nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False)
+    created_by = db.Column(db.Integer, nullable=True)
+    worker = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.Index('ix_Job_status_run_after', 'status', 'run_after'),)
+
+# ======================================================================
+# Diese Funktion wird von Flask-Login verwendet, um den aktuell angemeldeten Benutzer
+# anhand der Benutzer-ID zu laden. 
+#
+# Ablauf:
+# - @login_manager.user_loader: Ein Dekorator, der angibt, dass diese Funktion verwendet wird, um den Benutzer zu laden.
+# - load_user(user_id): Die Funktion lädt den Benutzer aus der Datenbank basierend auf der übergebenen Benutzer-ID.
+# - User.query.get(int(user_id)): Sucht den Benutzer anhand der Benutzer-ID in der Datenbank. Die ID wird in einen Integer umgewandelt.
+# 
+# Rückgabewert:
+# - Gibt das User-Objekt zurück, das zur angegebenen ID gehört. Falls kein
+# ======================================================================
+@login_manager.user_loader
+def load_user(user_id):
+    return User.query.get(int(user_id))
@@ -0,0 +1,392 @@
+# ======================================================================
+# Programm: profiling
+# Beschreibung: Profiling einzelner Anfragen auf Abruf (Flamegraph, SQL- und Template-Zeiten).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Eine Anfrage wird profiliert, wenn sie ein signiertes Token im Header X-Profile oder im
+#   Query-Parameter _profile mitbringt (erstellt mit 'flask profiling token'), oder wenn
+#   PROFILING_SAMPLE_RATE gesetzt ist und sie die N-te Anfrage ist.
+# * Ein Sampling-Profiler liest alle PROFILING_INTERVAL Sekunden den Stack des Threads der
+#   Anfrage. Zusätzlich werden alle SQL-Statements (über Engine-Events) und alle gerenderten
+#   Templates (über die Flask-Signale) mit Start und Dauer aufgezeichnet.
+# * Pro Anfrage werden drei Dateien in PROFILING_DIR geschrieben:
+#   - <name>.collapsed.txt: Collapsed Stacks (flamegraph.pl, speedscope)
+#   - <name>.speedscope.json: Flamegraph und Zeitachse mit SQL und Templates (https://www.speedscope.app)
+#   - <name>.json: Zusammenfassung (Route, Dauer, Status, SQL, Templates)
+#   Es bleiben nur die letzten PROFILING_KEEP Profile erhalten.
+# ! Ist PROFILING_ENABLED aus, wird nichts registriert (kein Overhead).
+# ! Abfragen in den Threads der Shard-Abfragen (sharding.py) erscheinen nicht in der SQL-Zeitachse.
+# ======================================================================
+import collections
+import datetime
+import glob
+import itertools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from flask import before_render_template, current_app, g, request, template_rendered
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SALT = 'profiling'
+MAX_STACK_DEPTH = 200
+MAX_STATEMENT_LENGTH = 500
+UNPROFILED_ENDPOINTS = frozenset({None, 'static', 'api.list_profiles', 'api.get_profile'})
+
+# Das Profil, das im aktuellen Thread aufgezeichnet wird (für die SQL-Events)
+_active = threading.local()
+
+
+# co_qualname gibt es erst ab Python 3.11
+def _frame_name(code):
+    return f'{getattr(code, "co_qualname", code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+# ======================================================================
+# Profil einer einzelnen Anfrage.
+#
+# Attribute:
+# - stacks: Collapsed Stack (Tupel von Frame-Namen, äusserster zuerst) -> Anzahl Samples.
+# - sql / templates: Liste von (Beschreibung, Start, Dauer) in Sekunden seit Beginn der Anfrage.
+# - interval: Abstand zwischen zwei Samples in Sekunden.
+# ======================================================================
+class RequestProfile:
+    def __init__(self, interval, trigger):
+        self.interval = interval
+        self.trigger = trigger
+        self.stacks = collections.Counter()
+        self.sql = []
+        self.templates = []
+        self.status = None
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.start = time.perf_counter()
+        self.duration = None
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+        self._template_starts = []
+
+    def begin(self):
+        _active.profile = self
+        self._sampler.start()
+
+    def end(self):
+        self.duration = time.perf_counter() - self.start
+        _active.profile = None
+        self._stop.set()
+        self._sampler.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    def offset(self):
+        return time.perf_counter() - self.start
+
+    def template_started(self, name):
+        self._template_starts.append((name, self.offset()))
+
+    def template_finished(self):
+        if self._template_starts:
+            name, start = self._template_starts.pop()
+            self.templates.append((name, start, self.offset() - start))
+
+    # ------------------------------------------------------------------
+    # Ausgabeformate
+    # ------------------------------------------------------------------
+    def collapsed(self):
+        return ''.join(f'{";".join(stack)} {count}\n' for stack, count in self.stacks.most_common())
+
+    def speedscope(self, name):
+        frames = []
+        index = {}
+
+        def frame_index(label):
+            if label not in index:
+                index[label] = len(frames)
+                frames.append({"name": label})
+            return index[label]
+
+        # Der Sampler erreicht wegen des GIL nicht immer das Intervall: Gewicht = Dauer / Anzahl Samples
+        total = self.duration * 1000
+        weight = total / max(1, sum(self.stacks.values()))
+        samples = []
+        weights = []
+        for stack, count in self.stacks.items():
+            samples.append([frame_index(label) for label in stack])
+            weights.append(count * weight)
+
+        # Zeitachse: Templates und SQL als Ereignisse. speedscope verlangt korrekt geschachtelte
+        # Ereignisse, deshalb werden offene Spannen vor dem Öffnen der nächsten geschlossen.
+        spans = [(start, start + duration, f'template {template}') for template, start, duration in self.templates]
+        spans += [(start, start + duration, f'SQL {statement}') for statement, start, duration in self.sql]
+        events = []
+        open_spans = []
+        for start, end, label in sorted(spans, key=lambda span: (span[0], -span[1])):
+            while open_spans and open_spans[-1][0] <= start:
+                close_at, frame = open_spans.pop()
+                events.append({"type": "C", "frame": frame, "at": close_at * 1000})
+            if open_spans:
+                end = min(end, open_spans[-1][0])
+            frame = frame_index(label)
+            events.append({"type": "O", "frame": frame, "at": start * 1000})
+            open_spans.append((end, frame))
+        while open_spans:
+            close_at, frame = open_spans.pop()
+            events.append({"type": "C", "frame": frame, "at": close_at * 1000})
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "vm-management profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {"type": "sampled", "name": f'{name} (Stacks)', "unit": "milliseconds",
+                 "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights},
+                {"type": "evented", "name": f'{name} (SQL und Templates)', "unit": "milliseconds",
+                 "startValue": 0, "endValue": total, "events": events},
+            ],
+        }
+
+    def summary(self, name):
+        return {
+            "name": name,
+            "started_at": self.started_at.isoformat(),
+            "method": request.method,
+            "path": _path_without_token(),
+            "endpoint": request.endpoint,
+            "status": self.status,
+            "trigger": self.trigger,
+            "duration_ms": round(self.duration * 1000, 3),
+            "samples": sum(self.stacks.values()),
+            "sql_count": len(self.sql),
+            "sql_ms": round(sum(duration for _, _, duration in self.sql) * 1000, 3),
+            "template_ms": round(sum(duration for _, _, duration in self.templates) * 1000, 3),
+            "sql": [{"statement": statement, "start_ms": round(start * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                    for statement, start, duration in self.sql],
+            "templates": [{"name": template, "start_ms": round(start * 1000, 3), "duration_ms": round(duration * 1000, 3)}
+                          for template, start, duration in self.templates],
+        }
+
+
+# ======================================================================
+# Aufzeichnung der SQL-Statements (Engine-Events, nur wenn ein Profil im Thread aktiv ist)
+# ======================================================================
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(_active, 'profile', None)
+    if profile is not None:
+        conn.info.setdefault('profile_start', []).append(profile.offset())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(_active, 'profile', None)
+    starts = conn.info.get('profile_start')
+    if profile is not None and starts:
+        start = starts.pop()
+        profile.sql.append((' '.join(statement.split())[:MAX_STATEMENT_LENGTH], start, profile.offset() - start))
+
+
+# Bei einem fehlgeschlagenen Statement wird after_cursor_execute nicht aufgerufen. Der Startzeitpunkt
+# muss trotzdem vom Stack der (gepoolten) Verbindung genommen werden.
+def _handle_error(context):
+    conn = context.connection
+    starts = conn.info.get('profile_start') if conn is not None else None
+    if not starts:
+        return
+    start = starts.pop()
+    profile = getattr(_active, 'profile', None)
+    if profile is not None and context.statement:
+        statement = ' '.join(context.statement.split())[:MAX_STATEMENT_LENGTH - 9]
+        profile.sql.append((f'{statement} (failed)', start, profile.offset() - start))
+
+
+def _before_render(sender, template, context, **extra):
+    profile = g.get('_profile')
+    if profile is not None:
+        profile.template_started(template.name)
+
+
+def _after_render(sender, template, context, **extra):
+    profile = g.get('_profile')
+    if profile is not None:
+        profile.template_finished()
+
+
+# ======================================================================
+# Tokens: Mit dem SECRET_KEY signiert und zeitlich begrenzt (PROFILING_TOKEN_MAX_AGE).
+# ======================================================================
+def _serializer(app):
+    return URLSafeTimedSerializer(app.config['SECRET_KEY'], salt=SALT)
+
+
+def create_token(app, issued_to):
+    return _serializer(app).dumps({"by": issued_to})
+
+
+def verify_token(token):
+    if not token:
+        return None
+    try:
+        return _serializer(current_app).loads(token, max_age=current_app.config['PROFILING_TOKEN_MAX_AGE'])
+    except BadSignature:
+        return None
+
+
+def _path_without_token():
+    args = [(key, value) for key, value in request.args.items(multi=True) if key != '_profile']
+    return request.path + ('?' + urlencode(args) if args else '')
+
+
+def request_token():
+    return request.headers.get('X-Profile') or request.args.get('_profile')
+
+
+# ======================================================================
+# Entscheidet pro Anfrage, ob profiliert wird, und schreibt am Ende die Dateien.
+#
+# Attribute:
+# - directory: Verzeichnis für die Profile.
+# - sample_rate: Jede N-te Anfrage wird profiliert (0 = nur mit Token).
+# - interval: Abstand zwischen zwei Samples in Sekunden.
+# - keep: Anzahl Profile, die behalten werden.
+# ======================================================================
+class Profiler:
+    def __init__(self, directory, sample_rate=0, interval=0.005, keep=50):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self._requests = itertools.count(1)
+        self._names = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self):
+        if request.endpoint in UNPROFILED_ENDPOINTS:
+            return
+        claims = verify_token(request_token())
+        if claims is not None:
+            trigger = f'token:{claims.get("by")}'
+        elif self.sample_rate and next(self._requests) % self.sample_rate == 0:
+            trigger = 'sample'
+        else:
+            return
+        g._profile = RequestProfile(self.interval, trigger)
+        g._profile.begin()
+
+    def record_status(self, response):
+        profile = g.get('_profile')
+        if profile is not None:
+            profile.status = response.status_code
+            response.headers['X-Profile-Id'] = self._name(profile)
+        return response
+
+    def finish(self, exc):
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return
+        profile.end()
+        if profile.status is None:
+            profile.status = 500
+        name = self._name(profile)
+        base = os.path.join(self.directory, name)
+        try:
+            with open(base + '.collapsed.txt', 'w', encoding='utf-8') as f:
+                f.write(profile.collapsed())
+            with open(base + '.speedscope.json', 'w', encoding='utf-8') as f:
+                json.dump(profile.speedscope(name), f)
+            # Die Zusammenfassung zuletzt: recent() listet nur vollständige Profile
+            with open(base + '.json', 'w', encoding='utf-8') as f:
+                json.dump(profile.summary(name), f, indent=2)
+            self._rotate()
+        except OSError:
+            logger.exception('Failed to write profile %s', name)
+
+    def _name(self, profile):
+        # Der Name wird beim ersten Aufruf festgelegt (Header der Antwort und Dateinamen)
+        if not hasattr(profile, 'name'):
+            endpoint = (request.endpoint or 'unknown').replace('.', '-')
+            profile.name = (f'{profile.started_at:%Y%m%d-%H%M%S}-{endpoint}'
+                            f'-{os.getpid()}-{next(self._names)}')
+        return profile.name
+
+    def _rotate(self):
+        with self._lock:
+            summaries = sorted(glob.glob(os.path.join(self.directory, '*[0-9].json')), key=os.path.getmtime)
+            for summary in summaries[:max(0, len(summaries) - self.keep)]:
+                base = summary[:-len('.json')]
+                for path in (summary, base + '.collapsed.txt', base + '.speedscope.json'):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+
+    # Die neuesten Profile (Zusammenfassungen ohne SQL-Liste), neueste zuerst.
+    def recent(self, limit=50):
+        summaries = sorted(glob.glob(os.path.join(self.directory, '*[0-9].json')), key=os.path.getmtime, reverse=True)
+        profiles = []
+        for path in summaries[:limit]:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summary.pop('sql', None)
+            summary.pop('templates', None)
+            profiles.append(summary)
+        return profiles
+
+    # Pfad einer Profil-Datei oder None. kind: 'json', 'collapsed.txt' oder 'speedscope.json'.
+    def path_for(self, name, kind):
+        if os.path.basename(name) != name or kind not in ('json', 'collapsed.txt', 'speedscope.json'):
+            return None
+        path = os.path.join(self.directory, f'{name}.{kind}')
+        return path if os.path.isfile(path) else None
+
+
+# ======================================================================
+# Aktiviert das Profiling. Ist PROFILING_ENABLED aus, werden weder Hooks noch Events registriert.
+#
+# Konfiguration:
+# - PROFILING_ENABLED: Ein/aus.
+# - PROFILING_DIR: Verzeichnis für die Profile (Default: instance/profiles).
+# - PROFILING_SAMPLE_RATE: Jede N-te Anfrage profilieren (0 = nur mit Token).
+# - PROFILING_INTERVAL: Abstand zwischen zwei Stack-Samples in Sekunden.
+# - PROFILING_KEEP: Anzahl Profile, die behalten werden.
+# - PROFILING_TOKEN_MAX_AGE: Gültigkeit der Tokens in Sekunden.
+# ======================================================================
+def init_profiling(app):
+    if not app.config.get('PROFILING_ENABLED'):
+        return None
+    directory = app.config.get('PROFILING_DIR') or os.path.join(app.instance_path, 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    profiler = Profiler(directory,
+                        sample_rate=app.config.get('PROFILING_SAMPLE_RATE', 0),
+                        interval=app.config.get('PROFILING_INTERVAL', 0.005),
+                        keep=app.config.get('PROFILING_KEEP', 50))
+    app.before_request(profiler.start)
+    app.after_request(profiler.record_status)
+    app.teardown_request(profiler.finish)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.extensions['profiling'] = profiler
+    return profiler
@@ -0,0 +1,484 @@
+# ======================================================================
+# Programm: sharding
+# Beschreibung: Verteilung der VM-Tabelle auf mehrere Datenbanken (Shards) anhand des Besitzers.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Die Shards sind SQLAlchemy-Binds (SQLALCHEMY_BINDS), VM_SHARDS legt deren Reihenfolge fest.
+#   Ohne VM_SHARDS gibt es genau einen "Shard": die Hauptdatenbank mit db.session.
+# * Alle VMs eines Besitzers (VM.user_id) liegen auf demselben Shard. Die Zuordnung steht in
+#   der Tabelle 'ShardAssignment' der Hauptdatenbank und wird beim ersten Schreiben festgelegt
+#   (Default: user_id % Anzahl Shards). Neue Shards ändern deshalb bestehende Zuordnungen nicht.
+# * Schreiben: Die VM wird in der Session des Shards ihres Besitzers gespeichert. IDs werden
+#   über 'IdSequence' (Hi-Lo) vergeben und sind über alle Shards eindeutig.
+# * Lesen: Die Abfrage läuft parallel (Thread-Pool) auf allen Shards, jedes Teilergebnis ist
+#   nach ID sortiert und wird per k-Wege-Merge (heapq.merge) zusammengeführt. Zeilen, die während
+#   eines Umzugs auf zwei Shards liegen, werden nur einmal zurückgegeben.
+# * Umzug: Während move_owner() ist der Besitzer gesperrt (ShardAssignment.moving_from), Schreibzugriffe
+#   auf seine VMs lösen OwnerMoving (503 mit Retry-After) aus.
+# * Benutzer, Audit-Log usw. bleiben in der Hauptdatenbank. Die Autoren der VMs werden mit
+#   einer IN-Abfrage nachgeladen.
+# ! IPv4- und MAC-Adressen sind nur innerhalb eines Shards eindeutig.
+# ======================================================================
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import CreateIndex, CreateTable
+from werkzeug.exceptions import ServiceUnavailable
+
+import audit
+from models import IdSequence, ShardAssignment, User, VM
+
+IN_CHUNK_SIZE = 500
+MOVE_SETTLE = 1.0  # Wartezeit nach dem Sperren, bis laufende Schreibzugriffe abgeschlossen sind
+MOVE_RETRY_AFTER = 5
+
+
+# Wird beim Schreiben auf VMs eines Besitzers ausgelöst, der gerade verschoben wird.
+class OwnerMoving(ServiceUnavailable):
+    description = 'The VMs of this owner are being moved to another shard. Please try again shortly.'
+
+
+# Teilt eine Liste in Stücke für IN-Abfragen
+def chunked(values, size=IN_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+# Überspringt aufeinanderfolgende Zeilen mit derselben ID (sortierte Eingabe)
+def _unique(rows, key):
+    last = object()
+    for row in rows:
+        current = key(row)
+        if current != last:
+            last = current
+            yield row
+
+
+# ======================================================================
+# Vergibt global eindeutige IDs nach dem Hi-Lo-Verfahren.
+#
+# Attribute:
+# - name: Name des Zählers in der Tabelle 'IdSequence'.
+# - block: Anzahl IDs, die pro Datenbankzugriff reserviert werden.
+#
+# Nicht vergebene IDs eines Blocks gehen beim Beenden des Prozesses verloren (Lücken sind erlaubt).
+# ======================================================================
+class IdAllocator:
+    def __init__(self, name, block=100):
+        self.name = name
+        self.block = block
+        self._next = 0
+        self._end = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def next_id(self, engine):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Nach einem fork darf der Block des Elternprozesses nicht weiterverwendet werden
+                self._pid = os.getpid()
+                self._next = self._end = 0
+            if self._next >= self._end:
+                self._reserve(engine)
+            value = self._next
+            self._next += 1
+            return value
+
+    def _reserve(self, engine):
+        table = IdSequence.__table__
+        with engine.begin() as connection:
+            updated = connection.execute(
+                update(table).where(table.c.name == self.name)
+                .values(next_value=table.c.next_value + self.block)).rowcount
+            if not updated:
+                raise RuntimeError(f'IdSequence {self.name!r} does not exist, run "flask shards init"')
+            end = connection.execute(select(table.c.next_value).where(table.c.name == self.name)).scalar_one()
+        self._next, self._end = end - self.block, end
+
+
+# ======================================================================
+# Legt die VM-Tabelle auf einem Shard an, falls sie noch nicht existiert: gleiche Spalten und
+# Indizes wie in der Hauptdatenbank, aber ohne Fremdschlüssel auf 'User' (die Tabelle liegt
+# nur in der Hauptdatenbank).
+# ======================================================================
+def create_shard_table(engine):
+    table = VM.__table__
+    with engine.begin() as connection:
+        if inspect(connection).has_table(table.name):
+            return False
+        connection.execute(CreateTable(table, include_foreign_key_constraints=[]))
+        for index in table.indexes:
+            connection.execute(CreateIndex(index))
+    return True
+
+
+# ======================================================================
+# Die Shards einer App (app.extensions['shards']).
+#
+# Attribute:
+# - keys: Bind-Keys der Shards (leer = nur die Hauptdatenbank).
+# - sharded: True, wenn VM_SHARDS gesetzt ist.
+# - ids: Hi-Lo-Zähler für die VM-IDs (nur mit Shards).
+#
+# Sessions der Shards gelten für den aktuellen App-Kontext (wie db.session) und werden
+# am Ende der Anfrage geschlossen.
+# ======================================================================
+class ShardSet:
+    def __init__(self, db, keys, id_block=100):
+        self.db = db
+        self.keys = list(keys)
+        self.sharded = bool(self.keys)
+        self.ids = IdAllocator('VM', id_block)
+        self._factories = {}
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.keys) if self.sharded else 1
+
+    def index_of(self, key):
+        try:
+            return self.keys.index(key)
+        except ValueError:
+            raise ValueError(f'Unknown shard {key!r}, configured: {", ".join(self.keys)}')
+
+    def engine(self, index):
+        return self.db.engines[self.keys[index]] if self.sharded else self.db.engine
+
+    def engines(self):
+        return [self.engine(index) for index in range(len(self))]
+
+    def session(self, index):
+        if not self.sharded:
+            return self.db.session
+        sessions = g.setdefault('_shard_sessions', {})
+        if index not in sessions:
+            sessions[index] = self._factory(index)()
+        return sessions[index]
+
+    def _factory(self, index):
+        factory = self._factories.get(index)
+        if factory is None:
+            factory = sessionmaker(bind=self.engine(index))
+            audit.install_listeners(factory)
+            event.listen(factory, 'before_flush', self._check_flush)
+            self._factories[index] = factory
+        return factory
+
+    def close_sessions(self, exc=None):
+        for session in g.pop('_shard_sessions', {}).values():
+            session.close()
+
+    # ------------------------------------------------------------------
+    # Routing nach Besitzer
+    # ------------------------------------------------------------------
+    def assigned_key(self, user_id):
+        return self.db.session.execute(
+            select(ShardAssignment.shard).where(ShardAssignment.user_id == user_id)).scalar()
+
+    # Gibt den Index des Shards eines Besitzers zurück. Mit assign=True wird die Zuordnung
+    # gespeichert, falls es noch keine gibt (beim Schreiben).
+    def shard_for(self, user_id, assign=False):
+        if not self.sharded:
+            return 0
+        key = self.assigned_key(user_id)
+        if key is not None:
+            return self.index_of(key)
+        index = user_id % len(self.keys)
+        if assign:
+            try:
+                with self.db.engine.begin() as connection:
+                    connection.execute(insert(ShardAssignment.__table__),
+                                       {"user_id": user_id, "shard": self.keys[index]})
+            except IntegrityError:
+                # Eine andere Anfrage hat die Zuordnung gleichzeitig gespeichert
+                return self.index_of(self.assigned_key(user_id))
+        return index
+
+    # Löst OwnerMoving aus, falls einer der Besitzer gerade verschoben wird. Liest über eine
+    # eigene Verbindung, damit eine gerade gesetzte Sperre sicher sichtbar ist.
+    def check_writable(self, user_ids):
+        if not self.sharded:
+            return
+        table = ShardAssignment.__table__
+        with self.db.engine.connect() as connection:
+            for part in chunked(set(user_ids)):
+                moving = connection.execute(
+                    select(table.c.user_id)
+                    .where(table.c.user_id.in_(part), table.c.moving_from.isnot(None)).limit(1)).first()
+                if moving is not None:
+                    raise OwnerMoving(retry_after=MOVE_RETRY_AFTER)
+
+    def _check_flush(self, session, flush_context, instances):
+        owners = {obj.user_id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, VM)}
+        if owners:
+            self.check_writable(owners)
+
+    def assign(self, user_id, key):
+        self.index_of(key)
+        table = ShardAssignment.__table__
+        with self.db.engine.begin() as connection:
+            if not connection.execute(update(table).where(table.c.user_id == user_id).values(shard=key)).rowcount:
+                connection.execute(insert(table), {"user_id": user_id, "shard": key})
+
+    # ------------------------------------------------------------------
+    # Schreiben
+    # ------------------------------------------------------------------
+    def next_id(self):
+        return self.ids.next_id(self.db.engine)
+
+    # Fügt eine neue VM zur Session des Shards ihres Besitzers hinzu und gibt die Session zurück.
+    # VM.user_id muss gesetzt sein (nicht VM.author, der Benutzer gehört zu db.session).
+    def add(self, vm):
+        index = self.shard_for(vm.user_id, assign=True)
+        if self.sharded and vm.id is None:
+            vm.id = self.next_id()
+        session = self.session(index)
+        session.add(vm)
+        return session
+
+    # Teilt einen Import-Batch ((Zeile, Werte)-Paare, Werte mit user_id) nach Shard auf und
+    # vergibt dabei die IDs. Rückgabewert: Liste von (Session, Teil-Batch).
+    # Die INSERTs laufen ohne Flush, deshalb wird die Sperre hier geprüft.
+    def partition(self, batch):
+        if not self.sharded:
+            return [(self.db.session, batch)]
+        self.check_writable(values['user_id'] for _, values in batch)
+        groups = {}
+        for line, values in batch:
+            values.setdefault('id', self.next_id())
+            groups.setdefault(self.shard_for(values['user_id'], assign=True), []).append((line, values))
+        return [(self.session(index), part) for index, part in sorted(groups.items())]
+
+    # ------------------------------------------------------------------
+    # Lesen
+    # ------------------------------------------------------------------
+    def _pool(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=current_app.config.get('SHARD_POOL_SIZE') or len(self),
+                        thread_name_prefix='shard')
+        return self._executor
+
+    # Führt fn(engine) für jeden Shard aus (parallel, falls es mehrere gibt) und gibt die
+    # Ergebnisse in der Reihenfolge der Shards zurück.
+    def scatter(self, fn):
+        engines = self.engines()
+        if len(engines) == 1:
+            return [fn(engines[0])]
+        return list(self._pool().map(fn, engines))
+
+    # Core-SELECT auf allen Shards. Jedes Teilergebnis muss nach ID sortiert sein, key liefert
+    # die ID einer Zeile. Ohne Shards läuft die Abfrage über db.session (gleiche Transaktion).
+    def select(self, statement, key):
+        if not self.sharded:
+            return list(self.db.session.connection().execute(statement))
+
+        def run(engine):
+            with engine.connect() as connection:
+                return connection.execute(statement).all()
+        return list(_unique(heapq.merge(*self.scatter(run), key=key), key))
+
+    # Lädt VM-Objekte (nach ID sortiert) von allen Shards und setzt VM.author.
+    # Die Objekte der Shards sind danach von ihrer Session getrennt (nur lesen).
+    def load_vms(self, *criteria):
+        statement = select(VM).where(*criteria).order_by(VM.id)
+        if not self.sharded:
+            vms = self.db.session.scalars(statement).all()
+        else:
+            def run(engine):
+                with Session(engine) as session:
+                    return session.scalars(statement).all()
+            vm_id = lambda vm: vm.id
+            vms = list(_unique(heapq.merge(*self.scatter(run), key=vm_id), vm_id))
+        self.attach_authors(vms)
+        return vms
+
+    # Sucht eine VM über alle Shards. Die VM gehört danach zur Session ihres Shards
+    # (sqlalchemy.orm.object_session), Änderungen werden mit dieser Session gespeichert.
+    # Während eines Umzugs kann das die Kopie auf dem Ziel-Shard sein (Schreiben ist dann gesperrt).
+    def get(self, vm_id):
+        vm = None
+        for index in range(len(self)):
+            vm = self.session(index).get(VM, vm_id)
+            if vm is not None:
+                break
+        if vm is not None:
+            self.attach_authors([vm])
+        return vm
+
+    def count_for_owner(self, user_id):
+        statement = select(func.count()).select_from(VM).where(VM.user_id == user_id)
+        return self.session(self.shard_for(user_id)).execute(statement).scalar_one()
+
+    # Setzt VM.author aus einer IN-Abfrage auf die Hauptdatenbank (ohne Lazy-Load pro VM).
+    def attach_authors(self, vms):
+        users = {}
+        for part in chunked({vm.user_id for vm in vms}):
+            users.update((user.id, user) for user in User.query.filter(User.id.in_(part)))
+        for vm in vms:
+            set_committed_value(vm, 'author', users.get(vm.user_id))
+
+    # Gibt user_id -> Benutzername für die angegebenen IDs zurück.
+    def usernames(self, user_ids):
+        names = {}
+        for part in chunked(set(user_ids)):
+            names.update(self.db.session.execute(
+                select(User.id, User.username).where(User.id.in_(part))).all())
+        return names
+
+
+# ======================================================================
+# Verschiebt alle VMs eines Besitzers auf einen anderen Shard.
+#
+# Ablauf:
+# 1. Besitzer sperren (ShardAssignment.moving_from = alter Shard). Schreibzugriffe auf seine
+#    VMs lösen ab jetzt OwnerMoving aus. Danach settle Sekunden warten, bis Schreibzugriffe,
+#    die vor der Sperre geprüft wurden, abgeschlossen sind.
+# 2. VMs auf den Ziel-Shard kopieren (in Batches). Zeilen, die es auf dem alten Shard nicht
+#    mehr gibt, werden auf dem Ziel-Shard gelöscht (z.B. von einem abgebrochenen Umzug).
+# 3. Zuordnung in 'ShardAssignment' umstellen.
+# 4. VMs auf dem alten Shard löschen und die Sperre aufheben.
+#
+# Bis Schritt 4 liegen die VMs auf beiden Shards. Die Leseabfragen geben sie nur einmal zurück.
+# Schlägt Schritt 2 oder 3 fehl, werden die Kopien gelöscht und die Sperre aufgehoben. Schlägt
+# Schritt 4 fehl, bleibt der Besitzer gesperrt, ein erneuter Aufruf schliesst den Umzug ab.
+#
+# Rückgabewert: Anzahl verschobener VMs.
+# ======================================================================
+def move_owner(shards, user_id, target_key, batch_size=1000, settle=MOVE_SETTLE):
+    target = shards.index_of(target_key)
+    shards.shard_for(user_id, assign=True)
+    table = ShardAssignment.__table__
+    with shards.db.engine.begin() as connection:
+        shard, moving_from = connection.execute(
+            select(table.c.shard, table.c.moving_from).where(table.c.user_id == user_id)).one()
+        if moving_from is None:
+            if shard == target_key:
+                return 0
+            moving_from = shard
+            connection.execute(update(table).where(table.c.user_id == user_id).values(moving_from=moving_from))
+        elif shard != moving_from and shard != target_key:
+            raise ValueError(f'Owner {user_id} has already been moved to {shard!r}, finish the move with that shard')
+    source_engine, target_engine = shards.engine(shards.index_of(moving_from)), shards.engine(target)
+
+    if shard == moving_from:
+        time.sleep(settle)
+        try:
+            moved = _sync_owner(source_engine, target_engine, user_id, batch_size)
+            shards.assign(user_id, target_key)
+        except Exception:
+            _delete_owner(target_engine, user_id)
+            _set_moving(shards, user_id, None)
+            raise
+    else:
+        # Erneuter Aufruf nach einem Fehler in Schritt 4
+        moved = len(_versions(target_engine, user_id))
+    _delete_owner(source_engine, user_id)
+    _set_moving(shards, user_id, None)
+    return moved
+
+
+def _versions(engine, user_id):
+    table = VM.__table__
+    with engine.connect() as connection:
+        return dict(connection.execute(
+            select(table.c.id, table.c.version).where(table.c.user_id == user_id)).all())
+
+
+def _delete_owner(engine, user_id):
+    table = VM.__table__
+    with engine.begin() as connection:
+        connection.execute(delete(table).where(table.c.user_id == user_id))
+
+
+def _set_moving(shards, user_id, key):
+    table = ShardAssignment.__table__
+    with shards.db.engine.begin() as connection:
+        connection.execute(update(table).where(table.c.user_id == user_id).values(moving_from=key))
+
+
+# Gleicht die Zeilen eines Besitzers auf target an source an: neue und geänderte Zeilen kopieren,
+# Zeilen ohne Gegenstück auf source löschen. Rückgabewert: Anzahl Zeilen auf source.
+def _sync_owner(source_engine, target_engine, user_id, batch_size):
+    table = VM.__table__
+    source, target = _versions(source_engine, user_id), _versions(target_engine, user_id)
+    removed = sorted(vm_id for vm_id in target if vm_id not in source)
+    for part in chunked(removed, batch_size):
+        with target_engine.begin() as connection:
+            connection.execute(delete(table).where(table.c.id.in_(part)))
+    changed = sorted(vm_id for vm_id, version in source.items() if target.get(vm_id) != version)
+    for part in chunked(changed, batch_size):
+        with source_engine.connect() as connection:
+            rows = [dict(row) for row in connection.execute(select(table).where(table.c.id.in_(part))).mappings()]
+        with target_engine.begin() as connection:
+            existing = [row for row in rows if row['id'] in target]
+            new = [row for row in rows if row['id'] not in target]
+            if new:
+                connection.execute(insert(table), new)
+            for row in existing:
+                connection.execute(update(table).where(table.c.id == row['id']).values(row))
+    return len(source)
+
+
+# ======================================================================
+# Legt die VM-Tabellen auf allen Shards an und initialisiert den ID-Zähler.
+# Der Zähler beginnt nach der grössten bestehenden VM-ID (Hauptdatenbank und Shards).
+# ======================================================================
+def init_shards(shards):
+    table = VM.__table__
+    highest = []
+    for engine in shards.engines():
+        create_shard_table(engine)
+        with engine.connect() as connection:
+            highest.append(connection.execute(select(func.max(table.c.id))).scalar() or 0)
+    with shards.db.engine.connect() as connection:
+        if inspect(connection).has_table(table.name):
+            highest.append(connection.execute(select(func.max(table.c.id))).scalar() or 0)
+    sequence = IdSequence.__table__
+    with shards.db.engine.begin() as connection:
+        current = connection.execute(select(sequence.c.next_value).where(sequence.c.name == 'VM')).scalar()
+        start = max(highest) + 1
+        if current is None:
+            connection.execute(insert(sequence), {"name": 'VM', "next_value": start})
+        elif current < start:
+            connection.execute(update(sequence).where(sequence.c.name == 'VM').values(next_value=start))
+
+
+def current_shards():
+    return current_app.extensions['shards']
+
+
+# ======================================================================
+# Erstellt die Shards einer App.
+#
+# Konfiguration:
+# - VM_SHARDS: Liste von Bind-Keys aus SQLALCHEMY_BINDS (leer = keine Shards).
+# - SHARD_POOL_SIZE: Threads für parallele Abfragen (Default: Anzahl Shards).
+# - SHARD_ID_BLOCK: Anzahl IDs, die pro Prozess auf einmal reserviert werden.
+# ======================================================================
+def init_sharding(app, db):
+    keys = app.config.get('VM_SHARDS') or []
+    binds = app.config.get('SQLALCHEMY_BINDS') or {}
+    missing = [key for key in keys if key not in binds]
+    if missing:
+        raise RuntimeError(f'VM_SHARDS contains keys without SQLALCHEMY_BINDS entry: {", ".join(missing)}')
+    shards = ShardSet(db, keys, id_block=app.config.get('SHARD_ID_BLOCK', 100))
+    app.teardown_appcontext(shards.close_sessions)
+    app.extensions['shards'] = shards
+    return shards
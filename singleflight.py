@@ -0,0 +1,166 @@
+# ======================================================================
+# Programm: singleflight
+# Beschreibung: Zusammenfassen gleichzeitiger, identischer GET-Anfragen (Single-Flight).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Für die Endpunkte in SINGLEFLIGHT_ENDPOINTS wird pro Schlüssel (Endpunkt, Pfad, sortierte
+#   Query-Parameter, angemeldeter Benutzer) nur eine Anfrage gleichzeitig ausgeführt. Alle
+#   weiteren identischen Anfragen warten darauf und erhalten eine Kopie derselben Antwort.
+# * Optional kann eine fertige Antwort noch SINGLEFLIGHT_GRACE Sekunden weiterverwendet werden.
+# * Pro Endpunkt wird gezählt, wie oft die Route ausgeführt bzw. eine Antwort geteilt wurde.
+# ! Wirkt pro Prozess: Anfragen werden nur zwischen Threads desselben Workers zusammengefasst.
+# ======================================================================
+import functools
+import threading
+import time
+
+from flask import current_app, request, session
+
+COUNTERS = ('executed', 'coalesced', 'grace_hits', 'timeouts', 'bypassed')
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'finished')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished = None
+
+
+# ======================================================================
+# Fertige Antwort, die von mehreren Anfragen geteilt wird. Jede Anfrage erhält daraus ein
+# eigenes Response-Objekt (Cookies der ausführenden Anfrage werden nie weitergegeben).
+# ======================================================================
+class SharedResponse:
+    __slots__ = ('body', 'status', 'headers')
+
+    def __init__(self, response):
+        self.body = response.get_data()
+        self.status = response.status
+        self.headers = [(name, value) for name, value in response.headers.items() if name.lower() != 'set-cookie']
+
+    def to_response(self):
+        return current_app.response_class(self.body, status=self.status, headers=self.headers)
+
+
+# ======================================================================
+# Führt eine Funktion pro Schlüssel nur einmal gleichzeitig aus.
+#
+# Attribute:
+# - grace: Sekunden, in denen ein fertiges Ergebnis noch weiterverwendet wird (0 = nur gleichzeitige Anfragen).
+# - timeout: Maximale Wartezeit auf die laufende Ausführung. Danach wird selbst ausgeführt.
+# - counters: Endpunkt -> {executed, coalesced, grace_hits, timeouts, bypassed}.
+# ======================================================================
+class SingleFlight:
+    def __init__(self, grace=0.0, timeout=10.0):
+        self.grace = grace
+        self.timeout = timeout
+        self.counters = {}
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def count(self, endpoint, name):
+        with self._lock:
+            self._count(endpoint, name)
+
+    def _count(self, endpoint, name):
+        counters = self.counters.get(endpoint)
+        if counters is None:
+            counters = self.counters[endpoint] = dict.fromkeys(COUNTERS, 0)
+        counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: dict(counters) for endpoint, counters in self.counters.items()}
+
+    def do(self, endpoint, key, fn):
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.done.is_set():
+                if call.error is None and now - call.finished < self.grace:
+                    self._count(endpoint, 'grace_hits')
+                    return call.result
+                call = None
+            leader = call is None
+            if leader:
+                self._sweep(now)
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.done.wait(self.timeout):
+                self.count(endpoint, 'timeouts')
+                return fn()
+            self.count(endpoint, 'coalesced')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.finished = time.monotonic()
+            with self._lock:
+                self._count(endpoint, 'executed')
+                if (call.error is not None or not self.grace) and self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    # Entfernt abgelaufene Ergebnisse (höchstens einmal pro Grace-Periode). Muss mit Lock aufgerufen werden.
+    def _sweep(self, now):
+        if not self.grace or now < self._next_sweep:
+            return
+        self._next_sweep = now + self.grace
+        expired = [key for key, call in self._calls.items()
+                   if call.done.is_set() and now - call.finished >= self.grace]
+        for key in expired:
+            del self._calls[key]
+
+
+# Schlüssel einer Anfrage: Endpunkt, Pfad, sortierte Query-Parameter und angemeldeter Benutzer.
+# Die Benutzer-ID wird aus der Session gelesen, ohne den Benutzer zu laden.
+def request_key(endpoint):
+    return (endpoint, request.path, tuple(sorted(request.args.items(multi=True))), session.get('_user_id'))
+
+
+def coalesce(flight, endpoint, view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        # Nur GET; Anfragen mit ausstehenden Flash-Meldungen würden diese an andere Benutzer weitergeben
+        if request.method != 'GET' or session.get('_flashes'):
+            flight.count(endpoint, 'bypassed')
+            return view(*args, **kwargs)
+
+        def execute():
+            return SharedResponse(current_app.make_response(view(*args, **kwargs)))
+        return flight.do(endpoint, request_key(endpoint), execute).to_response()
+    return wrapper
+
+
+# ======================================================================
+# Aktiviert Single-Flight für die konfigurierten Endpunkte. Muss nach dem Registrieren
+# der Blueprints aufgerufen werden.
+#
+# Konfiguration:
+# - SINGLEFLIGHT_ENDPOINTS: Endpunkte (z.B. 'api.get_vms'). Leer = aus.
+# - SINGLEFLIGHT_GRACE: Sekunden, in denen eine fertige Antwort weiterverwendet wird (Default: 0).
+# - SINGLEFLIGHT_TIMEOUT: Maximale Wartezeit auf die laufende Anfrage in Sekunden.
+# ======================================================================
+def init_singleflight(app):
+    flight = SingleFlight(grace=app.config.get('SINGLEFLIGHT_GRACE', 0.0),
+                          timeout=app.config.get('SINGLEFLIGHT_TIMEOUT', 10.0))
+    for endpoint in app.config.get('SINGLEFLIGHT_ENDPOINTS') or ():
+        if endpoint not in app.view_functions:
+            raise RuntimeError(f'SINGLEFLIGHT_ENDPOINTS: unknown endpoint {endpoint!r}')
+        app.view_functions[endpoint] = coalesce(flight, endpoint, app.view_functions[endpoint])
+    app.extensions['singleflight'] = flight
+    return flight
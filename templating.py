@@ -0,0 +1,135 @@
+# ======================================================================
+# Programm: templating
+# Beschreibung: Jinja-Bytecode-Cache und Fragment-Cache für die Listen-Templates.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Bytecode-Cache: Kompilierte Templates werden im Dateisystem abgelegt. Neue Worker
+#   laden den Bytecode, statt die Templates erneut zu kompilieren.
+# * Fragment-Cache: Mit {% cache 'vm_row', vm.id, vm.version %}...{% endcache %} wird
+#   der gerenderte Inhalt eines Blocks unter dem angegebenen Schlüssel gespeichert.
+#   Da die Version bei jeder Änderung hochgezählt wird, muss nie invalidiert werden,
+#   veraltete Einträge fallen aus dem LRU-Cache heraus.
+# ! Der Schlüssel muss alle Datensätze enthalten, die im Block ausgegeben werden (z.B. auch
+#   ID und Version des Besitzers einer VM). Nach dem Löschen eines Datensatzes entfernt
+#   evict_fragments() seine Einträge, damit eine wiederverwendete ID (SQLite ohne AUTOINCREMENT)
+#   nicht den alten Inhalt anzeigt. Das gilt nur für den eigenen Prozess.
+# ======================================================================
+import os
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+
+# ======================================================================
+# Ein einfacher, threadsicherer LRU-Cache mit O(1) für get und set.
+#
+# Attribute:
+# - capacity: Maximale Anzahl Einträge.
+# - hits / misses: Zähler für die Trefferquote.
+# ======================================================================
+class FragmentCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    # Entfernt alle Einträge, deren Schlüssel mit prefix beginnt (z.B. ('vm_row', 7)).
+    def evict(self, prefix):
+        prefix = tuple(prefix)
+        with self._lock:
+            for key in [key for key in self._data if key[:len(prefix)] == prefix]:
+                del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+
+# ======================================================================
+# Jinja-Erweiterung für den Tag {% cache key, ... %}...{% endcache %}.
+#
+# Alle Argumente des Tags bilden zusammen den Schlüssel. Der Inhalt wird nur beim
+# ersten Mal gerendert, danach wird der gespeicherte (bereits escapte) Text ausgegeben.
+# ======================================================================
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache(10000))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key_parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key_parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render_cached', [nodes.Tuple(key_parts, 'load')])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        cache = self.environment.fragment_cache
+        value = cache.get(key)
+        if value is None:
+            value = Markup(caller())
+            cache.set(key, value)
+        return value
+
+
+# Entfernt die Fragmente der angegebenen Datensätze (nach dem Löschen).
+def evict_fragments(name, *record_ids):
+    cache = current_app.jinja_env.fragment_cache
+    for record_id in record_ids:
+        cache.evict((name, record_id))
+
+
+# ======================================================================
+# Richtet den Bytecode-Cache und den Fragment-Cache für eine App ein.
+# Muss vor dem ersten Zugriff auf app.jinja_env aufgerufen werden.
+#
+# Konfiguration:
+# - JINJA_BYTECODE_CACHE_DIR: Verzeichnis für den Bytecode (Default: instance/jinja_cache).
+#   Ein leerer Wert schaltet den Bytecode-Cache aus.
+# - FRAGMENT_CACHE_SIZE: Maximale Anzahl gespeicherter Fragmente.
+# ======================================================================
+def init_templating(app):
+    options = dict(app.jinja_options)
+    options['extensions'] = [*options.get('extensions', ()), FragmentCacheExtension]
+
+    directory = app.config.get('JINJA_BYTECODE_CACHE_DIR')
+    if directory is None:
+        directory = os.path.join(app.instance_path, 'jinja_cache')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        options['bytecode_cache'] = FileSystemBytecodeCache(directory)
+
+    app.jinja_options = options
+    app.jinja_env.fragment_cache.capacity = app.config.get('FRAGMENT_CACHE_SIZE', 10000)
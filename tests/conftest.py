@@ -0,0 +1,99 @@
+# ======================================================================
+# Programm: tests.conftest
+# Beschreibung: Gemeinsame Fixtures für die Tests (App mit SQLite-Dateien, Benutzer, Anmeldung).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Jeder Test erhält eigene SQLite-Dateien in tmp_path. In-Memory-Datenbanken gehen nicht,
+#   weil der Audit-Writer in einem eigenen Thread schreibt.
+# * Die Zugangskontrolle ist ausgeschaltet, ausser ein Test schaltet sie ein.
+# ======================================================================
+import itertools
+
+import pytest
+
+import sharding
+from app import create_app
+from extensions import db
+from models import User, VM
+
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+
+    def make(**config):
+        app = create_app({
+            "TESTING": True,
+            "SQLALCHEMY_DATABASE_URI": f'sqlite:///{tmp_path / "main.db"}',
+            "WTF_CSRF_ENABLED": False,
+            "MAIL_SUPPRESS_SEND": True,
+            "JINJA_BYTECODE_CACHE_DIR": '',
+            "ADMISSION_ENABLED": False,
+            "MICROCACHE_PURGE_URL": None,
+            **config,
+        })
+        with app.app_context():
+            # Nur die Hauptdatenbank: db merkt sich die Bind-Keys früherer Apps (Shards legt init_shards an)
+            db.create_all(bind_key=None)
+            if app.config.get('VM_SHARDS'):
+                sharding.init_shards(sharding.current_shards())
+        return app
+    return make
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+
+@pytest.fixture
+def sharded_app(make_app, tmp_path):
+    return make_app(SQLALCHEMY_BINDS={"vm0": f'sqlite:///{tmp_path / "vm0.db"}',
+                                      "vm1": f'sqlite:///{tmp_path / "vm1.db"}'},
+                    VM_SHARDS=['vm0', 'vm1'])
+
+
+# Legt Benutzer an (im aktiven App-Kontext). Alle eindeutigen Spalten erhalten eine laufende Nummer.
+@pytest.fixture
+def create_user():
+    numbers = itertools.count(1)
+
+    def create(username=None):
+        n = next(numbers)
+        user = User(firstname=f'first{n}', lastname=f'last{n}', birthday=f'2000-01-{n:02d}',
+                    username=username or f'user{n}', email=f'user{n}@example.com', password='x' * 60)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return create
+
+
+# Legt VMs über die Shards an (im aktiven App-Kontext) und gibt ihre IDs zurück.
+@pytest.fixture
+def create_vms():
+    addresses = itertools.count(1)
+
+    def create(user_id, count=1):
+        shards = sharding.current_shards()
+        ids = []
+        for _ in range(count):
+            n = next(addresses)
+            vm = VM(name=f'vm{n}', description='test', cpu=1, ram=1024, hdd=10,
+                    ipv4_num=0x0A000000 + n, mac_num=n, user_id=user_id)
+            shards.add(vm).commit()
+            ids.append(vm.id)
+        return ids
+    return create
+
+
+# Meldet einen Test-Client als Benutzer an (ohne Login-Formular)
+@pytest.fixture
+def login():
+    def login(client, user_id):
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client
+    return login
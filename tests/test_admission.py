@@ -0,0 +1,62 @@
+# ======================================================================
+# Programm: tests.test_admission
+# Beschreibung: Tests für die Zugangskontrolle (429/503 mit Retry-After).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import pytest
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def admission_app(request, make_app, tmp_path):
+    return make_app(ADMISSION_ENABLED=True, ADMISSION_BACKEND=request.param,
+                    ADMISSION_SQLITE_PATH=str(tmp_path / 'admission.db'),
+                    RATELIMIT_ROUTES={"api.get_vms": (1.0, 3), "POST auth.login": (0.1, 1)},
+                    CONCURRENCY_LIMITS={"api.get_users": 1})
+
+
+@pytest.fixture
+def client(admission_app, create_user, login):
+    with admission_app.app_context():
+        user_id = create_user().id
+    return login(admission_app.test_client(), user_id)
+
+
+def test_route_limit_returns_429_with_retry_after(client):
+    assert [client.get('/api/vms').status_code for _ in range(3)] == [200, 200, 200]
+    response = client.get('/api/vms')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.json == {"error": 'Too Many Requests', "retry_after": int(response.headers['Retry-After'])}
+
+
+def test_route_limit_is_per_client(admission_app, client, create_user, login):
+    for _ in range(4):
+        client.get('/api/vms')
+    with admission_app.app_context():
+        other_id = create_user().id
+    other = login(admission_app.test_client(), other_id)
+    assert other.get('/api/vms').status_code == 200
+
+
+def test_html_pages_get_429_page(admission_app):
+    client = admission_app.test_client()
+    data = {"email": 'nobody@example.com', "password": 'wrong'}
+    assert client.post('/login', data=data).status_code != 429
+    response = client.post('/login', data=data)
+    assert response.status_code == 429
+    assert response.mimetype == 'text/html'
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_concurrency_limit_returns_503(admission_app, client):
+    backend = admission_app.extensions['admission'].backend
+    assert backend.acquire('concurrency:api.get_users', 1)
+    try:
+        response = client.get('/api/users')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        backend.release('concurrency:api.get_users')
+    assert client.get('/api/users').status_code == 200
@@ -0,0 +1,72 @@
+# ======================================================================
+# Programm: tests.test_api_batch
+# Beschreibung: Tests für /api/vms?ids= und /api/users/<id>/vms.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import pytest
+
+import sharding
+
+
+@pytest.fixture(params=['single', 'sharded'])
+def api_app(request, make_app, tmp_path):
+    if request.param == 'single':
+        return make_app()
+    return make_app(SQLALCHEMY_BINDS={"vm0": f'sqlite:///{tmp_path / "vm0.db"}',
+                                      "vm1": f'sqlite:///{tmp_path / "vm1.db"}'},
+                    VM_SHARDS=['vm0', 'vm1'])
+
+
+@pytest.fixture
+def setup(api_app, create_user, create_vms, login):
+    with api_app.app_context():
+        alice, bob = create_user('alice'), create_user('bob')
+        ids = {"alice": create_vms(alice.id, 3), "bob": create_vms(bob.id, 2)}
+        users = {"alice": alice.id, "bob": bob.id}
+    return login(api_app.test_client(), users['alice']), users, ids
+
+
+def test_ids_returns_requested_order_with_not_found_markers(setup):
+    client, users, ids = setup
+    wanted = [ids['bob'][1], 999999, ids['alice'][0], ids['bob'][1]]
+    response = client.get('/api/vms?fields=id,author&ids=' + ','.join(map(str, wanted)))
+    assert response.status_code == 200
+    assert response.json == [
+        {"1_id": ids['bob'][1], "8_author": 'bob'},
+        {"1_id": 999999, "not_found": True},
+        {"1_id": ids['alice'][0], "8_author": 'alice'},
+        {"1_id": ids['bob'][1], "8_author": 'bob'},
+    ]
+
+
+def test_ids_are_queried_in_chunks(setup, monkeypatch):
+    client, users, ids = setup
+    monkeypatch.setattr(sharding, 'IN_CHUNK_SIZE', 2)
+    monkeypatch.setattr(sharding.chunked, '__defaults__', (2,))
+    everything = ids['alice'] + ids['bob']
+    response = client.get('/api/vms?fields=id&ids=' + ','.join(map(str, reversed(everything))))
+    assert [vm['1_id'] for vm in response.json] == list(reversed(everything))
+
+
+@pytest.mark.parametrize('query', ['ids=', 'ids=,', 'ids=1,x', 'ids=1;2'])
+def test_invalid_ids_return_400(setup, query):
+    client, _, _ = setup
+    assert client.get(f'/api/vms?{query}').status_code == 400
+
+
+def test_too_many_ids_return_400(setup, api_app):
+    client, _, _ = setup
+    api_app.config['API_MAX_IDS'] = 3
+    assert client.get('/api/vms?ids=1,2,3,4').status_code == 400
+
+
+def test_owner_vms_and_counts(setup):
+    client, users, ids = setup
+    response = client.get(f"/api/users/{users['bob']}/vms?fields=id&with_count=1")
+    assert response.json == {"user_id": users['bob'], "username": 'bob', "vm_count": 2,
+                             "vms": [{"1_id": vm_id} for vm_id in ids['bob']]}
+    response = client.get(f"/api/users/{users['alice']}/vms?count_only=1")
+    assert response.json == {"user_id": users['alice'], "username": 'alice', "vm_count": 3}
+    assert client.get('/api/users/999/vms').status_code == 404
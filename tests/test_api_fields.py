@@ -0,0 +1,82 @@
+# ======================================================================
+# Programm: tests.test_api_fields
+# Beschreibung: Tests für die Feldauswahl ?fields= von /api/vms und /api/users.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+@pytest.fixture(params=['single', 'sharded'])
+def fields_app(request, create_user, create_vms):
+    app = request.getfixturevalue('app' if request.param == 'single' else 'sharded_app')
+    with app.app_context():
+        alice, bob = create_user('alice'), create_user('bob')
+        create_vms(alice.id)
+        create_vms(bob.id)
+    return app
+
+
+# Sammelt die SELECT-Anweisungen auf die angegebene Tabelle (alle Engines, inkl. Shards)
+@pytest.fixture
+def selects():
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(' '.join(statement.split()))
+    event.listen(Engine, 'before_cursor_execute', collect)
+    yield lambda table: [statement for statement in statements if f'FROM "{table}"' in statement]
+    event.remove(Engine, 'before_cursor_execute', collect)
+
+
+def test_vms_returns_only_requested_fields(fields_app, selects):
+    response = fields_app.test_client().get('/api/vms?fields=name,ipv4')
+    assert response.status_code == 200
+    assert response.json == [{"2_name": 'vm1', "6_ipv4": '10.0.0.1'}, {"2_name": 'vm2', "6_ipv4": '10.0.0.2'}]
+    assert selects('VM')
+    for statement in selects('VM'):
+        columns = statement.split(' FROM ')[0]
+        assert '"VM".name' in columns and '"VM".ipv4_num' in columns
+        assert 'description' not in columns and 'cpu' not in columns and 'JOIN' not in statement
+
+
+def test_vms_author_adds_usernames(fields_app, selects):
+    response = fields_app.test_client().get('/api/vms?fields=id,author')
+    assert [item['8_author'] for item in response.json] == ['alice', 'bob']
+    if fields_app.config.get('VM_SHARDS'):
+        # 'User' liegt nicht auf den Shards: Namen werden mit einer IN-Abfrage nachgeladen
+        assert all('JOIN' not in statement for statement in selects('VM'))
+        assert any('"User".id IN' in statement for statement in selects('User'))
+    else:
+        assert any('JOIN "User"' in statement for statement in selects('VM'))
+
+
+def test_vms_without_fields_returns_everything(fields_app):
+    item = fields_app.test_client().get('/api/vms').json[0]
+    assert set(item) == {'1_id', '2_name', '3_cpu', '4_ram', '5_hdd', '6_ipv4', '7_description', '8_author'}
+
+
+def test_users_returns_only_requested_fields(fields_app, selects):
+    response = fields_app.test_client().get('/api/users?fields=username,email')
+    assert response.json == [{"Username": 'alice', "E-Mail": 'user1@example.com'},
+                             {"Username": 'bob', "E-Mail": 'user2@example.com'}]
+    statement, = selects('User')
+    assert 'password' not in statement and 'firstname' not in statement
+
+
+def test_users_never_read_the_password(fields_app, selects):
+    item = fields_app.test_client().get('/api/users').json[0]
+    assert set(item) == {'id', 'Username', 'Firstname', 'Lastname', 'E-Mail', 'Birthday'}
+    assert all('password' not in statement for statement in selects('User'))
+
+
+@pytest.mark.parametrize('url', ['/api/vms?fields=name,secret', '/api/users?fields=password',
+                                 '/api/vms?fields=,', '/api/users?fields=id,,nope'])
+def test_unknown_fields_return_400(fields_app, url):
+    response = fields_app.test_client().get(url)
+    assert response.status_code == 400
+    assert response.json['error']
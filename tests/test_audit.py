@@ -0,0 +1,152 @@
+# ======================================================================
+# Programm: tests.test_audit
+# Beschreibung: Tests für das Write-Behind Audit-Log.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import io
+import json
+import os
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+import audit
+import sharding
+from extensions import db
+from models import AuditLog, VM
+
+
+def audit_rows(app, **filters):
+    with app.app_context():
+        app.extensions['audit'].stop()
+        return db.session.execute(select(AuditLog).filter_by(**filters).order_by(AuditLog.id)).scalars().all()
+
+
+@pytest.mark.parametrize('mode', ['single', 'sharded'])
+def test_import_writes_insert_entries(request, mode, create_user, login):
+    app = request.getfixturevalue('app' if mode == 'single' else 'sharded_app')
+    with app.app_context():
+        owner_id = create_user().id
+    # Die dritte Zeile verletzt die eindeutige IPv4: der Batch wird Zeile für Zeile wiederholt
+    data = ('name,description,cpu,ram,hdd,ipv4,mac\n'
+            'a,,1,1024,10,10.1.0.1,00:00:00:00:01:01\n'
+            'b,,2,2048,20,10.1.0.2,00:00:00:00:01:02\n'
+            'c,,3,4096,30,10.1.0.1,00:00:00:00:01:03\n')
+    client = login(app.test_client(), owner_id)
+    response = client.post('/api/vms/import', data={"file": (io.BytesIO(data.encode()), 'vms.csv')})
+    assert response.json['inserted'] == 2 and response.json['failed'] == 1
+
+    entries = audit_rows(app, table_name='VM')
+    assert [entry.action for entry in entries] == ['insert', 'insert']
+    assert all(entry.actor_id == owner_id for entry in entries)
+    with app.app_context():
+        shards = sharding.current_shards()
+        for entry in entries:
+            changes = json.loads(entry.changes)
+            assert changes['id'] == entry.record_id
+            assert shards.get(entry.record_id).name == changes['name']
+        assert sorted(json.loads(entry.changes)['name'] for entry in entries) == ['a', 'b']
+
+
+def test_insert_update_delete_are_captured(app, create_user):
+    with app.app_context():
+        user = create_user()
+        user_id = user.id
+        user.email = 'changed@example.com'
+        db.session.commit()
+        db.session.delete(user)
+        db.session.commit()
+    entries = audit_rows(app, table_name='User', record_id=user_id)
+    assert [entry.action for entry in entries] == ['insert', 'update', 'delete']
+    inserted, updated, deleted = (json.loads(entry.changes) for entry in entries)
+    assert inserted['email'] == 'user1@example.com' and inserted['password'] == '***'
+    assert updated == {"email": ['user1@example.com', 'changed@example.com']}
+    assert deleted['email'] == 'changed@example.com' and deleted['password'] == '***'
+
+
+def test_password_change_is_masked(app, create_user):
+    with app.app_context():
+        user = create_user()
+        user.password = 'y' * 60
+        db.session.commit()
+        user_id = user.id
+    update, = audit_rows(app, table_name='User', record_id=user_id, action='update')
+    assert json.loads(update.changes)['password'] == ['***', '***']
+
+
+def test_unchanged_values_are_not_logged(app, create_user, create_vms):
+    with app.app_context():
+        vm_id, = create_vms(create_user().id)
+        vm = db.session.get(VM, vm_id)
+        vm.hdd = '10'
+        vm.name = vm.name
+        db.session.commit()
+        vm.hdd = '20'
+        db.session.commit()
+    entries = audit_rows(app, table_name='VM', record_id=vm_id)
+    assert [entry.action for entry in entries] == ['insert', 'update']
+    assert json.loads(entries[1].changes)['hdd'][1] == 20
+
+
+def test_rollback_discards_entries(app, create_user):
+    with app.app_context():
+        user = create_user()
+        user_id = user.id
+        user.email = 'rolled-back@example.com'
+        db.session.flush()
+        db.session.rollback()
+    assert [entry.action for entry in audit_rows(app, record_id=user_id)] == ['insert']
+
+
+def idle_writer(app, monkeypatch, maxsize):
+    # Writer ohne Hintergrund-Thread, damit die Queue gezielt gefüllt werden kann
+    writer = audit.AuditWriter(app, db, AuditLog.__table__, (), maxsize=maxsize)
+    monkeypatch.setattr(writer, '_ensure_started', lambda: None)
+    return writer
+
+
+def entry(record_id):
+    return audit._row_entry('insert', 'VM', record_id, {"id": record_id}, None, audit._now())
+
+
+def test_full_queue_drops_entries(app, monkeypatch):
+    writer = idle_writer(app, monkeypatch, maxsize=2)
+    writer.submit([entry(1), entry(2), entry(3)])
+    assert writer.queue.qsize() == 2
+    assert writer.dropped == 1
+
+
+def test_stop_writes_queued_entries(app, monkeypatch):
+    writer = idle_writer(app, monkeypatch, maxsize=10)
+    writer.submit([entry(n) for n in range(1, 6)])
+    # Bereits beendeter Writer-Thread: stop() muss den Rest der Queue selbst schreiben
+    writer._thread = threading.Thread(target=lambda: None)
+    writer._thread.start()
+    writer._pid = os.getpid()
+    writer.stop()
+    assert writer.written == 5 and writer.queue.empty()
+    with app.app_context():
+        assert db.session.execute(select(func.count()).select_from(AuditLog)).scalar() == 5
+
+
+def test_api_audit_pages_and_filters(app, create_user, create_vms, login):
+    with app.app_context():
+        owner_id = create_user().id
+        vm_ids = create_vms(owner_id, count=3)
+    audit_rows(app)
+    client = login(app.test_client(), owner_id)
+
+    first = client.get('/api/audit?per_page=2').json
+    assert first['total'] == 4 and first['pages'] == 2 and first['page'] == 1
+    assert [item['record_id'] for item in first['items']] == [vm_ids[2], vm_ids[1]]
+    second = client.get('/api/audit?per_page=2&page=2').json
+    assert [(item['table'], item['record_id']) for item in second['items']] == [('VM', vm_ids[0]), ('User', owner_id)]
+
+    vms = client.get('/api/audit?table=VM').json
+    assert vms['total'] == 3 and {item['table'] for item in vms['items']} == {'VM'}
+    one = client.get(f'/api/audit?table=VM&record_id={vm_ids[1]}').json
+    assert one['total'] == 1 and one['items'][0]['changes']['name'] == 'vm2'
+    assert client.get('/api/audit?table=Nope').json['total'] == 0
@@ -0,0 +1,88 @@
+# ======================================================================
+# Programm: tests.test_inet
+# Beschreibung: Tests für die Umwandlung von IPv4-/MAC-Adressen und den Subnetz-Filter ?cidr=.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import ipaddress
+
+import pytest
+
+import inet
+
+
+@pytest.mark.parametrize('address', ['0.0.0.0', '10.4.1.7', '192.168.0.255', '255.255.255.255'])
+def test_ipv4_round_trip(address):
+    assert inet.int_to_ipv4(inet.ipv4_to_int(address)) == address
+    assert inet.ipv4_to_int(address) == int(ipaddress.IPv4Address(address))
+
+
+@pytest.mark.parametrize('address, expected', [
+    ('00:00:00:00:00:00', '00:00:00:00:00:00'),
+    ('02:42:ac:11:00:02', '02:42:ac:11:00:02'),
+    ('FF-FF-FF-FF-FF-FF', 'ff:ff:ff:ff:ff:ff'),
+])
+def test_mac_round_trip(address, expected):
+    assert inet.int_to_mac(inet.mac_to_int(address)) == expected
+
+
+@pytest.mark.parametrize('address', ['', '10.0.0', '10.0.0.256', '10.0.0.1/24', '::1', 'localhost'])
+def test_invalid_ipv4_is_rejected(address):
+    with pytest.raises(ValueError, match='Invalid IPv4 address'):
+        inet.ipv4_to_int(address)
+
+
+@pytest.mark.parametrize('address', ['', '02:42:ac:11:00', '02:42-ac:11:00:02', '0242ac110002', '02:42:ac:11:00:0g'])
+def test_invalid_mac_is_rejected(address):
+    with pytest.raises(ValueError, match='Invalid MAC address'):
+        inet.mac_to_int(address)
+
+
+@pytest.mark.parametrize('value', [-1, inet.IPV4_MAX + 1])
+def test_int_to_ipv4_rejects_out_of_range(value):
+    with pytest.raises(ipaddress.AddressValueError):
+        inet.int_to_ipv4(value)
+
+
+def test_cidr_range_ignores_host_bits():
+    assert inet.cidr_range('10.4.1.7/22') == (inet.ipv4_to_int('10.4.0.0'), inet.ipv4_to_int('10.4.3.255'))
+    assert inet.cidr_range('10.4.1.7/32') == (inet.ipv4_to_int('10.4.1.7'),) * 2
+    assert inet.cidr_range('0.0.0.0/0') == (0, inet.IPV4_MAX)
+
+
+@pytest.mark.parametrize('cidr', ['10.4.0.0/33', '10.4.0/22', 'abc', '::/0'])
+def test_invalid_cidr_is_rejected(cidr):
+    with pytest.raises(ValueError, match='Invalid IPv4 network'):
+        inet.cidr_range(cidr)
+
+
+@pytest.fixture(params=['single', 'sharded'])
+def vm_client(request, create_user, create_vms):
+    app = request.getfixturevalue('app' if request.param == 'single' else 'sharded_app')
+    with app.app_context():
+        # 10.0.0.1 bis 10.0.0.4, verteilt auf zwei Besitzer (bzw. zwei Shards)
+        for user_id in (create_user().id, create_user().id):
+            create_vms(user_id, count=2)
+    return app.test_client()
+
+
+def test_api_vms_cidr_filter(vm_client):
+    response = vm_client.get('/api/vms?fields=ipv4&cidr=10.0.0.2/31')
+    assert response.status_code == 200
+    assert response.json == [{"6_ipv4": '10.0.0.2'}, {"6_ipv4": '10.0.0.3'}]
+    assert len(vm_client.get('/api/vms?cidr=10.0.0.0/24').json) == 4
+    assert vm_client.get('/api/vms?cidr=192.168.0.0/16').json == []
+
+
+def test_view_vms_cidr_filter(vm_client):
+    page = vm_client.get('/view_vms?cidr=10.0.0.2/31').get_data(as_text=True)
+    assert '10.0.0.2' in page and '10.0.0.3' in page
+    assert '10.0.0.1' not in page and '10.0.0.4' not in page
+
+
+def test_invalid_cidr_returns_400(vm_client):
+    response = vm_client.get('/api/vms?cidr=10.0.0.0/40')
+    assert response.status_code == 400
+    assert 'Invalid IPv4 network' in response.json['error']
+    assert vm_client.get('/view_vms?cidr=nonsense').status_code == 400
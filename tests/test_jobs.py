@@ -0,0 +1,151 @@
+# ======================================================================
+# Programm: tests.test_jobs
+# Beschreibung: Tests für die Hintergrund-Jobs (Übernahme, Wiederholung, Parameter, Lebenszeichen).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import json
+import threading
+import time
+
+import pytest
+from sqlalchemy import update
+
+import jobs
+import sharding
+from extensions import db
+from models import Job, User
+
+
+@pytest.fixture
+def job_app(make_app):
+    return make_app(JOBS_RETRY_BACKOFF=0, JOBS_MAX_ATTEMPTS=3)
+
+
+def _claim_concurrently(app, workers):
+    barrier = threading.Barrier(workers)
+    claimed = []
+
+    def work(name):
+        with app.app_context():
+            barrier.wait()
+            while (job_id := jobs.claim(name)) is not None:
+                claimed.append(job_id)
+    threads = [threading.Thread(target=work, args=(f'worker-{n}',)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return claimed
+
+
+def test_job_is_claimed_exactly_once(job_app):
+    with job_app.app_context():
+        job_id = jobs.submit('recompute_inventory').id
+    assert _claim_concurrently(job_app, 8) == [job_id]
+    with job_app.app_context():
+        job_row = db.session.get(Job, job_id)
+        assert (job_row.status, job_row.attempts) == ('running', 1)
+
+
+def test_many_jobs_are_each_claimed_once(job_app):
+    with job_app.app_context():
+        submitted = [jobs.submit('recompute_inventory').id for _ in range(30)]
+    claimed = _claim_concurrently(job_app, 4)
+    assert sorted(claimed) == submitted
+
+
+def test_failing_job_is_retried_until_max_attempts(job_app, monkeypatch):
+    calls = []
+
+    def flaky(context):
+        calls.append(context.attempt)
+        raise RuntimeError('database unavailable')
+    monkeypatch.setitem(jobs.REGISTRY, 'flaky', flaky)
+    with job_app.app_context():
+        job_id = jobs.submit('flaky').id
+        statuses = []
+        while (claimed := jobs.claim('worker')) is not None:
+            statuses.append(jobs.run(claimed, 'worker'))
+        assert statuses == ['queued', 'queued', 'failed']
+        assert calls == [1, 2, 3]
+        assert 'database unavailable' in db.session.get(Job, job_id).error
+
+
+def test_invalid_payload_is_rejected(job_app, create_user, login):
+    with job_app.app_context():
+        user_id = create_user().id
+        with pytest.raises(ValueError):
+            jobs.submit('delete_user', {"userid": 1})
+    client = login(job_app.test_client(), user_id)
+    response = client.post('/api/jobs', json={"kind": 'recompute_inventory', "payload": {"bogus": 1}})
+    assert response.status_code == 400
+    assert 'bogus' in response.json['error']
+
+
+def test_stored_invalid_payload_fails_without_retry(job_app):
+    with job_app.app_context():
+        now = jobs._now()
+        job_row = Job(kind='delete_user', payload=json.dumps({"userid": 1}), status='queued',
+                      max_attempts=3, run_after=now, created_at=now)
+        db.session.add(job_row)
+        db.session.commit()
+        job_id = job_row.id
+        assert jobs.run(jobs.claim('worker'), 'worker') == 'failed'
+        assert db.session.get(Job, job_id).attempts == 1
+
+
+def test_heartbeat_keeps_long_job_from_being_requeued(make_app, monkeypatch):
+    app = make_app(JOBS_STALE_AFTER=0.3)
+    monkeypatch.setitem(jobs.REGISTRY, 'slow', lambda context: time.sleep(1.0) or {"slept": True})
+    requeued = []
+    with app.app_context():
+        job_id = jobs.submit('slow').id
+        jobs.claim('worker')
+        done = threading.Event()
+
+        def reaper():
+            with app.app_context():
+                while not done.wait(0.1):
+                    requeued.append(jobs.requeue_stale(0.3))
+        thread = threading.Thread(target=reaper)
+        thread.start()
+        try:
+            assert jobs.run(job_id, 'worker') == 'succeeded'
+        finally:
+            done.set()
+            thread.join()
+    assert sum(requeued) == 0
+
+
+def test_result_of_requeued_job_is_discarded(job_app, monkeypatch):
+    def lost(context):
+        # Während der Job läuft, gilt der Worker als verwaist und ein anderer übernimmt den Job
+        with db.engine.begin() as connection:
+            connection.execute(update(Job.__table__).where(Job.__table__.c.id == context.job_id)
+                               .values(status='running', worker='other'))
+        return {"done": True}
+    monkeypatch.setitem(jobs.REGISTRY, 'lost', lost)
+    with job_app.app_context():
+        job_id = jobs.submit('lost').id
+        assert jobs.run(jobs.claim('worker'), 'worker') is None
+        job_row = db.session.get(Job, job_id)
+        assert (job_row.status, job_row.worker, job_row.result) == ('running', 'other', None)
+
+
+@pytest.mark.parametrize('offload', [False, True])
+def test_delete_user_with_vms(make_app, create_user, create_vms, login, offload):
+    app = make_app(JOBS_OFFLOAD=offload)
+    with app.app_context():
+        owner_id = create_user().id
+        create_vms(owner_id, count=3)
+        admin_id = create_user().id
+    response = login(app.test_client(), admin_id).post(f'/delete_user/{owner_id}')
+    assert response.status_code == 302
+    with app.app_context():
+        if offload:
+            assert db.session.get(User, owner_id) is not None
+            assert jobs.run(jobs.claim('worker'), 'worker') == 'succeeded'
+        assert db.session.get(User, owner_id) is None
+        assert sharding.current_shards().count_for_owner(owner_id) == 0
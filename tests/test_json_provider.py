@@ -0,0 +1,99 @@
+# ======================================================================
+# Programm: tests.test_json_provider
+# Beschreibung: Tests für den orjson-Provider im Vergleich zum Standard-Provider von Flask.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import datetime
+import decimal
+import uuid
+
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+import json_provider
+
+pytest.importorskip('orjson')
+
+SAMPLE = {
+    "zeta": 1,
+    "alpha": [1.5, None, True, 'text'],
+    "created": datetime.datetime(2024, 9, 15, 12, 30, 5),
+    "birthday": datetime.date(2000, 1, 31),
+    "nested": {"b": 2, "a": {"d": 4, "c": 3}},
+    "price": decimal.Decimal('9.90'),
+    "id": uuid.UUID('12345678-1234-5678-1234-567812345678'),
+}
+
+
+def providers(debug=False):
+    app = Flask(__name__)
+    app.debug = debug
+    return DefaultJSONProvider(app), json_provider.OrjsonProvider(app), app
+
+
+@pytest.mark.parametrize('debug', [False, True])
+def test_response_matches_stdlib(debug):
+    stdlib, fast, app = providers(debug)
+    with app.app_context():
+        assert fast.response(SAMPLE).get_data() == stdlib.response(SAMPLE).get_data()
+        assert fast.response(SAMPLE).mimetype == stdlib.response(SAMPLE).mimetype
+
+
+def test_dumps_matches_stdlib():
+    stdlib, fast, _ = providers()
+    # dumps() ist kompakt, der Standard-Provider schreibt Leerzeichen nach ',' und ':'
+    assert fast.dumps(SAMPLE) == stdlib.dumps(SAMPLE, separators=(',', ':'))
+    assert fast.dumps({"b": 1, "a": 2}) == '{"a":2,"b":1}'
+    # Eigene Optionen übernimmt der Standard-Provider
+    assert fast.dumps(SAMPLE, indent=4) == stdlib.dumps(SAMPLE, indent=4)
+
+
+def test_dates_are_http_dates():
+    _, fast, _ = providers()
+    assert fast.dumps({"d": datetime.date(2000, 1, 31)}) == '{"d":"Mon, 31 Jan 2000 00:00:00 GMT"}'
+    assert fast.dumps({"d": datetime.datetime(2024, 9, 15, 12, 30, 5)}) == '{"d":"Sun, 15 Sep 2024 12:30:05 GMT"}'
+
+
+def test_non_ascii_is_written_as_utf8():
+    stdlib, fast, _ = providers()
+    data = {"name": 'Künzler'}
+    assert fast.dumps(data) == '{"name":"Künzler"}'
+    assert stdlib.loads(fast.dumps(data)) == fast.loads(stdlib.dumps(data)) == data
+    assert fast.loads(b'{"a": [1, 2]}') == {"a": [1, 2]}
+
+
+def test_unsorted_keys_keep_their_order():
+    stdlib, fast, app = providers()
+    stdlib.sort_keys = fast.sort_keys = False
+    data = {"b": 1, "a": 2}
+    assert fast.dumps(data) == '{"b":1,"a":2}'
+    with app.app_context():
+        assert fast.response(data).get_data() == stdlib.response(data).get_data() == b'{"b":1,"a":2}\n'
+
+
+@pytest.mark.parametrize('choice, expected', [('auto', json_provider.OrjsonProvider),
+                                              ('orjson', json_provider.OrjsonProvider),
+                                              ('stdlib', DefaultJSONProvider)])
+def test_init_json_choice(choice, expected):
+    app = Flask(__name__)
+    app.config['JSON_PROVIDER'] = choice
+    assert type(json_provider.init_json(app)) is expected
+    assert type(app.json) is expected
+
+
+def test_init_json_rejects_unknown_choice():
+    app = Flask(__name__)
+    app.config['JSON_PROVIDER'] = 'ujson'
+    with pytest.raises(ValueError):
+        json_provider.init_json(app)
+
+
+def test_app_uses_configured_provider(make_app):
+    assert isinstance(make_app().json, json_provider.OrjsonProvider)
+    app = make_app(JSON_PROVIDER='stdlib')
+    assert type(app.json) is DefaultJSONProvider
+    response = app.test_client().get('/api/users')
+    assert response.status_code == 200 and response.json == []
@@ -0,0 +1,98 @@
+# ======================================================================
+# Programm: tests.test_microcache
+# Beschreibung: Tests für die Cache-Header des Micro-Caches und das Neuladen nach Änderungen.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import io
+
+import pytest
+
+import microcache
+
+
+@pytest.fixture
+def cache_app(make_app):
+    return make_app(MICROCACHE_TTL=5)
+
+
+def test_cached_endpoints_get_headers(cache_app):
+    client = cache_app.test_client()
+    for url in ('/api/vms', '/api/users', '/api/vms?fields=id'):
+        response = client.get(url)
+        assert response.headers['X-Accel-Expires'] == '5'
+        assert response.headers['Cache-Control'] == 'public, max-age=0, s-maxage=5'
+
+
+@pytest.mark.parametrize('url', ['/view_vms', '/api/singleflight', '/api/users/1/vms'])
+def test_other_endpoints_get_no_headers(cache_app, url):
+    response = cache_app.test_client().get(url)
+    assert 'X-Accel-Expires' not in response.headers
+    assert 's-maxage' not in response.headers.get('Cache-Control', '')
+
+
+def test_errors_get_no_headers(cache_app):
+    response = cache_app.test_client().get('/api/vms?fields=nope')
+    assert response.status_code == 400
+    assert 'X-Accel-Expires' not in response.headers
+
+
+def test_authenticated_responses_get_no_headers(cache_app, create_user, login):
+    with cache_app.app_context():
+        user_id = create_user().id
+    client = login(cache_app.test_client(), user_id)
+    response = client.get('/api/vms')
+    assert response.status_code == 200
+    assert 'X-Accel-Expires' not in response.headers
+
+
+def test_ttl_zero_disables_caching(make_app):
+    app = make_app(MICROCACHE_TTL=0, MICROCACHE_PURGE_URL='http://nginx:8080')
+    assert 'X-Accel-Expires' not in app.test_client().get('/api/vms').headers
+    assert 'microcache' not in app.extensions
+
+
+# Zählt die angeforderten Purges, statt nginx aufzurufen
+@pytest.fixture
+def purges(make_app, monkeypatch, create_user, create_vms, login):
+    calls = []
+    monkeypatch.setattr(microcache.Purger, 'purge', lambda self: calls.append(1))
+    app = make_app(MICROCACHE_TTL=5, MICROCACHE_PURGE_URL='http://nginx:8080')
+    with app.app_context():
+        user_id = create_user().id
+        vm_id, = create_vms(user_id)
+        other_id = create_user().id
+
+    def count(method, url, **kwargs):
+        calls.clear()
+        response = getattr(login(app.test_client(), user_id), method)(url, **kwargs)
+        assert response.status_code in (200, 302), response.get_data(as_text=True)
+        return len(calls)
+    count.ids = {"user": user_id, "vm": vm_id, "other": other_id}
+    return count
+
+
+VM_FORM = {"name": 'web', "description": '', "cpu": '2', "ram": '2048', "hdd": '20',
+           "ipv4": '10.9.0.1', "mac": '00:00:00:00:09:01'}
+
+
+def test_write_routes_queue_a_purge(purges):
+    ids = purges.ids
+    assert purges('post', '/vm/new', data=VM_FORM) == 1
+    edited = {**VM_FORM, "ipv4": '10.9.0.2', "mac": '00:00:00:00:09:02'}
+    assert purges('post', f'/edit_vm/{ids["vm"]}', data=edited) == 1
+    assert purges('post', f'/delete_vm/{ids["vm"]}') == 1
+    assert purges('post', f'/edit_user/{ids["other"]}', data={"email": 'new@example.com', "firstname": 'f',
+                                                              "lastname": 'l', "birthday": '1999-01-01'}) == 1
+    assert purges('post', f'/delete_user/{ids["other"]}') == 1
+    assert purges('post', '/register', data={"firstname": 'Neu', "lastname": 'User', "birthday": '1990-05-05',
+                                             "username": 'neu', "email": 'neu@example.com',
+                                             "password": 'secret', "confirm_password": 'secret'}) == 1
+    data = 'name,description,cpu,ram,hdd,ipv4,mac\nimp,,1,1,1,10.9.1.1,00:00:00:00:09:11\n'
+    assert purges('post', '/api/vms/import', data={"file": (io.BytesIO(data.encode()), 'vms.csv')}) == 1
+
+
+def test_reads_queue_no_purge(purges):
+    assert purges('get', '/api/vms') == 0
+    assert purges('get', '/view_vms') == 0
@@ -0,0 +1,125 @@
+# ======================================================================
+# Programm: tests.test_profiling
+# Beschreibung: Tests für das Profiling einzelner Anfragen (Tokens, Sampling, Dateien, Rotation).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import collections
+import glob
+import json
+import os
+import re
+
+import pytest
+from itsdangerous import URLSafeTimedSerializer
+
+import profiling
+
+
+@pytest.fixture
+def profile_app(make_app, tmp_path):
+    def make(**config):
+        return make_app(PROFILING_ENABLED=True, PROFILING_DIR=str(tmp_path / 'profiles'),
+                        PROFILING_INTERVAL=0.001, **config)
+    return make
+
+
+def summaries(app):
+    return sorted(glob.glob(os.path.join(app.config['PROFILING_DIR'], '*[0-9].json')))
+
+
+def test_token_profiles_request(profile_app):
+    app = profile_app()
+    token = profiling.create_token(app, 'alice')
+    response = app.test_client().get('/api/vms?fields=id', headers={"X-Profile": token})
+    assert response.status_code == 200
+    name = response.headers['X-Profile-Id']
+    base = os.path.join(app.config['PROFILING_DIR'], name)
+
+    with open(base + '.json', encoding='utf-8') as f:
+        summary = json.load(f)
+    assert summary['name'] == name and summary['trigger'] == 'token:alice'
+    assert (summary['endpoint'], summary['status'], summary['path']) == ('api.get_vms', 200, '/api/vms?fields=id')
+    assert summary['sql_count'] >= 1 and summary['sql'][0]['statement'].startswith('SELECT')
+
+    with open(base + '.collapsed.txt', encoding='utf-8') as f:
+        assert all(re.fullmatch(r'\S.* \d+', line) for line in f.read().splitlines())
+    with open(base + '.speedscope.json', encoding='utf-8') as f:
+        speedscope = json.load(f)
+    assert speedscope['$schema'] == 'https://www.speedscope.app/file-format-schema.json'
+    sampled, evented = speedscope['profiles']
+    assert sampled['type'] == 'sampled' and evented['type'] == 'evented'
+    frames = [frame['name'] for frame in speedscope['shared']['frames']]
+    assert any(label.startswith('SQL SELECT') for label in frames)
+
+
+def test_token_in_query_is_not_stored(profile_app):
+    app = profile_app()
+    token = profiling.create_token(app, 'bob')
+    response = app.test_client().get(f'/api/users?_profile={token}')
+    with open(summaries(app)[0], encoding='utf-8') as f:
+        assert json.load(f)['path'] == '/api/users'
+    assert 'X-Profile-Id' in response.headers
+
+
+@pytest.mark.parametrize('token', [
+    'garbage',
+    URLSafeTimedSerializer('other-secret', salt=profiling.SALT).dumps({"by": 'mallory'}),
+])
+def test_invalid_token_is_ignored(profile_app, token):
+    app = profile_app()
+    response = app.test_client().get('/api/vms', headers={"X-Profile": token})
+    assert response.status_code == 200 and 'X-Profile-Id' not in response.headers
+    assert summaries(app) == []
+    assert app.test_client().get('/api/profiles', headers={"X-Profile": token}).status_code == 403
+
+
+def test_expired_token_is_ignored(profile_app):
+    app = profile_app(PROFILING_TOKEN_MAX_AGE=-1)
+    response = app.test_client().get('/api/vms', headers={"X-Profile": profiling.create_token(app, 'alice')})
+    assert 'X-Profile-Id' not in response.headers
+    assert summaries(app) == []
+
+
+def test_every_nth_request_is_sampled(profile_app):
+    app = profile_app(PROFILING_SAMPLE_RATE=3)
+    client = app.test_client()
+    profiled = [client.get('/api/vms').headers.get('X-Profile-Id') is not None for _ in range(6)]
+    assert profiled == [False, False, True, False, False, True]
+    with open(summaries(app)[0], encoding='utf-8') as f:
+        assert json.load(f)['trigger'] == 'sample'
+
+
+def test_only_newest_profiles_are_kept(profile_app):
+    app = profile_app(PROFILING_SAMPLE_RATE=1, PROFILING_KEEP=2)
+    client = app.test_client()
+    names = [client.get('/api/vms').headers['X-Profile-Id'] for _ in range(4)]
+    files = sorted(os.listdir(app.config['PROFILING_DIR']))
+    kinds = ('json', 'collapsed.txt', 'speedscope.json')
+    assert files == sorted(f'{name}.{kind}' for name in names[2:] for kind in kinds)
+
+    token = profiling.create_token(app, 'alice')
+    listed = client.get('/api/profiles', headers={"X-Profile": token}).json
+    assert [profile['name'] for profile in listed] == names[:1:-1]
+    collapsed = client.get(f'/api/profiles/{names[3]}?format=collapsed', headers={"X-Profile": token})
+    assert collapsed.status_code == 200 and collapsed.mimetype == 'text/plain'
+
+
+def test_disabled_registers_nothing(make_app, tmp_path):
+    app = make_app(PROFILING_ENABLED=False, PROFILING_DIR=str(tmp_path / 'profiles'), PROFILING_SAMPLE_RATE=1)
+    assert 'profiling' not in app.extensions
+    hooks = [*app.before_request_funcs.get(None, ()), *app.after_request_funcs.get(None, ()),
+             *app.teardown_request_funcs.get(None, ())]
+    assert not any(isinstance(getattr(hook, '__self__', None), profiling.Profiler) for hook in hooks)
+    token = profiling.create_token(app, 'alice')
+    response = app.test_client().get('/api/vms', headers={"X-Profile": token})
+    assert 'X-Profile-Id' not in response.headers
+    assert not os.path.exists(tmp_path / 'profiles')
+    assert app.test_client().get('/api/profiles', headers={"X-Profile": token}).status_code == 404
+
+
+def test_collapsed_stacks_format():
+    profile = profiling.RequestProfile(0.001, 'test')
+    profile.stacks = collections.Counter({("main (app.py:1)", "view (api.py:10)"): 3, ("main (app.py:1)",): 1})
+    assert profile.collapsed() == 'main (app.py:1);view (api.py:10) 3\nmain (app.py:1) 1\n'
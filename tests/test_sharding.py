@@ -0,0 +1,142 @@
+# ======================================================================
+# Programm: tests.test_sharding
+# Beschreibung: Tests für den Umzug eines Besitzers auf einen anderen Shard.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import pytest
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import object_session
+
+import sharding
+from models import ShardAssignment, VM
+
+
+def _ids_on(shards, index):
+    table = VM.__table__
+    with shards.engine(index).connect() as connection:
+        return sorted(connection.execute(select(table.c.id)).scalars())
+
+
+def _assignment(shards, user_id):
+    return shards.db.session.execute(
+        select(ShardAssignment.shard, ShardAssignment.moving_from)
+        .where(ShardAssignment.user_id == user_id)).one()
+
+
+def test_move_owner_copies_and_removes_source(sharded_app, create_user, create_vms):
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        owner = create_user()  # user_id 1 -> vm1
+        ids = create_vms(owner.id, 3)
+        assert _ids_on(shards, 1) == ids
+
+        assert sharding.move_owner(shards, owner.id, 'vm0', settle=0) == 3
+        assert _ids_on(shards, 0) == ids
+        assert _ids_on(shards, 1) == []
+        assert tuple(_assignment(shards, owner.id)) == ('vm0', None)
+
+
+# Ein Löschvorgang, der vor der Sperre geprüft wurde und während der Wartezeit committet,
+# darf auf dem Ziel-Shard nicht wieder auftauchen.
+def test_move_owner_racing_with_delete(sharded_app, create_user, create_vms, monkeypatch):
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        owner = create_user()
+        ids = create_vms(owner.id, 3)
+        table = VM.__table__
+
+        def delete_during_settle(seconds):
+            with shards.engine(1).begin() as connection:
+                connection.execute(delete(table).where(table.c.id == ids[0]))
+        monkeypatch.setattr(sharding.time, 'sleep', delete_during_settle)
+
+        assert sharding.move_owner(shards, owner.id, 'vm0') == 2
+        assert _ids_on(shards, 0) == ids[1:]
+        assert [vm.id for vm in shards.load_vms()] == ids[1:]
+
+
+def test_writes_are_rejected_while_owner_is_moving(sharded_app, create_user, create_vms, monkeypatch):
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        owner = create_user()
+        ids = create_vms(owner.id, 2)
+        rejected = []
+
+        def delete_during_move(seconds):
+            vm = shards.get(ids[0])
+            session = object_session(vm)
+            session.delete(vm)
+            with pytest.raises(sharding.OwnerMoving):
+                session.commit()
+            session.rollback()
+            with pytest.raises(sharding.OwnerMoving):
+                shards.partition([(1, {"user_id": owner.id})])
+            rejected.append(True)
+        monkeypatch.setattr(sharding.time, 'sleep', delete_during_move)
+
+        sharding.move_owner(shards, owner.id, 'vm0')
+        assert rejected
+        assert _ids_on(shards, 0) == ids
+        # Nach dem Umzug ist Schreiben wieder erlaubt
+        vm = shards.get(ids[0])
+        session = object_session(vm)
+        session.delete(vm)
+        session.commit()
+        assert _ids_on(shards, 0) == ids[1:]
+
+
+def test_delete_during_move_returns_503(sharded_app, create_user, create_vms, login):
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        owner = create_user()
+        vm_id, = create_vms(owner.id)
+        sharding._set_moving(shards, owner.id, 'vm1')
+        owner_id = owner.id
+    client = login(sharded_app.test_client(), owner_id)
+    response = client.post(f'/delete_vm/{vm_id}')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(sharding.MOVE_RETRY_AFTER)
+
+
+# Kopien eines abgebrochenen Umzugs: Leseabfragen geben jede VM nur einmal zurück, der
+# nächste Umzug löscht Kopien, die es auf dem alten Shard nicht mehr gibt.
+def test_leftover_copies_are_deduplicated_and_removed(sharded_app, create_user, create_vms, login):
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        owner = create_user()
+        ids = create_vms(owner.id, 2)
+        table = VM.__table__
+        with shards.engine(1).connect() as connection:
+            rows = [dict(row) for row in connection.execute(select(table)).mappings()]
+        orphan = dict(rows[0], id=ids[-1] + 100, ipv4_num=0x0B000000, mac_num=0xFFFF)
+        with shards.engine(0).begin() as connection:
+            connection.execute(insert(table), [rows[0], orphan])
+
+        assert [vm.id for vm in shards.load_vms()] == ids + [orphan['id']]
+        owner_id = owner.id
+    client = login(sharded_app.test_client(), owner_id)
+    assert [vm['1_id'] for vm in client.get('/api/vms?fields=id').json] == ids + [orphan['id']]
+
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        sharding.move_owner(shards, owner_id, 'vm0', settle=0)
+        assert _ids_on(shards, 0) == ids
+
+
+def test_failed_copy_unlocks_owner_and_removes_copies(sharded_app, create_user, create_vms, monkeypatch):
+    with sharded_app.app_context():
+        shards = sharding.current_shards()
+        owner = create_user()
+        ids = create_vms(owner.id, 2)
+
+        def fail(*args, **kwargs):
+            raise RuntimeError('target unavailable')
+        monkeypatch.setattr(shards, 'assign', fail)
+
+        with pytest.raises(RuntimeError):
+            sharding.move_owner(shards, owner.id, 'vm0', settle=0)
+        assert tuple(_assignment(shards, owner.id)) == ('vm1', None)
+        assert _ids_on(shards, 0) == []
+        assert _ids_on(shards, 1) == ids
@@ -0,0 +1,131 @@
+# ======================================================================
+# Programm: tests.test_singleflight
+# Beschreibung: Tests für das Zusammenfassen gleichzeitiger, identischer GET-Anfragen.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import threading
+import time
+
+import pytest
+from flask import Flask, make_response
+
+from singleflight import SingleFlight, coalesce
+
+
+# Kleine App mit einer blockierenden Route: die erste Anfrage wartet auf 'release'
+@pytest.fixture
+def flight_app():
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.config['TESTING'] = True
+    app.calls = 0
+    app.started = threading.Event()
+    app.release = threading.Event()
+
+    @app.route('/items', methods=['GET', 'POST'])
+    def items():
+        app.calls += 1
+        app.started.set()
+        app.release.wait(5)
+        response = make_response({"calls": app.calls})
+        response.set_cookie('leader', 'secret')
+        return response
+
+    app.flight = SingleFlight()
+    app.view_functions['items'] = coalesce(app.flight, 'items', app.view_functions['items'])
+    return app
+
+
+def run_threads(count, target):
+    results = [None] * count
+
+    def work(index):
+        results[index] = target()
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_gets_execute_once(flight_app):
+    threads, responses = run_threads(8, lambda: flight_app.test_client().get('/items?b=2&a=1'))
+    assert flight_app.started.wait(5)
+    time.sleep(0.2)
+    flight_app.release.set()
+    for thread in threads:
+        thread.join()
+    assert flight_app.calls == 1
+    assert {response.get_data() for response in responses} == {b'{"calls":1}\n'}
+    assert all(response.status_code == 200 for response in responses)
+    assert all('Set-Cookie' not in response.headers for response in responses)
+    assert flight_app.flight.stats()['items'] == {"executed": 1, "coalesced": 7, "grace_hits": 0,
+                                                 "timeouts": 0, "bypassed": 0}
+    assert flight_app.flight._calls == {}
+
+
+def test_post_and_pending_flashes_bypass(flight_app):
+    flight_app.release.set()
+    client = flight_app.test_client()
+    assert 'leader=secret' in client.post('/items').headers['Set-Cookie']
+    with client.session_transaction() as session:
+        session['_flashes'] = [('info', 'saved')]
+    assert 'leader=secret' in client.get('/items').headers['Set-Cookie']
+    assert flight_app.calls == 2
+    assert flight_app.flight.stats()['items']['bypassed'] == 2
+
+
+def test_leader_error_reaches_followers():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise RuntimeError('backend down')
+
+    def call():
+        try:
+            flight.do('items', 'key', fail)
+        except RuntimeError as e:
+            return e
+    threads, errors = run_threads(4, call)
+    assert started.wait(5)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert flight._calls == {}
+    assert flight.do('items', 'key', lambda: 'recovered') == 'recovered'
+
+
+def test_follower_runs_itself_after_timeout():
+    flight = SingleFlight(timeout=0.1)
+    started, release = threading.Event(), threading.Event()
+    threads, results = run_threads(1, lambda: flight.do('items', 'key', lambda: started.set() or release.wait(5)))
+    assert started.wait(5)
+    assert flight.do('items', 'key', lambda: 'own result') == 'own result'
+    release.set()
+    threads[0].join()
+    assert results == [True]
+    assert flight.stats()['items']['timeouts'] == 1
+
+
+def test_grace_window_reuses_result():
+    flight = SingleFlight(grace=0.2)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return len(calls)
+    assert flight.do('items', 'key', fn) == 1
+    assert flight.do('items', 'key', fn) == 1
+    time.sleep(0.25)
+    assert flight.do('items', 'key', fn) == 2
+    assert flight.stats()['items']['grace_hits'] == 1
+    assert flight.stats()['items']['executed'] == 2
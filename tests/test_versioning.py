@@ -0,0 +1,55 @@
+# ======================================================================
+# Programm: tests.test_versioning
+# Beschreibung: Tests für die Versionsspalten (optimistisches Sperren) und den Fragment-Cache.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import pytest
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+from models import User, VM
+
+
+def test_stale_vm_update_raises(app, create_user, create_vms):
+    with app.app_context():
+        owner = create_user()
+        vm_id, = create_vms(owner.id)
+        mine = db.session.get(VM, vm_id)
+        with Session(db.engine) as other:
+            other.get(VM, vm_id).name = 'changed elsewhere'
+            other.commit()
+        mine.name = 'changed here'
+        with pytest.raises(StaleDataError):
+            db.session.commit()
+        db.session.rollback()
+        assert db.session.get(VM, vm_id).name == 'changed elsewhere'
+        assert db.session.get(VM, vm_id).version == 2
+
+
+def test_stale_user_delete_raises(app, create_user):
+    with app.app_context():
+        user_id = create_user().id
+        mine = db.session.get(User, user_id)
+        with Session(db.engine) as other:
+            other.get(User, user_id).email = 'new@example.com'
+            other.commit()
+        db.session.delete(mine)
+        with pytest.raises(StaleDataError):
+            db.session.commit()
+
+
+def test_vm_row_cache_follows_owner_rename(app, create_user, create_vms, login):
+    with app.app_context():
+        owner = create_user('alice')
+        create_vms(owner.id)
+        owner_id = owner.id
+    client = login(app.test_client(), owner_id)
+    assert b'alice' in client.get('/view_vms').data
+    with app.app_context():
+        db.session.get(User, owner_id).username = 'bob'
+        db.session.commit()
+    page = client.get('/view_vms').data
+    assert b'bob' in page and b'alice' not in page
@@ -0,0 +1,140 @@
+# ======================================================================
+# Programm: tests.test_vm_import
+# Beschreibung: Tests für den Streaming-Import von VMs (Validierung, Formate, Checkpoints, Fehler).
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+# ======================================================================
+import io
+import json
+import os
+
+import pytest
+from sqlalchemy import func, select
+
+import vm_import
+from extensions import db
+from models import VM
+
+HEADER = 'name,description,cpu,ram,hdd,ipv4,mac\n'
+
+
+def csv_rows(*numbers):
+    return ''.join(f'vm{n},,1,1024,10,10.2.0.{n},00:00:00:00:02:{n:02x}\n' for n in numbers)
+
+
+def record(**overrides):
+    return {"name": 'vm', "cpu": '1', "ram": '1024', "hdd": '10', "ipv4": '10.0.0.1',
+            "mac": '00:00:00:00:00:01', "owner": 'alice', **overrides}
+
+
+def run_import(stream, fmt='csv', owner_id=1, **kwargs):
+    return vm_import.import_vms(db.session, VM.__table__, stream, fmt, {}, default_owner_id=owner_id, **kwargs)
+
+
+def vm_count():
+    return db.session.execute(select(func.count()).select_from(VM)).scalar()
+
+
+def test_validate_record_converts_values():
+    values = vm_import.validate_record(record(ipv4='10.0.0.2', mac='00-00-00-00-00-02'), {"alice": 7})
+    assert values == {"name": 'vm', "description": '', "cpu": 1, "ram": 1024, "hdd": 10,
+                      "ipv4_num": 0x0A000002, "mac_num": 2, "user_id": 7}
+
+
+@pytest.mark.parametrize('overrides, message', [
+    ({"name": ''}, 'name is required'),
+    ({"name": 'x' * 101}, 'longer than 100'),
+    ({"cpu": 'two'}, 'cpu must be an integer'),
+    ({"ram": '0'}, 'ram must be positive'),
+    ({"hdd": str(2 ** 31)}, 'hdd must not be greater than'),
+    ({"ipv4": '10.0.0.256'}, 'Invalid IPv4 address'),
+    ({"mac": '00:00:00:00:00'}, 'Invalid MAC address'),
+    ({"owner": 'bob'}, "Unknown owner 'bob'"),
+])
+def test_validate_record_rejects(overrides, message):
+    with pytest.raises(vm_import.RowError, match=message):
+        vm_import.validate_record(record(**overrides), {"alice": 7})
+
+
+def test_validate_record_requires_owner():
+    with pytest.raises(vm_import.RowError, match='owner is required'):
+        vm_import.validate_record(record(owner=''), {})
+    assert vm_import.validate_record(record(owner=''), {}, default_owner_id=3)['user_id'] == 3
+
+
+def test_detect_format():
+    assert vm_import.detect_format('VMS.CSV') == 'csv'
+    assert vm_import.detect_format('vms.ndjson') == 'ndjson'
+    assert vm_import.detect_format('vms.jsonl') == 'ndjson'
+    with pytest.raises(ValueError):
+        vm_import.detect_format('vms.xlsx')
+
+
+def test_csv_and_ndjson_give_the_same_records():
+    rows = list(vm_import.iter_records(io.StringIO(HEADER + csv_rows(1, 2)), 'csv'))
+    assert [line for line, _ in rows] == [2, 3]
+    ndjson = '\n'.join(json.dumps(values) for _, values in rows) + '\n\n{broken\n'
+    records = list(vm_import.iter_records(io.StringIO(ndjson), 'ndjson'))
+    assert [values for _, values in records[:2]] == [values for _, values in rows]
+    line, error = records[2]
+    assert line == 4 and isinstance(error, vm_import.RowError)
+
+
+def test_dry_run_writes_nothing(app, create_user):
+    with app.app_context():
+        owner_id = create_user().id
+        result = run_import(io.StringIO(HEADER + csv_rows(1, 2) + 'bad,,x,1,1,10.2.0.9,00:00:00:00:02:09\n'),
+                            owner_id=owner_id, dry_run=True)
+        assert (result.read, result.inserted, result.invalid) == (3, 2, 1)
+        assert result.errors == [(4, "cpu must be an integer, got 'x'")]
+        assert vm_count() == 0
+
+
+def test_duplicate_rows_are_retried_one_by_one(app, create_user):
+    with app.app_context():
+        owner_id = create_user().id
+        # Zeile 4 hat dieselbe IPv4 wie Zeile 2: der Batch schlägt fehl, nur diese Zeile geht verloren
+        data = HEADER + csv_rows(1, 2) + 'dup,,1,1,1,10.2.0.1,00:00:00:00:02:ff\n' + csv_rows(3)
+        result = run_import(io.StringIO(data), owner_id=owner_id, batch_size=10)
+        assert (result.inserted, result.failed) == (3, 1)
+        assert [line for line, _ in result.errors] == [4]
+        assert vm_count() == 3
+
+
+def test_checkpoint_resumes_after_last_batch(app, create_user, tmp_path):
+    source = tmp_path / 'vms.csv'
+    source.write_text(HEADER + csv_rows(1, 2, 3, 4, 5))
+    checkpoint_path = str(tmp_path / 'vms.ckpt')
+    with app.app_context():
+        owner_id = create_user().id
+
+        def stop_after_first_batch(result):
+            raise KeyboardInterrupt
+        with pytest.raises(KeyboardInterrupt), open(source, newline='') as stream:
+            run_import(stream, owner_id=owner_id, batch_size=2,
+                       checkpoint=vm_import.Checkpoint(checkpoint_path, source), on_batch=stop_after_first_batch)
+        assert vm_count() == 2
+
+        with open(source, newline='') as stream:
+            result = run_import(stream, owner_id=owner_id, batch_size=2,
+                                checkpoint=vm_import.Checkpoint(checkpoint_path, source))
+        assert (result.resumed_from, result.read, result.inserted, result.failed) == (2, 3, 3, 0)
+        assert vm_count() == 5
+
+
+def test_checkpoint_of_modified_file_is_refused(tmp_path):
+    source = tmp_path / 'vms.csv'
+    source.write_text(HEADER + csv_rows(1, 2))
+    checkpoint_path = str(tmp_path / 'vms.ckpt')
+    vm_import.Checkpoint(checkpoint_path, source).save(2)
+    assert vm_import.Checkpoint(checkpoint_path, source).load() == 2
+
+    source.write_text(HEADER + csv_rows(3, 4, 5))
+    with pytest.raises(ValueError, match='different or modified'):
+        vm_import.Checkpoint(checkpoint_path, source).load()
+    other = tmp_path / 'other.csv'
+    other.write_bytes(source.read_bytes())
+    os.utime(other, ns=(source.stat().st_atime_ns, source.stat().st_mtime_ns))
+    with pytest.raises(ValueError, match='different or modified'):
+        vm_import.Checkpoint(checkpoint_path, other).load()
@@ -0,0 +1,320 @@
+# ======================================================================
+# Programm: vm_import
+# Beschreibung: Streaming-Import von VM-Inventar aus CSV- oder NDJSON-Dateien.
+# Autor: Martin Jeremias Künzler (MKU)
+# Version: 1.0
+# Datum: 15. September 2024
+#
+# * Die Dateien werden zeilenweise gelesen, d.h. der Speicherverbrauch bleibt
+#   unabhängig von der Dateigrösse konstant (nur ein Batch liegt im Speicher).
+# * Eingefügt wird per executemany in Batches, nach jedem Batch wird committet
+#   und optional ein Checkpoint geschrieben, damit ein Import fortgesetzt werden kann.
+# ======================================================================
+import csv
+import json
+import os
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+
+import audit
+import inet
+
+INTEGER_FIELDS = ('cpu', 'ram', 'hdd')
+INTEGER_MAX = 2 ** 31 - 1  # INT-Spalten (MySQL: signed 32 Bit)
+FORMATS = ('csv', 'ndjson')
+MAX_ERRORS = 100
+
+
+# ======================================================================
+# Fehler für eine einzelne ungültige Zeile. Der Import bricht dabei nicht ab,
+# die Zeile wird übersprungen und im Ergebnis vermerkt.
+# ======================================================================
+class RowError(ValueError):
+    pass
+
+
+# ======================================================================
+# Ergebnis eines Imports.
+#
+# Attribute:
+# - read: Anzahl gelesener Datenzeilen (ohne übersprungene Zeilen vor dem Checkpoint).
+# - inserted: Anzahl eingefügter VMs (bei dry_run die Anzahl gültiger Zeilen).
+# - invalid: Anzahl Zeilen, die die Validierung nicht bestanden haben.
+# - failed: Anzahl gültiger Zeilen, die von der Datenbank abgelehnt wurden (z.B. doppelte IPv4/MAC).
+# - resumed_from: Position, ab der nach einem Checkpoint fortgesetzt wurde.
+# - errors: Die ersten MAX_ERRORS Fehler als (Zeilennummer, Meldung).
+# ======================================================================
+class ImportResult:
+    def __init__(self, dry_run=False, resumed_from=0):
+        self.dry_run = dry_run
+        self.resumed_from = resumed_from
+        self.read = 0
+        self.inserted = 0
+        self.invalid = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, str(message)))
+
+    def to_dict(self):
+        return {
+            "dry_run": self.dry_run,
+            "resumed_from": self.resumed_from,
+            "read": self.read,
+            "inserted": self.inserted,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "errors": [{"line": line, "error": message} for line, message in self.errors],
+        }
+
+
+# ======================================================================
+# Speichert die Position der zuletzt committeten Zeile in einer JSON-Datei.
+# Das Schreiben erfolgt atomar (temporäre Datei + os.replace), damit ein
+# Abbruch während des Schreibens keinen kaputten Checkpoint hinterlässt.
+#
+# Zusammen mit der Position werden Pfad, Grösse und Änderungszeit der importierten
+# Datei gespeichert. Passt die Datei nicht mehr dazu (andere oder geänderte Datei),
+# wird nicht fortgesetzt, sonst würden Zeilen übersprungen oder doppelt importiert.
+# ======================================================================
+class Checkpoint:
+    def __init__(self, path, source):
+        self.path = path
+        stat = os.stat(source)
+        self.source = {"path": os.path.realpath(source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as fh:
+                data = json.load(fh)
+        except FileNotFoundError:
+            return 0
+        if data.get('source') != self.source:
+            raise ValueError(f'Checkpoint {self.path} was written for a different or modified input file, '
+                             f'delete it to start over')
+        return int(data.get('position', 0))
+
+    def save(self, position):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            json.dump({"position": position, "source": self.source}, fh)
+        os.replace(tmp_path, self.path)
+
+
+# ======================================================================
+# Ermittelt das Format anhand der Dateiendung (.csv, .ndjson, .jsonl).
+# ======================================================================
+def detect_format(filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    raise ValueError(f'Unknown import format for {filename!r}, use csv or ndjson')
+
+
+# ======================================================================
+# Liest eine Textdatei Zeile für Zeile und liefert (Zeilennummer, Datensatz).
+# Ungültiges JSON wird als RowError-Datensatz weitergereicht, damit die
+# Fehlerbehandlung an einer Stelle (validate_record) passiert.
+# ======================================================================
+def iter_records(stream, fmt):
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = RowError(f'Invalid JSON: {e}')
+            yield line_number, record
+    else:
+        raise ValueError(f'Unknown import format {fmt!r}')
+
+
+# ======================================================================
+# Lädt alle Benutzernamen mit einer einzigen Abfrage in ein Dictionary
+# (username -> id), damit pro Zeile kein zusätzlicher Datenbankzugriff nötig ist.
+# ======================================================================
+def load_owner_map(session, user_model):
+    return dict(session.execute(select(user_model.username, user_model.id)).all())
+
+
+def _require(record, key):
+    value = record.get(key)
+    if value is None or str(value).strip() == '':
+        raise RowError(f'{key} is required')
+    return str(value).strip()
+
+
+# ======================================================================
+# Prüft einen Datensatz und gibt die Werte für das INSERT zurück.
+#
+# Prüfungen:
+# - name: Pflichtfeld, maximal 100 Zeichen.
+# - cpu, ram, hdd: Positive Ganzzahlen bis INTEGER_MAX.
+# - ipv4: Gültige IPv4-Adresse (wird als Zahl in ipv4_num gespeichert).
+# - mac: Gültige MAC-Adresse mit ':' oder '-' als Trennzeichen (wird als Zahl in mac_num gespeichert).
+# - owner: Benutzername, wird über die owners-Map aufgelöst. Fehlt die Spalte, wird default_owner_id verwendet.
+# ======================================================================
+def validate_record(record, owners, default_owner_id=None):
+    if isinstance(record, RowError):
+        raise record
+    if not isinstance(record, dict):
+        raise RowError('Record must be an object')
+
+    name = _require(record, 'name')
+    if len(name) > 100:
+        raise RowError('name is longer than 100 characters')
+
+    values = {"name": name, "description": str(record.get('description') or '')}
+    for key in INTEGER_FIELDS:
+        raw = _require(record, key)
+        try:
+            number = int(raw)
+        except ValueError:
+            raise RowError(f'{key} must be an integer, got {raw!r}')
+        if number <= 0:
+            raise RowError(f'{key} must be positive')
+        if number > INTEGER_MAX:
+            raise RowError(f'{key} must not be greater than {INTEGER_MAX}')
+        values[key] = number
+
+    try:
+        values['ipv4_num'] = inet.ipv4_to_int(_require(record, 'ipv4'))
+        values['mac_num'] = inet.mac_to_int(_require(record, 'mac'))
+    except ValueError as e:
+        raise RowError(str(e))
+
+    owner = str(record.get('owner') or '').strip()
+    if owner:
+        if owner not in owners:
+            raise RowError(f'Unknown owner {owner!r}')
+        values['user_id'] = owners[owner]
+    elif default_owner_id is not None:
+        values['user_id'] = default_owner_id
+    else:
+        raise RowError('owner is required')
+    return values
+
+
+# ======================================================================
+# Schreibt einen Batch mit einem executemany-INSERT und committet.
+# Lehnt die Datenbank den Batch ab (z.B. doppelte IPv4/MAC oder ein Wert ausserhalb
+# des Wertebereichs der Spalte), wird der Batch zurückgerollt und Zeile für Zeile
+# wiederholt, damit nur die fehlerhaften Zeilen verloren gehen.
+# Andere Fehler (z.B. Verbindungsabbruch) brechen den Import ab, der Checkpoint
+# zeigt dann auf den letzten committeten Batch.
+# ======================================================================
+def _with_ids(session, table, rows):
+    # Ein executemany-INSERT liefert die IDs nicht auf allen Datenbanken zurück (MySQL kennt kein
+    # RETURNING). Zeilen ohne vorgegebene ID werden deshalb über die eindeutige ipv4_num nachgeladen.
+    missing = [values['ipv4_num'] for values in rows if 'id' not in values]
+    ids = {}
+    for start in range(0, len(missing), 500):
+        chunk = missing[start:start + 500]
+        ids.update(session.execute(select(table.c.ipv4_num, table.c.id)
+                                   .where(table.c.ipv4_num.in_(chunk))).all())
+    return [values if 'id' in values else {**values, "id": ids[values['ipv4_num']]} for values in rows]
+
+
+# ======================================================================
+# Fügt Zeilen ein und committet. Ist das Audit-Log aktiv, werden die IDs vor dem COMMIT
+# ermittelt und die Zeilen danach als 'insert' protokolliert.
+# ======================================================================
+def _insert(session, table, rows):
+    session.execute(insert(table), rows)
+    if audit.enabled():
+        rows = _with_ids(session, table, rows)
+    session.commit()
+    audit.record_inserts(table.name, rows)
+
+
+def _flush(session, table, batch, result):
+    try:
+        _insert(session, table, [values for _, values in batch])
+        result.inserted += len(batch)
+        return
+    except (IntegrityError, DataError):
+        session.rollback()
+
+    for line, values in batch:
+        try:
+            _insert(session, table, [values])
+            result.inserted += 1
+        except (IntegrityError, DataError) as e:
+            session.rollback()
+            result.failed += 1
+            result.add_error(line, e.orig)
+
+
+def _flush_batch(session, table, batch, result, partition):
+    parts = partition(batch) if partition else [(session, batch)]
+    for part_session, part in parts:
+        _flush(part_session, table, part, result)
+
+
+# ======================================================================
+# Importiert VMs aus einem Text-Stream.
+#
+# Parameter:
+# - session: SQLAlchemy-Session (z.B. db.session).
+# - table: Zieltabelle (VM.__table__).
+# - stream: Geöffneter Text-Stream (Datei oder Upload).
+# - fmt: 'csv' oder 'ndjson'.
+# - owners: username -> id, siehe load_owner_map().
+# - batch_size: Anzahl Zeilen pro INSERT/COMMIT.
+# - dry_run: Nur validieren, nichts schreiben.
+# - checkpoint: Optionaler Checkpoint; bereits committete Zeilen werden übersprungen.
+# - default_owner_id: Besitzer für Zeilen ohne owner.
+# - on_batch: Optionaler Callback, der nach jedem Batch mit dem Zwischenergebnis aufgerufen wird.
+# - partition: Optionale Funktion, die einen Batch auf mehrere Sessions aufteilt und eine Liste
+#   von (Session, Teil-Batch) zurückgibt (z.B. ShardSet.partition). Ohne wird session verwendet.
+# ======================================================================
+def import_vms(session, table, stream, fmt, owners, batch_size=1000, dry_run=False,
+               checkpoint=None, default_owner_id=None, on_batch=None, partition=None):
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1')
+    start = checkpoint.load() if checkpoint else 0
+    result = ImportResult(dry_run=dry_run, resumed_from=start)
+    batch = []
+    position = 0
+
+    for position, (line, record) in enumerate(iter_records(stream, fmt), 1):
+        if position <= start:
+            continue
+        result.read += 1
+        try:
+            values = validate_record(record, owners, default_owner_id)
+        except RowError as e:
+            result.invalid += 1
+            result.add_error(line, e)
+            continue
+        if dry_run:
+            result.inserted += 1
+            continue
+
+        batch.append((line, values))
+        if len(batch) >= batch_size:
+            _flush_batch(session, table, batch, result, partition)
+            batch = []
+            if checkpoint:
+                checkpoint.save(position)
+            if on_batch:
+                on_batch(result)
+
+    if batch:
+        _flush_batch(session, table, batch, result, partition)
+    if checkpoint and not dry_run and position > start:
+        checkpoint.save(position)
+    if on_batch:
+        on_batch(result)
+    return result